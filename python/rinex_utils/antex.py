@@ -2,6 +2,7 @@ from types import SimpleNamespace
 from datetime import datetime, timezone, timedelta
 from time_utils.leap_seconds import utc_tai_offset
 from time_utils.gpst import GPS_TAI_OFFSET
+from .compression import open_compressed
 
 
 def parse_igs_antex(filepath):
@@ -16,7 +17,7 @@ def parse_igs_antex(filepath):
         dt = datetime(year, month, day, hour, minute, second, microsecond, tzinfo=timezone.utc)
         return dt - (utc_tai_offset(dt) - GPS_TAI_OFFSET)
     antennas = []
-    with open(filepath, 'r') as f:
+    with open_compressed(filepath) as f:
         lines = iter(f.readlines())
         line = next(lines)
         while line != None:
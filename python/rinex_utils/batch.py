@@ -0,0 +1,129 @@
+import os
+import shutil
+import asyncio
+import tempfile
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from .compression import open_compressed, COMPRESSION_EXTENSIONS
+
+DEFAULT_MAX_FILES_IN_FLIGHT = 16
+
+def _stage_file(filepath, stage_dir):
+    '''
+    Reads `filepath`, decompressing it, into a new file in
+    `stage_dir` with the same name (minus any compression
+    extension) and returns the filepath of the copy.
+    '''
+    root, extension = os.path.splitext(os.path.basename(filepath))
+    name = root if extension in COMPRESSION_EXTENSIONS else root + extension
+    fd, staged_filepath = tempfile.mkstemp(suffix='_' + name, dir=stage_dir)
+    with os.fdopen(fd, 'wb') as out, open_compressed(filepath, 'rb') as f:
+        shutil.copyfileobj(f, out, 1 << 20)
+    return staged_filepath
+
+def _parse_job(job):
+    '''Splits a job of `parse_files_async` into `(parse_function, filepath, kwargs)`.'''
+    if len(job) == 2:
+        return job[0], job[1], {}
+    return job
+
+async def parse_files_async(jobs, max_files_in_flight=DEFAULT_MAX_FILES_IN_FLIGHT, executor=None, stage=False,
+                            return_exceptions=False):
+    '''
+    ------------------------------------------------------------
+    Asynchronous generator that parses many files concurrently and
+    yields the results in completion order.  Parsing runs in
+    `executor`, fed by `max_files_in_flight` workers that take the
+    jobs one at a time, so that while some files are parsed the
+    next ones are already queued and I/O latency (e.g. on
+    networked storage) is hidden behind parsing.  Jobs are only
+    taken from `jobs` as workers become free.
+
+    Input
+    -----
+    `jobs` -- iterable of `(parse_function, filepath)` or
+        `(parse_function, filepath, kwargs)` tuples, e.g.
+        `(parse_RINEX3_obs_file, filepath, {'systems': 'GE'})`
+        or `(parse_sp3_file, filepath)`; each job calls
+        `parse_function(filepath, **kwargs)`
+    `max_files_in_flight` (default 16) -- maximum number of files
+        being read, parsed or waiting to be yielded at once; set
+        it above the number of executor workers so that reads run
+        ahead of parsing
+    `executor` (default None) -- `concurrent.futures` executor
+        that parses the files; None uses a `ProcessPoolExecutor`
+        that is shut down at the end.  With a process pool,
+        `parse_function` must be a module-level function.
+    `stage` (default False) -- if False the parser reads
+        `filepath` itself, decompressing it as it reads (see
+        `compression.open_compressed`); if True, each file is
+        first copied and decompressed to a local temporary file in
+        a thread and the copy is parsed, which only pays off for
+        parsers that cannot read compressed files
+    `return_exceptions` (default False) -- if True, an exception
+        raised for a job is yielded in place of its result;
+        otherwise it is raised and the remaining jobs are
+        cancelled
+
+    Output
+    ------
+    yields `(filepath, result)` for each job as it completes,
+    where `result` is the return value of `parse_function`
+
+    Example:
+        async for filepath, (header, observations) in parse_files_async(jobs):
+            ...
+    '''
+    jobs = (_parse_job(job) for job in jobs)
+    loop = asyncio.get_running_loop()
+    # a worker waits here while its result is not yet taken, so at most `max_files_in_flight` files are in flight
+    results = asyncio.Queue(max_files_in_flight)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    stage_dir = tempfile.mkdtemp(prefix='rinex_utils_') if stage else None
+
+    async def parse(parse_function, filepath, kwargs):
+        if not stage:
+            return await loop.run_in_executor(executor, partial(parse_function, filepath, **kwargs))
+        staged_filepath = await asyncio.to_thread(_stage_file, filepath, stage_dir)
+        try:
+            return await loop.run_in_executor(executor, partial(parse_function, staged_filepath, **kwargs))
+        finally:
+            os.remove(staged_filepath)
+
+    async def worker():
+        # puts `(filepath, result)` per job, then None when `jobs` is exhausted, or the exception that stopped it
+        try:
+            for parse_function, filepath, kwargs in jobs:
+                try:
+                    result = await parse(parse_function, filepath, kwargs)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+                await results.put((filepath, result))
+        except Exception as e:
+            await results.put(e)
+        else:
+            await results.put(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max_files_in_flight)]
+    try:
+        num_running = len(workers)
+        while num_running > 0:
+            item = await results.get()
+            if item is None:
+                num_running -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_executor:
+            await asyncio.to_thread(executor.shutdown, cancel_futures=True)
+        if stage:
+            shutil.rmtree(stage_dir, ignore_errors=True)
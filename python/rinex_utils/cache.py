@@ -0,0 +1,226 @@
+import os
+import pickle
+import hashlib
+import shutil
+import tempfile
+import numpy
+from .rinex2 import parse_RINEX2_obs_file
+from .rinex3 import parse_RINEX3_obs_file
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rinex_utils')
+DEFAULT_MAX_CACHE_SIZE = 10 * 2**30  # bytes
+# bump when the stored layout changes so that old entries are not reused
+CACHE_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+class _ArrayRef:
+    '''Placeholder for an array stored at `offset` of an entry's `data.bin`.'''
+    def __init__(self, offset, dtype, shape):
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+
+def _split_arrays(obj, arrays, offset=0):
+    '''
+    Replaces the ndarrays in nested dicts/lists `obj` by
+    `_ArrayRef`s, appending the arrays to `arrays`.  Returns the
+    skeleton and the end offset.
+    '''
+    if isinstance(obj, numpy.ndarray) and obj.dtype.kind in 'biufcmMSU':
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        arrays.append((offset, numpy.ascontiguousarray(obj)))
+        return _ArrayRef(offset, obj.dtype.str, obj.shape), offset + obj.nbytes
+    if isinstance(obj, dict):
+        skeleton = {}
+        for key, value in obj.items():
+            skeleton[key], offset = _split_arrays(value, arrays, offset)
+        return skeleton, offset
+    if isinstance(obj, list):
+        skeleton = []
+        for value in obj:
+            value, offset = _split_arrays(value, arrays, offset)
+            skeleton.append(value)
+        return skeleton, offset
+    return obj, offset
+
+def _join_arrays(skeleton, data):
+    '''Inverse of `_split_arrays`, with arrays as views into the uint8 memmap `data`.'''
+    if isinstance(skeleton, _ArrayRef):
+        dtype = numpy.dtype(skeleton.dtype)
+        num_bytes = dtype.itemsize * int(numpy.prod(skeleton.shape))
+        return data[skeleton.offset:skeleton.offset + num_bytes].view(dtype).reshape(skeleton.shape)
+    if isinstance(skeleton, dict):
+        return {key: _join_arrays(value, data) for key, value in skeleton.items()}
+    if isinstance(skeleton, list):
+        return [_join_arrays(value, data) for value in skeleton]
+    return skeleton
+
+def _file_hash(filepath, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _key(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=20).hexdigest()
+
+def _write_entry(entry_dir, header, observations):
+    '''
+    Writes an entry to a temporary directory under `tmp/`, out of
+    reach of `evict_cache`, and moves it into place.
+    '''
+    arrays = []
+    skeleton, size = _split_arrays(observations, arrays)
+    os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+    staging_dir = os.path.join(os.path.dirname(os.path.dirname(entry_dir)), 'tmp')
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=staging_dir)
+    with open(os.path.join(tmp_dir, 'data.bin'), 'wb') as f:
+        for offset, arr in arrays:
+            f.seek(offset)
+            f.write(arr.tobytes())
+        f.truncate(size)
+    with open(os.path.join(tmp_dir, 'manifest.pkl'), 'wb') as f:
+        pickle.dump({'header': header, 'observations': skeleton}, f)
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # another process stored the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _read_entry(entry_dir):
+    '''Loads an entry, memory-mapping its arrays.  Returns None if it is missing or incomplete.'''
+    try:
+        with open(os.path.join(entry_dir, 'manifest.pkl'), 'rb') as f:
+            manifest = pickle.load(f)
+        data_filepath = os.path.join(entry_dir, 'data.bin')
+        if os.path.getsize(data_filepath) > 0:
+            data = numpy.memmap(data_filepath, dtype=numpy.uint8, mode='r')
+        else:
+            data = numpy.zeros(0, dtype=numpy.uint8)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    # the entry mtime records the last use for LRU eviction
+    os.utime(entry_dir)
+    return manifest['header'], _join_arrays(manifest['observations'], data)
+
+def _entry_size(entry_dir):
+    return sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+
+def evict_cache(cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE, keep=()):
+    '''
+    ------------------------------------------------------------
+    Deletes the least recently used cache entries until the cache
+    takes at most `max_cache_size` bytes, then the path keys of
+    entries that are gone.  Entries still being written are not
+    touched.
+
+    Input
+    -----
+    `cache_dir` (default None) -- cache directory; None uses
+        `DEFAULT_CACHE_DIR`
+    `max_cache_size` -- size cap in bytes
+    `keep` -- entry keys that must not be evicted
+    '''
+    entries_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'entries')
+    if not os.path.isdir(entries_dir):
+        return
+    entries = []
+    for name in os.listdir(entries_dir):
+        entry_dir = os.path.join(entries_dir, name)
+        try:
+            entries.append((os.path.getmtime(entry_dir), _entry_size(entry_dir), name, entry_dir))
+        except OSError:
+            continue
+    total = sum(size for _, size, _, _ in entries)
+    for _, size, name, entry_dir in sorted(entries):
+        if total <= max_cache_size:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+    paths_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'paths')
+    if not os.path.isdir(paths_dir):
+        return
+    for name in os.listdir(paths_dir):
+        path_file = os.path.join(paths_dir, name)
+        try:
+            with open(path_file, 'r') as f:
+                entry_key = f.read().strip()
+            if not os.path.isdir(os.path.join(entries_dir, entry_key)):
+                os.remove(path_file)
+        except OSError:
+            continue
+
+def clear_cache(cache_dir=None):
+    '''Deletes all entries of the cache in `cache_dir` (default `DEFAULT_CACHE_DIR`).'''
+    shutil.rmtree(cache_dir or DEFAULT_CACHE_DIR, ignore_errors=True)
+
+def parse_obs_file_cached(filepath, parse_function, cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE, **kwargs):
+    '''
+    ------------------------------------------------------------
+    Calls `parse_function(filepath, **kwargs)` through a
+    persistent on-disk cache.  Results are stored with all arrays
+    in one binary file, and later calls memory-map that file so
+    arrays are only paged in when used.
+
+    Entries are keyed by the content hash of the file together
+    with the parser and its arguments; a second key of path, size
+    and mtime avoids rehashing unchanged files.  After each store
+    the least recently used entries are evicted to keep the cache
+    below `max_cache_size`.
+
+    Input
+    -----
+    `filepath` -- filepath to RINEX observation file
+    `parse_function` -- parser returning `header, observations`,
+        e.g. `parse_RINEX3_obs_file`
+    `cache_dir` (default None) -- cache directory; None uses
+        `DEFAULT_CACHE_DIR`
+    `max_cache_size` (default 10 GiB) -- size cap in bytes
+    `**kwargs` -- passed to `parse_function`
+
+    Output
+    ------
+    `header, observations` as returned by `parse_function`
+
+    Note: arrays loaded from the cache are read-only.  `output='lazy'`
+    is not supported, since its tree would be pickled whole instead
+    of memory-mapped; use `output='tree'` or the plain parser.
+    '''
+    if kwargs.get('output') == 'lazy':
+        raise Exception('`output=\'lazy\'` cannot be cached; use `output=\'tree\'` or the uncached parser')
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    stat = os.stat(filepath)
+    parser_key = (CACHE_FORMAT_VERSION, parse_function.__module__, parse_function.__name__, sorted(kwargs.items()))
+    path_file = os.path.join(cache_dir, 'paths', _key(os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, parser_key))
+    entries_dir = os.path.join(cache_dir, 'entries')
+    if os.path.exists(path_file):
+        with open(path_file, 'r') as f:
+            result = _read_entry(os.path.join(entries_dir, f.read().strip()))
+        if result is not None:
+            return result
+    entry_key = _key(_file_hash(filepath), parser_key)
+    entry_dir = os.path.join(entries_dir, entry_key)
+    result = _read_entry(entry_dir)
+    if result is None:
+        header, observations = parse_function(filepath, **kwargs)
+        _write_entry(entry_dir, header, observations)
+        evict_cache(cache_dir, max_cache_size, keep=(entry_key,))
+        result = _read_entry(entry_dir)
+        if result is None:
+            return header, observations
+    os.makedirs(os.path.dirname(path_file), exist_ok=True)
+    with open(path_file, 'w') as f:
+        f.write(entry_key)
+    return result
+
+def parse_RINEX3_obs_file_cached(filepath, cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE, **kwargs):
+    '''Cached `parse_RINEX3_obs_file`, see `parse_obs_file_cached`.'''
+    return parse_obs_file_cached(filepath, parse_RINEX3_obs_file, cache_dir, max_cache_size, **kwargs)
+
+def parse_RINEX2_obs_file_cached(filepath, cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE, **kwargs):
+    '''Cached `parse_RINEX2_obs_file`, see `parse_obs_file_cached`.'''
+    return parse_obs_file_cached(filepath, parse_RINEX2_obs_file, cache_dir, max_cache_size, **kwargs)
@@ -0,0 +1,273 @@
+import os
+import json
+import logging
+import sqlite3
+from .compression import open_compressed
+from .header import read_RINEX_header
+from .rinex2 import parse_RINEX2_header, _scan_RINEX2_obs_epochs, RINEX2_SATS_PER_LINE
+from .crinex import _scan_CRINEX_epochs, _read_CRINEX_obs_file
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    kind TEXT,
+    format_version TEXT,
+    marker_name TEXT,
+    receiver_type TEXT,
+    antenna_type TEXT,
+    obs_types TEXT,
+    start_time REAL,
+    end_time REAL,
+    interval REAL
+);
+CREATE TABLE IF NOT EXISTS file_systems (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    system TEXT NOT NULL,
+    PRIMARY KEY (system, path)
+);
+CREATE INDEX IF NOT EXISTS files_marker_time ON files (marker_name, start_time, end_time);
+CREATE INDEX IF NOT EXISTS files_kind_time ON files (kind, start_time, end_time);
+'''
+# `kind` of catalog entries by RINEX file type letter
+RINEX_FILE_KINDS = {
+    'O': 'obs',
+    'N': 'nav',
+    'G': 'nav',
+    'H': 'nav',
+    'C': 'clk',
+}
+# RINEX 2 observation files name one system in the header (blank meaning
+# GPS); the systems of mixed files are read from the epoch records
+RINEX2_SYSTEM_LETTERS = ('G', 'R', 'E', 'S')
+
+def _empty_catalog_entry():
+    return dict(kind=None, format_version=None, marker_name=None, receiver_type=None, antenna_type=None,
+                obs_types=None, start_time=None, end_time=None, interval=None, systems=())
+
+def _scan_RINEX2_obs_systems(filepath):
+    '''
+    Returns the system letters of the satellites in the epoch
+    records of a (Compact) RINEX 2 observation file, for mixed
+    files whose header does not list them.  Only the epoch records
+    are walked; observations are not decoded.
+    '''
+    with open_compressed(filepath) as f:
+        first_line = f.readline()
+    if first_line[60:].strip() == 'CRINEX VERS   / TYPE':
+        crinex_version, _, data_lines = _read_CRINEX_obs_file(filepath)
+        _, epoch_sat_ids, _ = _scan_CRINEX_epochs(data_lines, crinex_version)
+        sat_ids = [sat_id for sat_ids in epoch_sat_ids for sat_id in sat_ids]
+    else:
+        with open_compressed(filepath) as f:
+            header_lines = []
+            for line in f:
+                header_lines.append(line)
+                if line.find('END OF HEADER') >= 0:
+                    break
+            data_lines = f.readlines()
+        observations = parse_RINEX2_header(header_lines).get('obs_types', ())
+        epoch_lines, epoch_num_sats, _, _ = _scan_RINEX2_obs_epochs(data_lines, observations)
+        sat_ids = []
+        for i, num_sats in zip(epoch_lines, epoch_num_sats):
+            num_id_lines = 1 + max(num_sats - 1, 0) // RINEX2_SATS_PER_LINE
+            sat_list = ''.join(data_lines[i + k][32:68] for k in range(num_id_lines))
+            sat_ids.extend(sat_list[3 * k:3 * k + 3] for k in range(num_sats))
+    # a blank system letter means GPS
+    return tuple(sorted({sat_id[:1].strip() or 'G' for sat_id in sat_ids}))
+
+def _read_catalog_entry(filepath):
+    '''
+    Reads the header metadata of the file at `filepath` into a
+    dictionary of `files` columns plus its `systems`.  `kind` is
+    None for files that are not RINEX or SP3.
+    '''
+    entry = _empty_catalog_entry()
+    with open_compressed(filepath) as f:
+        first_line = f.readline()
+    if first_line[60:].strip() in ('RINEX VERSION / TYPE', 'CRINEX VERS   / TYPE'):
+        header = read_RINEX_header(filepath, find_last_epoch=True)
+        entry['kind'] = RINEX_FILE_KINDS.get(header['file_type'], header['file_type'])
+        entry['format_version'] = header.get('format_version', header.get('version'))
+        for key in ('marker_name', 'receiver_type', 'antenna_type', 'interval'):
+            entry[key] = header.get(key)
+        if 'system_obs_types' in header and len(header['system_obs_types']) > 0:
+            entry['obs_types'] = json.dumps(header['system_obs_types'])
+            entry['systems'] = tuple(header['system_obs_types'].keys())
+        elif 'obs_types' in header:
+            entry['obs_types'] = json.dumps(header['obs_types'])
+            system_letter = header.get('type', '')[20:21].strip() or 'G'
+            if system_letter in RINEX2_SYSTEM_LETTERS:
+                entry['systems'] = (system_letter,)
+            else:
+                entry['systems'] = _scan_RINEX2_obs_systems(filepath)
+        entry['start_time'], entry['end_time'] = header.get('first_epoch'), header.get('last_epoch')
+    elif first_line[:1] == '#' and first_line[1:2] in ('a', 'b', 'c', 'd'):
+        from .sp3.sp3 import parse_sp3_header
+        with open_compressed(filepath) as f:
+            header = parse_sp3_header([f.readline(), f.readline()])
+        entry['kind'] = 'sp3'
+        entry['format_version'] = header['version'][1:]
+        entry['interval'] = header['epoch_interval']
+        entry['start_time'] = header['start_time']
+        entry['end_time'] = header['start_time'] + (header['number_of_epochs'] - 1) * header['epoch_interval']
+    return entry
+
+class ArchiveCatalog:
+    '''
+    ------------------------------------------------------------
+    SQLite index of the header metadata of a collection of RINEX
+    observation, navigation and clock files and SP3 files, so that
+    files can be selected by station, system and time span without
+    opening them.
+
+    Input
+    -----
+    `db_filepath` -- filepath of the SQLite database; created if
+        it does not exist (':memory:' keeps it in memory)
+
+    Note: times are GPST seconds; `start_time`/`end_time` of an
+    observation or clock file are its first and last epoch, and of
+    a navigation file its earliest and latest ephemeris epoch (see
+    `header.read_RINEX_header`).  They are NULL when unknown.
+    '''
+    def __init__(self, db_filepath):
+        self.db_filepath = db_filepath
+        self.connection = sqlite3.connect(db_filepath)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(CATALOG_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, root_dir, extensions=None):
+        '''
+        ------------------------------------------------------------
+        Walks `root_dir` and brings the catalog up to date.  Only
+        files whose size or mtime changed since they were last
+        cataloged are opened, and entries of files that are gone
+        are removed.
+
+        Input
+        -----
+        `root_dir` -- directory to walk
+        `extensions` (default None) -- if given, only filenames
+            ending in one of these (e.g. '.rnx', '.gz') are
+            considered
+
+        Output
+        ------
+        dictionary of format:
+            {'added': int, 'updated': int, 'removed': int, 'unchanged': int}
+        '''
+        root_dir = os.path.abspath(root_dir)
+        prefix = os.path.join(root_dir, '')
+        cursor = self.connection.execute(
+            'SELECT path, size, mtime_ns FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in cursor}
+        # the database may live inside the cataloged tree
+        db_filepath = os.path.abspath(self.db_filepath)
+        own_filepaths = {db_filepath + suffix for suffix in ('', '-journal', '-wal', '-shm')}
+        counts = dict(added=0, updated=0, removed=0, unchanged=0)
+        with self.connection:
+            for dirpath, _, filenames in os.walk(root_dir):
+                for filename in filenames:
+                    if extensions is not None and not filename.endswith(tuple(extensions)):
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    if filepath in own_filepaths:
+                        continue
+                    try:
+                        stat = os.stat(filepath)
+                    except OSError:
+                        continue
+                    previous = known.pop(filepath, None)
+                    if previous == (stat.st_size, stat.st_mtime_ns):
+                        counts['unchanged'] += 1
+                        continue
+                    try:
+                        entry = _read_catalog_entry(filepath)
+                    except Exception:
+                        # keep unreadable files so that they are not retried until they change
+                        logger.warning('Could not read `%s`; cataloged without metadata', filepath, exc_info=True)
+                        entry = _empty_catalog_entry()
+                    self._store(filepath, stat, entry)
+                    counts['added' if previous is None else 'updated'] += 1
+            for filepath in known:
+                self.connection.execute('DELETE FROM files WHERE path = ?', (filepath,))
+                counts['removed'] += 1
+        return counts
+
+    def _store(self, filepath, stat, entry):
+        columns = ('kind', 'format_version', 'marker_name', 'receiver_type', 'antenna_type',
+                   'obs_types', 'start_time', 'end_time', 'interval')
+        self.connection.execute('DELETE FROM files WHERE path = ?', (filepath,))
+        self.connection.execute(
+            'INSERT INTO files (path, size, mtime_ns, {0}) VALUES (?, ?, ?, {1})'.format(
+                ', '.join(columns), ', '.join('?' * len(columns))),
+            (filepath, stat.st_size, stat.st_mtime_ns) + tuple(entry.get(column) for column in columns))
+        self.connection.executemany(
+            'INSERT INTO file_systems (path, system) VALUES (?, ?)',
+            [(filepath, system_letter) for system_letter in entry.get('systems', ())])
+
+    def query(self, kind=None, marker_name=None, systems=None, start=None, end=None):
+        '''
+        ------------------------------------------------------------
+        Returns the cataloged files matching all given criteria,
+        ordered by start time.
+
+        Input
+        -----
+        `kind` (default None) -- 'obs', 'nav', 'clk' or 'sp3'
+        `marker_name` (default None) -- station marker name
+        `systems` (default None) -- system letters that must all
+            be present in the file, e.g. 'GE' or ['G', 'E']
+        `start`, `end` (default None) -- GPST seconds; selects
+            files whose time span overlaps `[start, end)`.  A
+            missing (NULL) `start_time` or `end_time` is taken as
+            unknown, so such files are not excluded by it.
+
+        Output
+        ------
+        list of dictionaries with the keys `path`, `size`,
+        `mtime_ns`, `kind`, `format_version`, `marker_name`,
+        `receiver_type`, `antenna_type`, `obs_types`,
+        `start_time`, `end_time`, `interval` and `systems`
+        '''
+        conditions, parameters = ['kind IS NOT NULL'], []
+        if kind is not None:
+            conditions.append('kind = ?')
+            parameters.append(kind)
+        if marker_name is not None:
+            conditions.append('marker_name = ?')
+            parameters.append(marker_name)
+        # a missing start or end time is unknown and does not exclude the file
+        if start is not None:
+            conditions.append('(end_time IS NULL OR end_time >= ?)')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('(start_time IS NULL OR start_time < ?)')
+            parameters.append(end)
+        for system_letter in (systems or ()):
+            conditions.append('path IN (SELECT path FROM file_systems WHERE system = ?)')
+            parameters.append(system_letter)
+        cursor = self.connection.execute(
+            'SELECT *, (SELECT group_concat(system, \'\') FROM file_systems WHERE file_systems.path = files.path) '
+            'FROM files WHERE {0} ORDER BY start_time, path'.format(' AND '.join(conditions)), parameters)
+        names = [description[0] for description in cursor.description[:-1]] + ['systems']
+        rows = []
+        for row in cursor:
+            row = dict(zip(names, row))
+            row['obs_types'] = json.loads(row['obs_types']) if row['obs_types'] is not None else None
+            row['systems'] = sorted(row['systems'] or '')
+            rows.append(row)
+        return rows
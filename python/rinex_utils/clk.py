@@ -1,7 +1,13 @@
-from rinex_utils.rinex3 import parse_RINEX3_header, parse_value
+from rinex_utils.rinex3 import parse_RINEX3_header, parse_value, _fixed_width_lines, _parse_fixed_width_ints, \
+    _parse_fixed_width_floats, _parse_fixed_width_exponent_floats, _calendar_to_datetime64, _datetime64_to_gps_seconds
+from rinex_utils.compression import open_compressed
 from types import SimpleNamespace
 from datetime import datetime
-from numpy import isnan
+import numpy
+from numpy import isnan, nan
+
+# up to six values follow a clock data record, the last four on a continuation line
+CLK_VALUE_TYPES = ('bias', 'bias_sigma', 'rate', 'rate_sigma', 'acceleration', 'acceleration_sigma')
 
 def parse_RINEX3_clk_file(filepath, designators='all'):
     '''
@@ -37,7 +43,7 @@ def parse_RINEX3_clk_file(filepath, designators='all'):
         
     Note: `time` in `observations` is in GPST seconds
     '''
-    with open(filepath, 'r') as f:
+    with open_compressed(filepath) as f:
         lines = list(f.readlines())
     if len(lines) == 0:
         raise Exception('Error when parsing RINEX 3 file.  The file appears to be empty.')
@@ -94,3 +100,72 @@ def parse_RINEX3_clk_data(lines, designators):
         pass
     return data
 
+def parse_RINEX3_clk_data_columnar(lines, designators='all'):
+    '''
+    ------------------------------------------------------------
+    Vectorized counterpart of `parse_RINEX3_clk_data` that decodes
+    all clock data records at once into columnar tables, one per
+    clock data type.
+
+    Input
+    -----
+    `lines` -- data lines of a RINEX clock file (after the header)
+    `designators` (default 'all') -- as in `parse_RINEX3_clk_file`
+
+    Output
+    ------
+    dictionary of format:
+        {
+            'time': ndarray,
+            'clocks': {
+                <data_type>: {
+                    'designators': ndarray,
+                    'index': ndarray,
+                    'value_types': [<value_type>, ...],
+                    'values': ndarray
+                }
+            }
+        }
+    where `time` holds the distinct record epochs in GPST
+    seconds, `data_type` is e.g. 'AS' or 'AR', row `i` of
+    `values` is the record of `designators[i]` at epoch
+    `time[index[i]]`, and its columns are named by the leading
+    entries of `CLK_VALUE_TYPES` (values a record does not
+    report are NaN)
+    '''
+    if not isinstance(lines, list):
+        lines = list(lines)
+    chars = _fixed_width_lines([line.rstrip('\r\n') for line in lines], 80)
+    # continuation lines start with the blank padding of their first value
+    records = numpy.flatnonzero(chars[:, 0] > 32)
+    record_chars = chars[records]
+    num_values = numpy.minimum(_parse_fixed_width_ints(record_chars[:, 34:37]), len(CLK_VALUE_TYPES))
+    has_continuation = (num_values > 2) & (records + 1 < len(chars))
+    values = numpy.full((len(records), len(CLK_VALUE_TYPES)), nan)
+    values[:, :2] = _parse_fixed_width_exponent_floats(record_chars[:, 40:80].reshape(-1, 2, 20))
+    continuation_chars = chars[records[has_continuation] + 1]
+    values[has_continuation, 2:] = _parse_fixed_width_exponent_floats(continuation_chars.reshape(-1, 4, 20))
+    values[numpy.arange(len(CLK_VALUE_TYPES)) >= num_values[:, None]] = nan
+    year, month, day, hour, minute = \
+        (_parse_fixed_width_ints(record_chars[:, i0:i1]) for i0, i1 in ((8, 12), (13, 15), (16, 18), (19, 21), (22, 24)))
+    seconds = _parse_fixed_width_floats(record_chars[:, 24:34], err_val=0.)
+    time = _calendar_to_datetime64(year, month, day, hour, minute, seconds)
+    data_types = record_chars[:, 0:2].copy().view('S2').ravel()
+    names = numpy.char.strip(record_chars[:, 3:7].copy().view('S4').ravel()).astype(str)
+    if designators != 'all':
+        selected = numpy.isin(names, list(designators))
+        data_types, names, time, num_values, values = \
+            data_types[selected], names[selected], time[selected], num_values[selected], values[selected]
+    epochs, index = numpy.unique(time, return_inverse=True)
+    index = index.ravel()
+    clocks = {}
+    for data_type in numpy.unique(data_types):
+        rows = numpy.flatnonzero(data_types == data_type)
+        num_columns = max(int(num_values[rows].max()), 1)
+        clocks[data_type.decode()] = {
+            'designators': names[rows],
+            'index': index[rows],
+            'value_types': list(CLK_VALUE_TYPES[:num_columns]),
+            'values': values[rows, :num_columns],
+        }
+    return {'time': _datetime64_to_gps_seconds(epochs), 'clocks': clocks}
@@ -0,0 +1,195 @@
+import io
+import os
+import gzip
+import bz2
+import numpy
+from numpy import uint8, int64
+
+# magic bytes of the supported compressed formats
+COMPRESSION_MAGIC_BYTES = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'lzw': b'\x1f\x9d',  # Unix `compress` (.Z)
+}
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.Z': 'lzw',
+}
+
+def detect_compression(filepath):
+    '''
+    ------------------------------------------------------------
+    Returns the compression of the file at `filepath` as one of
+    the keys of `COMPRESSION_MAGIC_BYTES`, or None for an
+    uncompressed file.  The magic bytes at the start of the file
+    decide; the extension is only used for files too short to
+    hold them.
+    '''
+    with open(filepath, 'rb') as f:
+        magic = f.read(3)
+    for compression, magic_bytes in COMPRESSION_MAGIC_BYTES.items():
+        if magic.startswith(magic_bytes):
+            return compression
+    if len(magic) < 3:
+        return COMPRESSION_EXTENSIONS.get(os.path.splitext(filepath)[1])
+    return None
+
+def _iter_lzw_chunks(f, chunk_size=1 << 16, read_size=1 << 16):
+    '''
+    Decodes the Unix `compress` (.Z) stream read from the binary
+    file object `f` and yields the output in chunks.  The input is
+    read incrementally, `read_size` bytes at a time.  Codes of one
+    width are unpacked together with NumPy; the dictionary is a
+    list of byte strings.
+
+    Like `compress`, codes are written in groups of 8, and a group
+    is cut short whenever the code width grows or the dictionary is
+    cleared, so the bit position is then rounded up to the next
+    group boundary.  As in `compress`, the width grows once the
+    dictionary outgrows the current width, and only the width of
+    `max_bits` may hold the full dictionary of `1 << max_bits`
+    entries; 9-bit streams thus continue with 10-bit codes when
+    their dictionary fills up.
+    '''
+    header = f.read(3)
+    if header[:2] != COMPRESSION_MAGIC_BYTES['lzw'] or len(header) < 3:
+        raise Exception('Not a Unix compress (.Z) stream')
+    max_bits = header[2] & 0x1f
+    block_mode = bool(header[2] & 0x80)
+    if max_bits < 9 or max_bits > 16:
+        raise Exception('Unsupported .Z code width: {0}'.format(max_bits))
+    max_entries = 1 << max_bits
+    # `data` holds the input not yet decoded, starting at byte `base` of the code stream
+    data, base, eof = b'', 0, False
+    literals = [bytes([i]) for i in range(256)]
+    # in block mode code 256 clears the dictionary, the entry itself is never used
+    table = literals + [b''] if block_mode else list(literals)
+    n_bits, max_code, origin, position = 9, (1 << 9) - 1, 0, 0
+    prev = None
+    out, out_size = [], 0
+    while True:
+        # number of codes left before the width grows, if no clear code comes first
+        num_codes = max_code + 1 - len(table) + (prev is None) if max_code < max_entries else chunk_size
+        # read before trimming, since padding after a group may not have been read yet
+        num_bytes = (position + num_codes * n_bits + 7) // 8 - base
+        while not eof and len(data) < num_bytes:
+            more = f.read(max(read_size, num_bytes - len(data)))
+            eof = len(more) == 0
+            data += more
+        data = data[position // 8 - base:]
+        base = position // 8
+        num_codes = min(num_codes, (8 * (base + len(data)) - position) // n_bits)
+        if num_codes <= 0:
+            break
+        buf = numpy.frombuffer(data + b'\x00\x00', dtype=uint8).astype(int64)
+        offsets = position - 8 * base + n_bits * numpy.arange(num_codes)
+        i = offsets >> 3
+        codes = ((buf[i] | (buf[i + 1] << 8) | (buf[i + 2] << 16)) >> (offsets & 7)) & ((1 << n_bits) - 1)
+        cleared = False
+        for code in codes.tolist():
+            position += n_bits
+            if code == 256 and block_mode:
+                # the next code adds a placeholder entry at 256
+                del table[256:]
+                cleared = True
+                break
+            if code < len(table):
+                entry = table[code]
+            elif code == len(table) and prev is not None:
+                entry = prev + prev[:1]
+            else:
+                raise Exception('Corrupt .Z stream: invalid code {0}'.format(code))
+            if prev is not None and len(table) < max_entries:
+                table.append(prev + entry[:1])
+            prev = entry
+            out.append(entry)
+            out_size += len(entry)
+            if out_size >= chunk_size:
+                yield b''.join(out)
+                out, out_size = [], 0
+        group_bits = 8 * n_bits
+        if cleared:
+            n_bits, max_code = 9, (1 << 9) - 1
+        elif len(table) > max_code:
+            n_bits += 1
+            max_code = max_entries if n_bits == max_bits else (1 << n_bits) - 1
+        else:
+            continue
+        position = origin + -(-(position - origin) // group_bits) * group_bits
+        origin = position
+    if out_size > 0:
+        yield b''.join(out)
+
+class _ChunkReader(io.RawIOBase):
+    '''
+    Read-only raw stream over an iterator of byte chunks.  Closing
+    it closes the iterator and the underlying `file`, if given.
+    '''
+    def __init__(self, chunks, file=None):
+        self._chunks = chunks
+        self._chunk = b''
+        self._file = file
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self._chunk) == 0:
+            self._chunk = next(self._chunks, None)
+            if self._chunk is None:
+                self._chunk = b''
+                return 0
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+            if self._file is not None:
+                self._file.close()
+        super().close()
+
+def decompress_lzw(data):
+    '''
+    ------------------------------------------------------------
+    Decompresses Unix `compress` (.Z) data and returns the
+    decompressed bytes.
+    '''
+    return b''.join(_iter_lzw_chunks(io.BytesIO(data)))
+
+def open_compressed(filepath, mode='r'):
+    '''
+    ------------------------------------------------------------
+    Opens `filepath` for reading like `open`, transparently
+    decompressing gzip (.gz), bzip2 (.bz2) and Unix compress (.Z)
+    files as they are read, see `detect_compression`.
+
+    Input
+    -----
+    `filepath` -- filepath to (possibly compressed) file
+    `mode` (default 'r') -- 'r' for text or 'rb' for bytes
+
+    Output
+    ------
+    file object; uncompressed files are returned by `open`
+    '''
+    if mode not in ('r', 'rb'):
+        raise Exception('`open_compressed` only supports modes \'r\' and \'rb\'')
+    compression = detect_compression(filepath)
+    if compression is None:
+        return open(filepath, mode)
+    if compression == 'gzip':
+        f = gzip.open(filepath, 'rb')
+    elif compression == 'bz2':
+        f = bz2.open(filepath, 'rb')
+    else:
+        # the file stays open while the returned reader decodes it
+        raw = open(filepath, 'rb')
+        f = io.BufferedReader(_ChunkReader(_iter_lzw_chunks(raw), raw))
+    if mode == 'r':
+        return io.TextIOWrapper(f)
+    return f
@@ -0,0 +1,326 @@
+import re
+import numpy
+from numpy import array, nan, zeros, concatenate, uint8, int64
+from .compression import open_compressed
+from .rinex2 import parse_RINEX2_header, transform_values_from_RINEX2_obs, _parse_RINEX2_epoch_records
+from .rinex3 import parse_RINEX3_header, select_RINEX3_obs_types, RINEX3_OBS_OUTPUTS, _ObsColumns, \
+    _RINEX3_obs_output, _fixed_width_lines, _combine_digits, _parse_RINEX3_epoch_records, _datetime64_to_gps_seconds
+
+# Compact RINEX (Hatanaka) 1.0 / 3.0
+#   epoch records: text difference to the previous epoch record, with the
+#       satellite list appended at column 32 (1.0) / 41 (3.0)
+#   clock offset line after each epoch record
+#   one line per satellite: integer observation differences (unit 0.001)
+#       separated by single spaces, followed by the LLI/SSI text difference
+CRINEX_FORMATS = {
+    '1.0': {'init_char': '&', 'flag_col': 28, 'num_sats_cols': (29, 32), 'sat_list_col': 32},
+    '3.0': {'init_char': '>', 'flag_col': 31, 'num_sats_cols': (32, 35), 'sat_list_col': 41},
+}
+
+_NON_BLANK = re.compile(r'[^ ]+')
+
+def _apply_text_diff(old, diff):
+    '''
+    Applies a CRINEX text difference to `old`: blanks keep the old
+    character, `&` stands for a blank and any other character
+    replaces the old one.
+    '''
+    if len(diff) > len(old):
+        old = old.ljust(len(diff))
+    parts, i = [], 0
+    for m in _NON_BLANK.finditer(diff):
+        parts.append(old[i:m.start()])
+        parts.append(m.group().replace('&', ' '))
+        i = m.end()
+    parts.append(old[i:])
+    return ''.join(parts)
+
+def _scan_CRINEX_epochs(lines, crinex_version):
+    '''
+    Walks the epoch records of CRINEX data lines.  Returns the
+    restored epoch records (without satellite list), the satellite
+    ids of each epoch, and the line number of the first satellite
+    line of each epoch.  Event records (flags 2-5) are skipped.
+    '''
+    fmt = CRINEX_FORMATS[crinex_version]
+    n0, n1 = fmt['num_sats_cols']
+    epoch_records, epoch_sat_ids, first_lines = [], [], []
+    epoch = ''
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        record = _apply_text_diff('' if line[:1] == fmt['init_char'] else epoch, line)
+        num_sats = int(record[n0:n1])
+        if record[fmt['flag_col']:fmt['flag_col'] + 1] in ('2', '3', '4', '5'):
+            i += 1 + num_sats
+            continue
+        if i + 2 + num_sats > len(lines):
+            break  # truncated epoch
+        epoch = record
+        sat_list = record[fmt['sat_list_col']:]
+        epoch_sat_ids.append([sat_list[3 * k:3 * k + 3] for k in range(num_sats)])
+        epoch_records.append(record[:fmt['sat_list_col']])
+        # the epoch record is followed by the receiver clock offset line
+        first_lines.append(i + 2)
+        i += 2 + num_sats
+    return epoch_records, epoch_sat_ids, first_lines
+
+def _parse_signed_ints(buf, starts, stops):
+    '''
+    Parses the optionally signed integers `buf[starts[i]:stops[i]]`
+    (uint8 `buf`) to int64.
+    '''
+    is_negative = buf[numpy.minimum(starts, len(buf) - 1)] == ord('-')
+    is_negative &= starts < stops
+    starts = starts + is_negative
+    width = max(int((stops - starts).max(initial=0)), 1)
+    positions = stops[:, None] - width + numpy.arange(width)
+    digits = buf[numpy.maximum(positions, 0)] - uint8(48)
+    digits *= (positions >= starts[:, None]) & (digits < 10)
+    values = _combine_digits(digits)
+    values[is_negative] *= -1
+    return values
+
+def _tokenize_CRINEX_obs_lines(lines, num_obs):
+    '''
+    Splits CRINEX satellite lines into their first `num_obs`
+    space-separated fields.  Returns `(kind, order, value)` arrays
+    of shape `(len(lines), num_obs)`, where `kind` is 0 for a blank
+    field, 1 for an arc initialization `<order>&<value>` and 2 for
+    a difference `<value>`.
+    '''
+    kind = zeros((len(lines), num_obs), dtype=uint8)
+    order = zeros((len(lines), num_obs), dtype=uint8)
+    value = zeros((len(lines), num_obs), dtype=int64)
+    if len(lines) == 0 or num_obs == 0:
+        return kind, order, value
+    text = b'\n'.join(lines) if isinstance(lines[0], bytes) else '\n'.join(lines).encode()
+    buf = numpy.frombuffer(text + b'\n', dtype=uint8)
+    is_newline = buf == ord('\n')
+    stops = numpy.flatnonzero(is_newline | (buf == ord(' ')))
+    starts = concatenate(([0], stops[:-1] + 1))
+    ends_line = is_newline[stops]
+    line = numpy.cumsum(ends_line) - ends_line
+    line_first_token = concatenate(([0], numpy.flatnonzero(ends_line) + 1))
+    position = numpy.arange(len(stops)) - line_first_token[line]
+    # fields past `num_obs` hold the LLI/SSI flags
+    is_field = position < num_obs
+    starts, stops, line, position = starts[is_field], stops[is_field], line[is_field], position[is_field]
+    length = stops - starts
+    is_init = length >= 2
+    is_init[is_init] = buf[starts[is_init] + 1] == ord('&')
+    kind[line, position] = numpy.where(length == 0, 0, numpy.where(is_init, 1, 2))
+    order[line, position] = numpy.where(is_init, buf[starts] - uint8(48), 0)
+    value[line, position] = _parse_signed_ints(buf, starts + 2 * is_init, stops)
+    return kind, order, value
+
+def _integrate_CRINEX_differences(sat_keys, kind, order, value):
+    '''
+    Undoes the arc-wise differencing of CRINEX observations.
+    `sat_keys` identifies the satellite of each line (lines are in
+    epoch order) and `kind`, `order`, `value` are the output of
+    `_tokenize_CRINEX_obs_lines`.  Returns the observations as
+    floats, NaN where blank or not decodable.
+
+    Within an arc of order `m`, the `k`-th value is sent as its
+    `min(k, m)`-th order difference, so the arc is restored by
+    `m` segmented cumulative sums, one difference order at a time.
+    '''
+    values = numpy.full(kind.shape, nan)
+    line_order = numpy.argsort(sat_keys, kind='stable')
+    for j in range(kind.shape[1]):
+        rows = line_order[kind[line_order, j] > 0]
+        is_init = kind[rows, j] == 1
+        arc = numpy.cumsum(is_init) - 1
+        # drop differences that do not follow an initialization of the same satellite
+        valid = arc >= 0
+        valid[valid] = sat_keys[rows[valid]] == sat_keys[rows[numpy.flatnonzero(is_init)[arc[valid]]]]
+        rows, is_init = rows[valid], is_init[valid]
+        if len(rows) == 0:
+            continue
+        arc = numpy.cumsum(is_init) - 1
+        arc_starts = numpy.flatnonzero(is_init)
+        k = numpy.arange(len(rows)) - arc_starts[arc]
+        m = order[rows[arc_starts], j].astype(int64)[arc]
+        diffs = value[rows, j]
+        current = diffs
+        for i in range(int(m.max()) - 1, -1, -1):
+            x = numpy.where(k > i, current, numpy.where(k == i, diffs, 0))
+            total = numpy.cumsum(x)
+            # sums are exact modulo 2**64, so wrap-around cancels out here
+            total -= (total[arc_starts] - x[arc_starts])[arc]
+            current = numpy.where(m > i, total, diffs)
+        values[rows, j] = current / 1000.
+    return values
+
+def _sat_line_arrays(lines, epoch_sat_ids, first_lines):
+    '''
+    Returns the satellite lines, `S3` satellite ids and epoch
+    indices of all satellites listed in the epoch records.
+    '''
+    counts = array([len(sat_ids) for sat_ids in epoch_sat_ids], dtype=int64)
+    epoch_index = numpy.repeat(numpy.arange(len(counts)), counts)
+    line_numbers = numpy.repeat(array(first_lines, dtype=int64) - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+    sat_ids = array([sat_id for sat_ids in epoch_sat_ids for sat_id in sat_ids], dtype='S3')
+    # some writers use a space instead of zero in sat ids, e.g. 'G 1'
+    sat_ids = numpy.char.replace(sat_ids, b' ', b'0')
+    sat_lines = [lines[i] for i in line_numbers]
+    return sat_lines, sat_ids, epoch_index
+
+def decode_CRINEX3_obs_data(lines, system_obs_types, selected_obs_types=None):
+    '''
+    ------------------------------------------------------------
+    Decodes the data lines of a CRINEX 3.0 file.  Differences are
+    restored straight into the columnar buffers used by the
+    RINEX 3 decoders, without reconstructing RINEX text.
+
+    Input
+    -----
+    `lines` -- data lines (str or bytes, without line endings)
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `selected_obs_types` (default None) -- subset of
+        `system_obs_types` to restore, see
+        `rinex3.select_RINEX3_obs_types`
+
+    Output
+    ------
+    `columns` -- dictionary of format:
+        {<system_letter>: _ObsColumns}
+    `time` -- ndarray (datetime64[us]) of epoch times
+    '''
+    if isinstance(lines[0] if len(lines) > 0 else '', bytes):
+        lines = [line.decode() for line in lines]
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    epoch_records, epoch_sat_ids, first_lines = _scan_CRINEX_epochs(lines, '3.0')
+    time, _, _ = _parse_RINEX3_epoch_records(_fixed_width_lines(epoch_records, 35))
+    sat_lines, sat_ids, epoch_index = _sat_line_arrays(lines, epoch_sat_ids, first_lines)
+    systems = sat_ids.view(uint8).reshape(-1, 3)[:, 0] if len(sat_ids) > 0 else zeros(0, dtype=uint8)
+    columns = {}
+    for system_letter, obs_types in selected_obs_types.items():
+        rows = numpy.flatnonzero(systems == ord(system_letter))
+        positions = [system_obs_types[system_letter].index(obs_id) for obs_id in obs_types]
+        kind, order, value = _tokenize_CRINEX_obs_lines([sat_lines[i] for i in rows], len(system_obs_types[system_letter]))
+        _, sat_keys = numpy.unique(sat_ids[rows], return_inverse=True)
+        values = _integrate_CRINEX_differences(sat_keys.ravel(), kind[:, positions], order[:, positions], value[:, positions])
+        columns[system_letter] = _ObsColumns(len(obs_types), max(len(rows), 1))
+        block = columns[system_letter].extend(len(rows))
+        block[0][:] = sat_ids[rows]
+        block[1][:] = epoch_index[rows]
+        block[2][:] = values
+    return columns, time
+
+def decode_CRINEX1_obs_data(lines, observations, century=2000):
+    '''
+    ------------------------------------------------------------
+    Decodes the data lines of a CRINEX 1.0 (RINEX 2) file into
+    the format of `rinex2.parse_RINEX2_obs_data`.
+
+    Input
+    -----
+    `lines` -- data lines (str or bytes, without line endings)
+    `observations` -- list of the observations reported at
+        each epoch
+
+    Output
+    ------
+    `data` -- dictionary of format:
+        {<sat_id>: {'index': ndarray, <obs_id>: ndarray}}
+    `time` -- ndarray (datetime64[us]) of epoch times
+
+    Note: blank observations are NaN, so every array of a
+    satellite has the length of its `index`
+    '''
+    sat_ids, epoch_index, values, time = _decode_CRINEX1_obs_arrays(lines, observations, century)
+    unique_ids, sat_keys = numpy.unique(sat_ids, return_inverse=True)
+    sat_keys = sat_keys.ravel()
+    data = {}
+    for key, sat_id in enumerate(unique_ids):
+        rows = numpy.flatnonzero(sat_keys == key)
+        sat_data = {'index': epoch_index[rows]}
+        for j, obs_id in enumerate(observations):
+            sat_data[obs_id] = values[rows, j]
+        data[sat_id.decode()] = sat_data
+    return data, time
+
+def _decode_CRINEX1_obs_arrays(lines, observations, century=2000):
+    '''
+    Decodes the data lines of a CRINEX 1.0 file, see
+    `decode_CRINEX1_obs_data`.  Returns `(sat_ids, epoch_index,
+    values, time)` with one entry of `sat_ids` (`S3`) and
+    `epoch_index` and one row of `values` per satellite line.
+    '''
+    if isinstance(lines[0] if len(lines) > 0 else '', bytes):
+        lines = [line.decode() for line in lines]
+    epoch_records, epoch_sat_ids, first_lines = _scan_CRINEX_epochs(lines, '1.0')
+    time = _parse_RINEX2_epoch_records(_fixed_width_lines(epoch_records, 32), century)
+    sat_lines, sat_ids, epoch_index = _sat_line_arrays(lines, epoch_sat_ids, first_lines)
+    kind, order, value = _tokenize_CRINEX_obs_lines(sat_lines, len(observations))
+    _, sat_keys = numpy.unique(sat_ids, return_inverse=True)
+    values = _integrate_CRINEX_differences(sat_keys.ravel(), kind, order, value)
+    return sat_ids, epoch_index, values, time
+
+def _read_CRINEX_obs_file(filepath):
+    '''
+    Reads a CRINEX file and returns `(crinex_version,
+    header_lines, obs_lines)`, where `header_lines` are the
+    lines of the embedded RINEX header.
+    '''
+    with open_compressed(filepath) as f:
+        lines = f.read().splitlines()
+    if len(lines) == 0 or lines[0][60:].strip() != 'CRINEX VERS   / TYPE':
+        raise Exception('Error when parsing CRINEX file.  The file does not start with `CRINEX VERS   / TYPE`.')
+    crinex_version = lines[0][:20].strip()
+    if crinex_version not in CRINEX_FORMATS.keys():
+        raise Exception('Unsupported CRINEX version: {0}'.format(crinex_version))
+    for i, line in enumerate(lines):
+        if line.find('END OF HEADER') >= 0:
+            break
+    return crinex_version, lines[2:i + 1], lines[i + 1:]
+
+def parse_CRINEX_obs_file(filepath, output='tree', systems=None, obs_types=None, bands=None, observables=None):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a Compact RINEX (Hatanaka) 1.0 or 3.0
+    observation file, parses and returns header and observation
+    data without writing an intermediate RINEX file.
+
+    Input
+    -----
+    `filepath` -- filepath to CRINEX observation file, which may
+        be compressed, e.g. `.crx.gz` or `.d.Z`
+    `output` (default 'tree') -- for CRINEX 3.0, layout of
+        `observations` as in `rinex3.parse_RINEX3_obs_file`
+    `systems`, `obs_types`, `bands`, `observables` (default
+        None) -- for CRINEX 3.0, optional selection passed to
+        `rinex3.select_RINEX3_obs_types`
+
+    Output
+    ------
+    `header, observations` in the format of
+    `rinex3.parse_RINEX3_obs_file` (CRINEX 3.0) or
+    `rinex2.parse_RINEX2_obs_file` (CRINEX 1.0); `header` has
+    the additional entry `crinex_version`
+
+    Note: `time` in `observations` is in GPST seconds
+    '''
+    if output not in RINEX3_OBS_OUTPUTS:
+        raise Exception('`output` must be one of {0}'.format(', '.join(map(repr, RINEX3_OBS_OUTPUTS))))
+    crinex_version, header_lines, obs_lines = _read_CRINEX_obs_file(filepath)
+    if crinex_version == '1.0':
+        header = parse_RINEX2_header(header_lines)
+        header['crinex_version'] = crinex_version
+        if 'obs_types' not in header.keys():
+            raise Exception('RINEX header must contain `# / TYPES OF OBS.` and `header` dict from `parse_parse_RINEX2_header` must contain corresponding list `obs_types`')
+        obs_data, time = decode_CRINEX1_obs_data(obs_lines, header['obs_types'])
+        obs_data = transform_values_from_RINEX2_obs(obs_data)
+        observations = {'time': _datetime64_to_gps_seconds(time), 'satellites': obs_data}
+        return header, observations
+    header = parse_RINEX3_header(header_lines)
+    header['crinex_version'] = crinex_version
+    if len(header['system_obs_types']) == 0:
+        raise Exception('RINEX header must contain `SYS / # / OBS TYPES` and `header` dict from `parse_RINEX3_header` must contain corresponding dictionary `system_obs_types`')
+    selected_obs_types = select_RINEX3_obs_types(header['system_obs_types'], systems, obs_types, bands, observables)
+    columns, time = decode_CRINEX3_obs_data(obs_lines, header['system_obs_types'], selected_obs_types)
+    return header, _RINEX3_obs_output(columns, time, selected_obs_types, output, header.get('frequency_numbers'))
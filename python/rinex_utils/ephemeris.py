@@ -0,0 +1,287 @@
+import numpy
+from numpy import nan, sin, cos, sqrt
+from .rinex3 import _datetime64_to_gps_seconds
+
+SECONDS_PER_WEEK = 604800.
+SPEED_OF_LIGHT = 299792458.  # m/s
+# gravitational constant (m^3/s^2) and Earth rotation rate (rad/s) of each
+# system's interface specification
+KEPLER_SYSTEM_CONSTANTS = {
+    'G': {'GM': 3.986005e14, 'omega_e': 7.2921151467e-5},
+    'J': {'GM': 3.986005e14, 'omega_e': 7.2921151467e-5},
+    'E': {'GM': 3.986004418e14, 'omega_e': 7.2921151467e-5},
+    'C': {'GM': 3.986004418e14, 'omega_e': 7.292115e-5},
+    'I': {'GM': 3.986005e14, 'omega_e': 7.2921151467e-5},
+}
+# largest |t - t_oe| (s) for which an ephemeris is used
+MAX_EPHEMERIS_AGE = {
+    'G': 7200.,
+    'J': 7200.,
+    'E': 14400.,
+    'C': 21600.,
+    'I': 7200.,
+}
+# BDT is behind GPST by this many seconds
+BDT_TO_GPST = 14.
+# BDS GEO satellites use an inclined reference frame (BDS-SIS-ICD 5.2.4.12)
+BDS_GEO_PRNS = tuple(range(1, 6)) + tuple(range(59, 64))
+BDS_GEO_INCLINATION = numpy.radians(-5.)
+
+def _sat_numbers(sat_ids):
+    '''Returns satellite ids such as 'G01' as integers such as 7101 (system letter code * 100 + PRN).'''
+    chars = numpy.ascontiguousarray(sat_ids, dtype='U3').view(numpy.int32).reshape(-1, 3)
+    return chars[:, 0] * 100 + (chars[:, 1] - ord('0')) * 10 + (chars[:, 2] - ord('0'))
+
+def _select_ephemerides(ephemeris_sat_numbers, t_oe, max_age, sat_numbers, time):
+    '''
+    Returns for each query `(sat_numbers[k], time[k])` the index of
+    the ephemeris of that satellite whose `t_oe` is nearest to
+    `time[k]`, or -1 if there is none within the `max_age` (per
+    ephemeris) seconds.
+    '''
+    if len(t_oe) == 0:
+        return numpy.full(len(time), -1)
+    satellites = numpy.unique(ephemeris_sat_numbers)
+    ephemeris_satellites = numpy.searchsorted(satellites, ephemeris_sat_numbers)
+    query_satellites = numpy.minimum(numpy.searchsorted(satellites, sat_numbers), len(satellites) - 1)
+    # one sorted key for (satellite, t_oe); satellites are 1e10 s apart
+    order = numpy.lexsort((t_oe, ephemeris_satellites))
+    keys = ephemeris_satellites[order] * 1e10 + t_oe[order]
+    query_keys = query_satellites * 1e10 + time
+    after = numpy.searchsorted(keys, query_keys)
+    before = numpy.maximum(after - 1, 0)
+    after = numpy.minimum(after, len(keys) - 1)
+    before_distance, after_distance = numpy.abs(keys[before] - query_keys), numpy.abs(keys[after] - query_keys)
+    nearest = order[numpy.where(before_distance <= after_distance, before, after)]
+    is_valid = (satellites[query_satellites] == sat_numbers) \
+        & (numpy.minimum(before_distance, after_distance) <= max_age[nearest])
+    return numpy.where(is_valid, nearest, -1)
+
+def _sin_cos_small(x):
+    '''Returns `sin(x), cos(x)` from their Taylor series, exact to double precision for |x| <= 0.2.'''
+    x2 = x * x
+    sin_x = x * (1. + x2 * (-1. / 6 + x2 * (1. / 120 + x2 * (-1. / 5040 + x2 * (1. / 362880 - x2 / 39916800)))))
+    cos_x = 1. + x2 * (-1. / 2 + x2 * (1. / 24 + x2 * (-1. / 720 + x2 * (1. / 40320 - x2 / 3628800))))
+    return sin_x, cos_x
+
+def _sin_cos_tiny(x):
+    '''Returns `sin(x), cos(x)` from their Taylor series, exact to double precision for |x| <= 1e-3.'''
+    x2 = x * x
+    return x * (1. + x2 * (-1. / 6 + x2 / 120)), 1. + x2 * (-1. / 2 + x2 / 24)
+
+def _rotate(sin_a, cos_a, sin_x, cos_x):
+    '''Returns `sin(a + x), cos(a + x)` given the sines and cosines of `a` and `x`.'''
+    return sin_a * cos_x + cos_a * sin_x, cos_a * cos_x - sin_a * sin_x
+
+def _solve_kepler(M, e, iterations):
+    '''
+    Solves Kepler's equation `E - e sin(E) = M` for all elements at
+    once with a fixed number of Newton steps from `E = M + e
+    sin(M)`.  Returns `sin(E), cos(E)`; rather than evaluating them
+    after every step, they are rotated by the step, which leaves
+    `sin(M), cos(M)` as the only trigonometric functions evaluated.
+    For e <= 0.2 the starting error is below 0.02 and the steps
+    after the first below 1e-3.
+    '''
+    sin_E, cos_E = sin(M), cos(M)
+    step = e * sin_E
+    E = M + step
+    sin_E, cos_E = _rotate(sin_E, cos_E, *_sin_cos_small(step))
+    for k in range(iterations):
+        step = (M - E + e * sin_E) / (1. - e * cos_E)
+        E += step
+        sin_E, cos_E = _rotate(sin_E, cos_E, *(_sin_cos_small(step) if k == 0 else _sin_cos_tiny(step)))
+    return sin_E, cos_E
+
+# per-ephemeris terms of `_kepler_orbits`, see `_ephemeris_table`
+EPHEMERIS_TABLE_FIELDS = ('t_oe', 't_oc', 'A', 'A_e', 'n', 'e', 'sqrt_one_minus_e2', 'm_0', 'sin_omega', 'cos_omega',
+                          'c_us', 'c_uc', 'c_rs', 'c_rc', 'c_is', 'c_ic', 'sin_i_0', 'cos_i_0', 'i_dot', 'Omega_0',
+                          'Omega_dot', 'a0', 'a1', 'a2', 'relativity', 'geo_omega_e')
+
+def _ephemeris_table(ephemerides, system_letter):
+    '''
+    Computes the terms of the orbit and clock model that depend on
+    the ephemeris only, once per ephemeris rather than once per
+    query.  Returns an array of shape `(len(EPHEMERIS_TABLE_FIELDS),
+    len(ephemerides))`, so that gathering the ephemerides of many
+    queries is one indexing operation giving contiguous rows.
+    `t_oe` and `t_oc` are full GPST seconds.
+    '''
+    GM, omega_e = KEPLER_SYSTEM_CONSTANTS[system_letter]['GM'], KEPLER_SYSTEM_CONSTANTS[system_letter]['omega_e']
+    is_geo = (system_letter == 'C') & numpy.isin(_sat_numbers(ephemerides['sat_id']),
+                                                 _sat_numbers(['C{0:02d}'.format(prn) for prn in BDS_GEO_PRNS]))
+    # epochs are in the system's time scale, counted from 1980-01-06
+    t_oc = _datetime64_to_gps_seconds(ephemerides['epoch'])
+    # t_oe as a full time: `t_oc` moved to the `t_oe` seconds of week nearest to it
+    t_oe = t_oc + (ephemerides['t_oe'] - t_oc % SECONDS_PER_WEEK + SECONDS_PER_WEEK / 2) % SECONDS_PER_WEEK \
+        - SECONDS_PER_WEEK / 2
+    time_offset = BDT_TO_GPST if system_letter == 'C' else 0.
+    A = ephemerides['sqrt_a'] ** 2
+    e = ephemerides['e']
+    terms = {
+        't_oe': t_oe + time_offset,
+        't_oc': t_oc + time_offset,
+        'A': A,
+        'A_e': A * e,
+        'n': sqrt(GM / A ** 3) + ephemerides['delta_n'],
+        'sqrt_one_minus_e2': sqrt(1. - e * e),
+        'sin_omega': sin(ephemerides['omega']),
+        'cos_omega': cos(ephemerides['omega']),
+        'sin_i_0': sin(ephemerides['i_0']),
+        'cos_i_0': cos(ephemerides['i_0']),
+        # longitude of the ascending node at t_oe; GEO orbits are given
+        # in a frame that does not rotate with the Earth
+        'Omega_0': ephemerides['omega_0'] - omega_e * ephemerides['t_oe'],
+        'Omega_dot': ephemerides['omega_dot'] - numpy.where(is_geo, 0., omega_e),
+        'relativity': -2. * sqrt(GM) / SPEED_OF_LIGHT ** 2 * e * ephemerides['sqrt_a'],
+        # Earth rotation rate for GEO orbits, 0 for others
+        'geo_omega_e': numpy.where(is_geo, omega_e, 0.),
+    }
+    return numpy.stack([terms[name] if name in terms else ephemerides[name] for name in EPHEMERIS_TABLE_FIELDS])
+
+def _kepler_orbits(eph, t, kepler_iterations):
+    '''
+    Evaluates the Keplerian broadcast orbit and clock model
+    (IS-GPS-200 20.3.3.4.3) for the ephemeris terms `eph`
+    (dictionary of arrays, see `_ephemeris_table`) at GPST seconds
+    `t`.  Returns `(position, velocity, clock_bias, clock_drift)`.
+    '''
+    A, e, n = eph['A'], eph['e'], eph['n']
+    tk, t_clk = t - eph['t_oe'], t - eph['t_oc']
+    sin_E, cos_E = _solve_kepler(eph['m_0'] + n * tk, e, kepler_iterations)
+    one_minus_e_cos_E = 1. - e * cos_E
+    E_dot = n / one_minus_e_cos_E
+    # argument of latitude phi = nu + omega from the sine and cosine of the true anomaly nu
+    sin_nu = eph['sqrt_one_minus_e2'] * sin_E / one_minus_e_cos_E
+    cos_nu = (cos_E - e) / one_minus_e_cos_E
+    sin_phi = sin_nu * eph['cos_omega'] + cos_nu * eph['sin_omega']
+    cos_phi = cos_nu * eph['cos_omega'] - sin_nu * eph['sin_omega']
+    sin_2phi, cos_2phi = 2. * sin_phi * cos_phi, cos_phi * cos_phi - sin_phi * sin_phi
+    nu_dot = E_dot * eph['sqrt_one_minus_e2'] / one_minus_e_cos_E
+    # the corrections to the argument of latitude u and inclination i are small angles
+    sin_u, cos_u = _rotate(sin_phi, cos_phi, *_sin_cos_tiny(eph['c_us'] * sin_2phi + eph['c_uc'] * cos_2phi))
+    sin_i, cos_i = _rotate(eph['sin_i_0'], eph['cos_i_0'],
+                           *_sin_cos_tiny(eph['i_dot'] * tk + eph['c_is'] * sin_2phi + eph['c_ic'] * cos_2phi))
+    r = A * one_minus_e_cos_E + eph['c_rs'] * sin_2phi + eph['c_rc'] * cos_2phi
+    u_dot = nu_dot * (1. + 2. * (eph['c_us'] * cos_2phi - eph['c_uc'] * sin_2phi))
+    r_dot = eph['A_e'] * sin_E * E_dot + 2. * nu_dot * (eph['c_rs'] * cos_2phi - eph['c_rc'] * sin_2phi)
+    i_dot = eph['i_dot'] + 2. * nu_dot * (eph['c_is'] * cos_2phi - eph['c_ic'] * sin_2phi)
+    Omega_dot = eph['Omega_dot']
+    Omega = eph['Omega_0'] + Omega_dot * tk
+    sin_Omega, cos_Omega = sin(Omega), cos(Omega)
+    x, y = r * cos_u, r * sin_u
+    x_dot, y_dot = r_dot * cos_u - r * u_dot * sin_u, r_dot * sin_u + r * u_dot * cos_u
+    y_cos_i = y * cos_i
+    X = x * cos_Omega - y_cos_i * sin_Omega
+    Y = x * sin_Omega + y_cos_i * cos_Omega
+    Z = y * sin_i
+    # rate of y cos(i)
+    y_cos_i_dot = y_dot * cos_i - Z * i_dot
+    X_dot = x_dot * cos_Omega - y_cos_i_dot * sin_Omega - Y * Omega_dot
+    Y_dot = x_dot * sin_Omega + y_cos_i_dot * cos_Omega + X * Omega_dot
+    Z_dot = y_dot * sin_i + y_cos_i * i_dot
+    position = numpy.stack((X, Y, Z), axis=-1)
+    velocity = numpy.stack((X_dot, Y_dot, Z_dot), axis=-1)
+    is_geo = eph['geo_omega_e'] > 0
+    if is_geo.any():
+        position[is_geo], velocity[is_geo] = _rotate_BDS_GEO(position[is_geo], velocity[is_geo], tk[is_geo],
+                                                             eph['geo_omega_e'][is_geo])
+    clock_bias = eph['a0'] + (eph['a1'] + eph['a2'] * t_clk) * t_clk + eph['relativity'] * sin_E
+    clock_drift = eph['a1'] + 2. * eph['a2'] * t_clk + eph['relativity'] * cos_E * E_dot
+    return position, velocity, clock_bias, clock_drift
+
+def _rotate_BDS_GEO(position, velocity, tk, omega_e):
+    '''Rotates BDS GEO positions and velocities from the inclined GEO frame to ECEF.'''
+    c, s = cos(BDS_GEO_INCLINATION), sin(BDS_GEO_INCLINATION)
+    X, Y, Z = position[:, 0], c * position[:, 1] + s * position[:, 2], -s * position[:, 1] + c * position[:, 2]
+    X_dot, Y_dot, Z_dot = velocity[:, 0], c * velocity[:, 1] + s * velocity[:, 2], -s * velocity[:, 1] + c * velocity[:, 2]
+    c, s = cos(omega_e * tk), sin(omega_e * tk)
+    position = numpy.stack((c * X + s * Y, -s * X + c * Y, Z), axis=-1)
+    velocity = numpy.stack((c * X_dot + s * Y_dot + omega_e * position[:, 1],
+                            -s * X_dot + c * Y_dot - omega_e * position[:, 0], Z_dot), axis=-1)
+    return position, velocity
+
+def compute_broadcast_orbits(nav_data, sat_ids, time, max_age=None, kepler_iterations=3, chunk_size=8192):
+    '''
+    ------------------------------------------------------------
+    Evaluates broadcast ephemerides for many (satellite, time)
+    queries at once.  For each query the ephemeris of the
+    satellite with the nearest `t_oe` is selected, and the orbits
+    of all queries are computed together, with Kepler's equation
+    solved by a fixed number of Newton steps across all queries.
+
+    Input
+    -----
+    `nav_data` -- dictionary `{<system_letter>: ndarray}` of
+        ephemerides as returned by `nav.parse_nav_data`
+    `sat_ids` -- array of satellite ids (e.g. 'G01'), or one id
+        for all of `time`
+    `time` -- array of GPST seconds, or one time for all of
+        `sat_ids`
+    `max_age` (default None) -- largest |t - t_oe| in seconds
+        for which an ephemeris is used; None uses
+        `MAX_EPHEMERIS_AGE` of each system
+    `kepler_iterations` (default 3) -- Newton steps for Kepler's
+        equation, starting from `E = M + e sin(M)`; 3 steps
+        converge to double precision for e <= 0.2
+    `chunk_size` (default 8192) -- number of queries evaluated
+        together, to keep the temporary arrays in cache
+
+    Output
+    ------
+    dictionary of format:
+        {
+            'position': ndarray,  # (n, 3) ECEF position (m)
+            'velocity': ndarray,  # (n, 3) ECEF velocity (m/s)
+            'clock_bias': ndarray,  # (n,) satellite clock offset (s)
+            'clock_drift': ndarray,  # (n,) satellite clock drift (s/s)
+            'ephemeris_index': ndarray  # (n,) row of the ephemeris in nav_data[<system_letter>]
+        }
+    with NaN (and `ephemeris_index` -1) for queries without an
+    ephemeris.  Positions are those of the antenna phase center
+    in the frame of each system (WGS 84, GTRF, CGCS2000, ...).
+
+    Note: `clock_bias` includes the relativistic correction but
+    not the group delay (`tgd`, `bgd_*`), which depends on the
+    signal.  Only the Keplerian systems of
+    `KEPLER_SYSTEM_CONSTANTS` are evaluated; GLONASS and SBAS
+    queries are NaN.  Health flags are not checked, and for
+    Galileo I/NAV and F/NAV ephemerides are both candidates, so
+    filter `nav_data` beforehand to choose one of them.
+    '''
+    sat_ids, time = numpy.broadcast_arrays(numpy.asarray(sat_ids, dtype='U3'), numpy.asarray(time, dtype=float))
+    sat_numbers, time = _sat_numbers(sat_ids.ravel()), time.ravel()
+    tables, ephemeris_sat_numbers, ephemeris_rows, max_ages = [], [], [], []
+    for system_letter in KEPLER_SYSTEM_CONSTANTS.keys():
+        ephemerides = nav_data.get(system_letter)
+        if ephemerides is None or len(ephemerides) == 0:
+            continue
+        tables.append(_ephemeris_table(ephemerides, system_letter))
+        ephemeris_sat_numbers.append(_sat_numbers(ephemerides['sat_id']))
+        ephemeris_rows.append(numpy.arange(len(ephemerides)))
+        age = MAX_EPHEMERIS_AGE[system_letter] if max_age is None else max_age
+        max_ages.append(numpy.full(len(ephemerides), age))
+    # the last column is all NaN and stands in for missing ephemerides
+    table = numpy.concatenate(tables + [numpy.full((len(EPHEMERIS_TABLE_FIELDS), 1), nan)], axis=1)
+    ephemeris_rows = numpy.concatenate(ephemeris_rows + [[-1]]).astype(int)
+    index = _select_ephemerides(numpy.concatenate(ephemeris_sat_numbers + [[]]).astype(int),
+                                table[EPHEMERIS_TABLE_FIELDS.index('t_oe'), :-1],
+                                numpy.concatenate(max_ages + [[]]), sat_numbers, time)
+    num_queries = len(time)
+    position = numpy.empty((num_queries, 3))
+    velocity = numpy.empty((num_queries, 3))
+    clock_bias = numpy.empty(num_queries)
+    clock_drift = numpy.empty(num_queries)
+    for k0 in range(0, num_queries, chunk_size):
+        k1 = k0 + chunk_size
+        eph = dict(zip(EPHEMERIS_TABLE_FIELDS, table[:, index[k0:k1]]))
+        position[k0:k1], velocity[k0:k1], clock_bias[k0:k1], clock_drift[k0:k1] = _kepler_orbits(
+            eph, time[k0:k1], kepler_iterations)
+    ephemeris_index = ephemeris_rows[index]
+    return {
+        'position': position,
+        'velocity': velocity,
+        'clock_bias': clock_bias,
+        'clock_drift': clock_drift,
+        'ephemeris_index': ephemeris_index,
+    }
@@ -0,0 +1,190 @@
+import os
+import asyncio
+import numpy
+from .compression import COMPRESSION_MAGIC_BYTES, COMPRESSION_EXTENSIONS
+from .rinex3 import parse_RINEX3_header, select_RINEX3_obs_types, RINEX3_OBS_OUTPUTS, _ObsColumns, \
+    _GrowableArray, _decode_RINEX3_obs_block, _datetime64_to_gps_seconds, _RINEX3_obs_output, \
+    _find_RINEX_header_end
+
+def _complete_epoch_lines(data):
+    '''
+    Splits `data` (bytes starting at an epoch record) into lines
+    and returns `(lines, num_bytes)` for the leading whole epochs:
+    an epoch is whole once its epoch record and all the records
+    it announces end in a newline.
+    '''
+    lines = data[:data.rfind(b'\n') + 1].split(b'\n')[:-1]
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line[:1] != b'>':
+            i += 1
+            continue
+        num_records = int(line[32:35])
+        if i + 1 + num_records > len(lines):
+            break
+        i += 1 + num_records
+    lines = lines[:i]
+    return lines, sum(len(line) for line in lines) + len(lines)
+
+class RINEX3ObsFollower:
+    '''
+    ------------------------------------------------------------
+    Incremental reader of a RINEX 3 observation file that is
+    still being written.  Each `poll` reads only the bytes
+    appended since the previous one and decodes the whole epochs
+    among them into growing columnar buffers; a partially written
+    epoch at the end of the file is left for the next poll.
+
+    Input
+    -----
+    `filepath` -- filepath to an uncompressed RINEX 3
+        observation file; it need not exist yet
+    `systems`, `obs_types`, `bands`, `observables` (default
+        None) -- optional selection passed to
+        `select_RINEX3_obs_types`
+    `all_zero_to_nan` (default True) -- see
+        `parse_RINEX3_obs_file`
+
+    Note: if the file shrinks or is replaced (e.g. by the next
+    day's file under the same name), the buffers are cleared and
+    it is read from the start.  Header records of event epochs
+    (flags 2-5) are skipped and do not update `header`.
+    '''
+    def __init__(self, filepath, systems=None, obs_types=None, bands=None, observables=None, all_zero_to_nan=True):
+        if os.path.splitext(filepath)[1] in COMPRESSION_EXTENSIONS:
+            raise Exception('Only uncompressed files can be followed')
+        self.filepath = filepath
+        self.selection = dict(systems=systems, obs_types=obs_types, bands=bands, observables=observables)
+        self.all_zero_to_nan = all_zero_to_nan
+        self.reset()
+
+    def reset(self):
+        '''Forgets the header and all epochs read so far.'''
+        self.header = None
+        self.selected_obs_types = None
+        self.columns = None
+        self.position = 0  # byte offset just past the last whole epoch read
+        self._time = _GrowableArray((), 'datetime64[us]')
+        self._file_id = None
+
+    @property
+    def num_epochs(self):
+        return self._time.size
+
+    def poll(self):
+        '''
+        ------------------------------------------------------------
+        Reads and decodes the whole epochs appended to the file
+        since the last call.
+
+        Output
+        ------
+        `(first, stop)` -- range of the indices of the epochs that
+            were added, empty if there were none
+        '''
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return self.num_epochs, self.num_epochs
+        file_id = (stat.st_dev, stat.st_ino)
+        if stat.st_size < self.position or (self._file_id is not None and file_id != self._file_id):
+            self.reset()
+        self._file_id = file_id
+        if stat.st_size == self.position:
+            return self.num_epochs, self.num_epochs
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.position)
+            data = f.read(stat.st_size - self.position)
+        if self.header is None:
+            header_end = self._read_header(data)
+            if header_end is None:
+                return self.num_epochs, self.num_epochs
+            data = data[header_end:]
+        lines, num_bytes = _complete_epoch_lines(data)
+        first = self.num_epochs
+        if len(lines) > 0:
+            _, time, _ = _decode_RINEX3_obs_block(
+                lines, self.header['system_obs_types'], first, self.columns, self.selected_obs_types)
+            self._time.append(time)
+            self.position += num_bytes
+        return first, self.num_epochs
+
+    def _read_header(self, data):
+        '''Parses the header once `data` contains all of it.  Returns the byte offset past it, or None.'''
+        if data.startswith(tuple(COMPRESSION_MAGIC_BYTES.values())):
+            raise Exception('Only uncompressed files can be followed')
+        if data.find(b'END OF HEADER') < 0:
+            return None
+        header_end = _find_RINEX_header_end(data)
+        if data[header_end - 1:header_end] != b'\n':
+            return None
+        header = parse_RINEX3_header(data[:header_end].decode().splitlines())
+        if 'system_obs_types' not in header.keys():
+            raise Exception('RINEX header must contain `SYS / # / OBS TYPES` and `header` dict from `parse_RINEX3_header` must contain corresponding dictionary `system_obs_types`')
+        self.header = header
+        self.selected_obs_types = select_RINEX3_obs_types(header['system_obs_types'], **self.selection)
+        self.columns = {system_letter: _ObsColumns(len(obs_types))
+                        for system_letter, obs_types in self.selected_obs_types.items()}
+        self.position = header_end
+        return header_end
+
+    @property
+    def time(self):
+        '''GPST seconds of the epochs read so far.'''
+        return _datetime64_to_gps_seconds(self._time.array)
+
+    def observations(self, output='tree'):
+        '''
+        Returns the epochs read so far as the `observations` of
+        `parse_RINEX3_obs_file` in the given `output` layout.  The
+        arrays are not changed by later polls.
+        '''
+        if output not in RINEX3_OBS_OUTPUTS:
+            raise Exception('`output` must be one of {0}'.format(', '.join(map(repr, RINEX3_OBS_OUTPUTS))))
+        if self.header is None:
+            raise Exception('The header of `{0}` has not been read yet'.format(self.filepath))
+        return _RINEX3_obs_output(self.columns, self._time.array, self.selected_obs_types, output,
+                                  self.header.get('frequency_numbers'), self.all_zero_to_nan)
+
+    def epochs(self, first, stop):
+        '''
+        Returns the epochs with indices in `[first, stop)` (e.g. as
+        returned by `poll`) in the columnar layout of
+        `parse_RINEX3_obs_file(..., output='columns')`, with
+        `index` counted from `first`.
+        '''
+        systems = {}
+        for system_letter, system_columns in self.columns.items():
+            index = system_columns.index.array
+            # lines are appended in epoch order
+            i0, i1 = numpy.searchsorted(index, [first, stop])
+            if i1 == i0:
+                continue
+            systems[system_letter] = {
+                'sat_ids': system_columns.sat_ids.array[i0:i1].astype(str),
+                'index': index[i0:i1] - first,
+                'obs_types': list(self.selected_obs_types[system_letter]),
+                'values': system_columns.values.array[i0:i1],
+            }
+        return {'time': _datetime64_to_gps_seconds(self._time.array[first:stop]), 'systems': systems}
+
+    async def follow(self, poll_interval=1.):
+        '''
+        ------------------------------------------------------------
+        Asynchronous generator that polls the file every
+        `poll_interval` seconds and yields the new epochs, as
+        returned by `epochs`, whenever there are any.  Polls run in
+        a worker thread so that reading does not block the event
+        loop.
+
+        Example:
+            async for new in RINEX3ObsFollower(filepath).follow(1.):
+                print(new['time'])
+        '''
+        while True:
+            first, stop = await asyncio.to_thread(self.poll)
+            if stop > first:
+                yield self.epochs(first, stop)
+            else:
+                await asyncio.sleep(poll_interval)
@@ -0,0 +1,217 @@
+import os
+import re
+from itertools import islice
+from datetime import datetime
+from .compression import open_compressed, detect_compression
+from .rinex2 import parse_RINEX2_header
+from .rinex3 import parse_RINEX3_header
+from .crinex import _scan_CRINEX_epochs, _read_CRINEX_obs_file
+
+# epoch records of observation files, with the epoch flag restricted to
+# observations (0, 1, 6) so that event records are not taken for epochs
+RINEX2_EPOCH_PATTERN = re.compile(rb'^ [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d\.\d{7}  [016]', re.MULTILINE)
+RINEX3_EPOCH_PATTERN = re.compile(rb'^> \d{4} [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d\.\d{7}  [016]', re.MULTILINE)
+# first lines of navigation records (for RINEX 4, the line after the `>` record header)
+RINEX2_NAV_RECORD_PATTERN = re.compile(rb'^[ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d\.\d', re.MULTILINE)
+RINEX3_NAV_RECORD_PATTERN = re.compile(rb'^[A-Z][ \d]\d \d{4} [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d', re.MULTILINE)
+# clock data records
+CLK_RECORD_PATTERN = re.compile(rb'^(AR|AS|CR|DR|MS) .{4} \d{4} [ \d]\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d\.\d{6}', re.MULTILINE)
+
+def _time_fields_to_gps_seconds(year, month, day, hour, minute, seconds):
+    '''Converts calendar fields (taken as GPST) to GPST seconds.'''
+    second, microsecond = int(seconds), int(round(1e6 * (seconds % 1)))
+    return (datetime(year, month, day, hour, minute, second, microsecond) - datetime(1980, 1, 6)).total_seconds()
+
+def _parse_header_time(time_str):
+    '''Parses the fields of a `TIME OF FIRST OBS` / `TIME OF LAST OBS` value to GPST seconds, or None.'''
+    fields = time_str.split()
+    try:
+        return _time_fields_to_gps_seconds(*(int(x) for x in fields[:5]), float(fields[5]))
+    except (ValueError, IndexError):
+        return None
+
+def _record_pattern(file_type, version):
+    '''Returns the pattern of the records whose times give the time span of a RINEX file.'''
+    if file_type == 'O':
+        return RINEX3_EPOCH_PATTERN if version >= 3 else RINEX2_EPOCH_PATTERN
+    if file_type == 'C':
+        return CLK_RECORD_PATTERN
+    return RINEX3_NAV_RECORD_PATTERN if version >= 3 else RINEX2_NAV_RECORD_PATTERN
+
+def _parse_record_time(record, file_type, version):
+    '''Parses the time of a navigation or clock record matched by `_record_pattern` (bytes) to GPST seconds.'''
+    if file_type == 'C':
+        return _time_fields_to_gps_seconds(int(record[8:12]), int(record[13:15]), int(record[16:18]),
+                                           int(record[19:21]), int(record[22:24]), float(record[24:34]))
+    if version >= 3:
+        return _time_fields_to_gps_seconds(int(record[4:8]), int(record[9:11]), int(record[12:14]),
+                                           int(record[15:17]), int(record[18:20]), float(record[21:23]))
+    return _time_fields_to_gps_seconds(2000 + int(record[3:5]), int(record[6:8]), int(record[9:11]),
+                                       int(record[12:14]), int(record[15:17]), float(record[17:22]))
+
+def _parse_epoch_record(record, version):
+    '''Parses the time of a RINEX 2 or 3 epoch record (bytes) to GPST seconds.'''
+    if version >= 3:
+        return _time_fields_to_gps_seconds(int(record[2:6]), int(record[7:9]), int(record[10:12]),
+                                           int(record[13:15]), int(record[16:18]), float(record[18:29]))
+    # same century convention as `parse_RINEX2_obs_data`
+    return _time_fields_to_gps_seconds(2000 + int(record[1:3]), int(record[4:6]), int(record[7:9]),
+                                       int(record[10:12]), int(record[13:15]), float(record[15:26]))
+
+def _find_last_record(filepath, pattern, tail_size=1 << 12):
+    '''
+    Returns the last line of the file matching `pattern` (bytes),
+    or None.  Uncompressed files are searched backwards line by
+    line from the end, doubling the tail that is read until a
+    record is found; compressed files have to be read through.
+    '''
+    if detect_compression(filepath) is not None:
+        last = None
+        with open_compressed(filepath) as f:
+            for line in f:
+                if pattern.match(line.encode()):
+                    last = line.encode()
+        return last
+    file_size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        while True:
+            size = min(tail_size, file_size)
+            f.seek(file_size - size)
+            tail = f.read(size)
+            line_end = len(tail)
+            while line_end > 0:
+                line_start = tail.rfind(b'\n', 0, line_end - 1) + 1
+                # the first line of a partial tail may be cut
+                if line_start == 0 and size < file_size:
+                    break
+                if pattern.match(tail, line_start):
+                    return tail[line_start:line_end].rstrip()
+                line_end = line_start
+            if size == file_size:
+                return None
+            tail_size *= 2
+
+def _nav_time_span(filepath, version):
+    '''
+    Returns the GPST seconds of the earliest and latest record of a
+    navigation file, or `(None, None)`.  Records are often ordered
+    by satellite rather than by time, so all of them are read.
+    '''
+    pattern = _record_pattern('N', version)
+    with open_compressed(filepath, 'rb') as f:
+        times = [_parse_record_time(m.group(), 'N', version) for m in pattern.finditer(f.read())]
+    if len(times) == 0:
+        return None, None
+    return min(times), max(times)
+
+def _CRINEX_last_epoch(lines, crinex_version, version):
+    '''
+    Returns the GPST seconds of the last epoch of Compact RINEX
+    data `lines`, or None.  Epoch records are differenced, so they
+    are restored from the start.
+    '''
+    epoch_records, _, _ = _scan_CRINEX_epochs(lines, crinex_version)
+    if len(epoch_records) == 0:
+        return None
+    return _parse_epoch_record(epoch_records[-1].encode(), version)
+
+def read_RINEX_header(filepath, find_last_epoch=False, max_first_record_lines=64):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a RINEX 2 or 3 observation, navigation
+    or clock file (or a Compact RINEX file), reads and parses only
+    the header, stopping at `END OF HEADER`.
+
+    Input
+    -----
+    `filepath` -- filepath to RINEX file, which may be compressed
+        (see `compression.open_compressed`)
+    `find_last_epoch` (default False) -- for observation files
+        without `TIME OF LAST OBS` and for clock files, find the
+        last record near the end of the file (Compact RINEX files
+        are read through, as their epoch records are differenced); for navigation files, read all
+        records for the time span
+    `max_first_record_lines` (default 64) -- number of lines
+        after the header searched for the first epoch record of
+        observation files without `TIME OF FIRST OBS`
+
+    Output
+    ------
+    dictionary returned by `parse_RINEX3_header` (RINEX 3
+    observation and clock files) or `parse_RINEX2_header` (RINEX 2
+    observation and all navigation files, as in
+    `parse_rinex_nav_file`), with the additional entries:
+        'file_type' -- file type letter, e.g. 'O', 'N' or 'C'
+        'first_epoch', 'last_epoch' -- GPST seconds of the first
+            and last epoch, or None when unknown.  For observation
+            files without `TIME OF FIRST OBS`, the first epoch
+            record after the header is used; for clock files, the
+            first and last data records; for navigation files, the
+            earliest and latest ephemeris epoch (only with
+            `find_last_epoch`)
+
+    Note: times in the header are taken as GPST regardless of the
+    time system they are given in
+    '''
+    header_lines = []
+    with open_compressed(filepath) as f:
+        for line in f:
+            header_lines.append(line)
+            if line.find('END OF HEADER') >= 0:
+                break
+        # the first epoch record (after any event records) for when `TIME OF FIRST OBS` is missing
+        first_records = [line.encode() for line in islice(f, max_first_record_lines)]
+    if len(header_lines) == 0:
+        raise Exception('Error when parsing RINEX file.  The file appears to be empty.')
+    is_crinex = header_lines[0][60:].strip() == 'CRINEX VERS   / TYPE'
+    if is_crinex:
+        header_lines = header_lines[2:]
+    if len(header_lines) == 0 or header_lines[0][60:].strip() != 'RINEX VERSION / TYPE':
+        raise Exception('RINEX file must start with `RINEX VERSION / TYPE`')
+    version = float(header_lines[0][:9])
+    file_type = header_lines[0][20:21]
+    if file_type == 'C' or (file_type == 'O' and version >= 3):
+        header = parse_RINEX3_header(header_lines)
+    else:
+        header = parse_RINEX2_header(header_lines)
+    header['file_type'] = file_type
+    first_epoch = last_epoch = None
+    pattern = _record_pattern(file_type, version)
+    if file_type in ('N', 'G', 'H'):
+        if find_last_epoch:
+            first_epoch, last_epoch = _nav_time_span(filepath, version)
+    elif file_type == 'C':
+        record = next((line for line in first_records if pattern.match(line)), None)
+        if record is not None:
+            first_epoch = _parse_record_time(record, file_type, version)
+        if find_last_epoch:
+            record = _find_last_record(filepath, pattern)
+            if record is not None:
+                last_epoch = _parse_record_time(record, file_type, version)
+    elif file_type == 'O':
+        for line in header_lines:
+            label = line[60:].strip()
+            if label == 'TIME OF FIRST OBS':
+                first_epoch = _parse_header_time(line[:43])
+            elif label == 'TIME OF LAST OBS':
+                last_epoch = _parse_header_time(line[:43])
+        if first_epoch is None:
+            for line in first_records:
+                # the first epoch record of Compact RINEX 1.0 data is marked with `&` in place of the blank
+                if is_crinex and line[:1] == b'&':
+                    line = b' ' + line[1:]
+                if pattern.match(line):
+                    first_epoch = _parse_epoch_record(line, version)
+                    break
+        if last_epoch is None and find_last_epoch:
+            if is_crinex:
+                # Compact RINEX epoch records are differenced, so the tail cannot be read directly
+                crinex_version, _, data_lines = _read_CRINEX_obs_file(filepath)
+                last_epoch = _CRINEX_last_epoch(data_lines, crinex_version, version)
+            else:
+                record = _find_last_record(filepath, pattern)
+                if record is not None:
+                    last_epoch = _parse_epoch_record(record, version)
+    header['first_epoch'] = first_epoch
+    header['last_epoch'] = last_epoch
+    return header
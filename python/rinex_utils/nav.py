@@ -1,91 +1,232 @@
-import re
-from datetime import datetime
-from numpy import datetime64
+import numpy
+from numpy import uint8
 from .rinex2 import parse_RINEX2_header
+from .rinex3 import _fixed_width_lines, _parse_fixed_width_ints, _parse_fixed_width_floats, \
+    _parse_fixed_width_exponent_floats, _calendar_to_datetime64, _datetime64_to_gps_seconds
+from .compression import open_compressed
 
-def parse_nav_data(lines, century=2000):
+# RINEX 2.11 / 3.05 / 4.00 broadcast orbit records: the first line holds the
+# satellite, the epoch (t_oc) and three values, each following line four
+# values of 19 characters (D19.12); None marks spare fields
+KEPLER_ORBIT_FIELDS = (
+    'c_rs', 'delta_n', 'm_0',
+    'c_uc', 'e', 'c_us', 'sqrt_a',
+    't_oe', 'c_ic', 'omega_0', 'c_is',
+    'i_0', 'c_rc', 'omega', 'omega_dot',
+)
+NAV_RECORD_FIELDS = {
+    'G': ('a0', 'a1', 'a2', 'iode1') + KEPLER_ORBIT_FIELDS + (
+        'i_dot', 'l2_codes', 'week', 'l2p_data',
+        'accuracy', 'health', 'tgd', 'iodc',
+        'transmit_time', 'fit_interval'),
+    'J': ('a0', 'a1', 'a2', 'iode1') + KEPLER_ORBIT_FIELDS + (
+        'i_dot', 'l2_codes', 'week', 'l2p_data',
+        'accuracy', 'health', 'tgd', 'iodc',
+        'transmit_time', 'fit_interval'),
+    'E': ('a0', 'a1', 'a2', 'iodnav') + KEPLER_ORBIT_FIELDS + (
+        'i_dot', 'data_sources', 'week', None,
+        'sisa', 'health', 'bgd_e5a_e1', 'bgd_e5b_e1',
+        'transmit_time'),
+    'C': ('a0', 'a1', 'a2', 'aode') + KEPLER_ORBIT_FIELDS + (
+        'i_dot', None, 'week', None,
+        'accuracy', 'sat_h1', 'tgd1', 'tgd2',
+        'transmit_time', 'aodc'),
+    'I': ('a0', 'a1', 'a2', 'iodec') + KEPLER_ORBIT_FIELDS + (
+        'i_dot', None, 'week', None,
+        'accuracy', 'health', 'tgd', None,
+        'transmit_time'),
+    # positions (km), velocities (km/s) and accelerations (km/s^2) in PZ-90;
+    # the fifth line (status flags ...) only exists from RINEX 4
+    'R': ('minus_tau_n', 'gamma_n', 'message_frame_time',
+          'x', 'x_dot', 'x_acc', 'health',
+          'y', 'y_dot', 'y_acc', 'frequency_number',
+          'z', 'z_dot', 'z_acc', 'age',
+          'status_flags', 'delay_difference', 'urai', 'health_flags'),
+    'S': ('a_gf0', 'a_gf1', 'transmit_time',
+          'x', 'x_dot', 'x_acc', 'health',
+          'y', 'y_dot', 'y_acc', 'accuracy',
+          'z', 'z_dot', 'z_acc', 'iodn'),
+}
+# system of the records of RINEX 2 navigation files by file type letter
+RINEX2_NAV_SYSTEMS = {
+    'N': 'G',
+    'G': 'R',
+    'H': 'S',
+}
+# RINEX 4 navigation messages with the record layouts above
+NAV_LEGACY_MESSAGES = ('LNAV', 'INAV', 'FNAV', 'D1', 'D2', 'FDMA', 'SBAS')
+
+def nav_record_dtype(system_letter):
+    '''Returns the structured dtype of the ephemerides of a system, see `parse_nav_data`.'''
+    fields = [name for name in NAV_RECORD_FIELDS[system_letter] if name is not None]
+    return numpy.dtype([('sat_id', 'U3'), ('epoch', 'datetime64[us]')] + [(name, float) for name in fields])
+
+def _nav_record_lines(chars):
     '''
-    Given filepath to RINEX Navigation file, parses navigation into ephemeris.
-    Returns dictionary {prn: [{<eph>}]} of ephemeris dictionaris
-    
+    Drops the record headers of RINEX 4 navigation data (uint8
+    `chars`) along with all records other than ephemerides in the
+    layouts of `NAV_RECORD_FIELDS` (system time offsets, EOP,
+    ionosphere and CNAV-type messages).
+    '''
+    is_marker = chars[:, 0] == ord('>')
+    if not is_marker.any():
+        return chars
+    markers = numpy.flatnonzero(is_marker)
+    record_types = chars[markers, 2:5].copy().view('S3').ravel()
+    messages = numpy.char.strip(chars[markers, 10:14].copy().view('S4').ravel())
+    keep_record = (record_types == b'EPH') & numpy.isin(messages, [m.encode() for m in NAV_LEGACY_MESSAGES])
+    record = numpy.cumsum(is_marker) - 1
+    keep = ~is_marker & numpy.where(record >= 0, keep_record[record], True)
+    return chars[keep]
+
+def parse_nav_data(lines, century=2000, version=None, system_letter='G'):
+    '''
+    ------------------------------------------------------------
+    Given the data lines of a RINEX 2, 3 or 4 navigation file,
+    parses the broadcast ephemerides of all systems.  Records are
+    split on their fixed layout and all fields of a system are
+    decoded at once.
+
+    Input
+    -----
+    `lines` -- data lines (after the header)
+    `century` (default 2000) -- century of the two-digit years
+        of RINEX 2 records
+    `version` (default None) -- RINEX major version of the
+        file; None detects it from the record layout
+    `system_letter` (default 'G') -- for RINEX 2, the system of
+        the records (see `RINEX2_NAV_SYSTEMS`)
+
     Output
     ------
-    Dictionary of format:
-        {<prn>: <dict>}
-    Each dict contains the following parameters:
-        epoch - Python `datetime` object that is the epoch corresponding to the
-            ephemeris -- this is also the "Time of Clock" (`t_oc`)
+    dictionary of format:
+        {<system_letter>: ndarray}
+    where each structured array has one ephemeris per element, in
+    file order, with the fields `sat_id` (e.g. 'G01'), `epoch`
+    (datetime64[us] time of clock `t_oc`) and the fields of
+    `NAV_RECORD_FIELDS` for the system (see `nav_record_dtype`).
+    For GPS these are:
+        a0, a1, a2 - clock bias (s), drift (s/s) and drift rate (s/s^2)
+        iode1 - issue of data, ephemeris
+        c_rs, c_rc - orbit radius corrections (sine, cosine; m)
+        delta_n - mean motion difference (rad/s)
+        m_0 - mean anomaly at reference time (rad)
+        c_uc, c_us - argument of latitude corrections (rad)
         e - eccentricity
-        t_oe - time of ephemeris
+        sqrt_a - square root of the semi-major axis (m^0.5)
+        t_oe - time of ephemeris (seconds of week)
+        c_ic, c_is - inclination corrections (rad)
+        omega_0 - longitude of ascending node at weekly epoch (rad)
         i_0 - inclination at reference time (rad)
-        a - semi-major axis (m); usually given as SQRT
+        omega - argument of perigee (rad)
         omega_dot - rate of right ascension (rad/s)
-        omega_0 - right ascension at week (rad)
-        omega - argument of perigee
-        M_0 - mean anomaly of reference time (rad)
-        week - GPS week number
-        delta_n - mean motion difference (rad/s)
         i_dot - rate of inclination angle (rad/s)
-        c_us - argument of latitude (amplitude of cosine, radians)
-        c_rs - orbit radius (amplitude of sine, meters)
-        c_is - inclination (amplitude of sine, meters)
-        c_uc - argument of latitude (amplitude of cosine, radians)
-        c_rc - orbit radius (amplitude of cosine, meters)
-        c_ic - inclination (amplitude of cosine, meters)
+        week - GPS week number
+        tgd - group delay (s)
+    Galileo, BDS, QZSS and IRNSS share the Keplerian fields.
+    Fields a record does not report (e.g. the RINEX 4 GLONASS
+    status line in RINEX 3 files) are NaN.
+
+    Note: epochs are in the time system of each constellation
+    (GPST, GST, BDT, UTC for GLONASS), as given in the file
     '''
-    epoch_pattern = '(\s?\d+)\s(\s?\d+)\s(\s?\d+)\s(\s?\d+)\s(\s?\d+)\s(\s?\d+)\s(\s?\d+\.\d)'
-    number_pattern = '\n?\s*([+-]?\d+\.\d{12}D[+-]?\d{2})'
-    pattern = epoch_pattern + 29 * number_pattern
+    chars = _fixed_width_lines([line.rstrip('\r\n') for line in lines], 80)
+    is_letter = (chars[:, 0] >= ord('A')) & (chars[:, 0] <= ord('Z'))
+    if version is None:
+        version = 3 if (is_letter | (chars[:, 0] == ord('>'))).any() else 2
+    if version >= 4:
+        chars = _nav_record_lines(chars)
+    if version >= 3:
+        is_start = (chars[:, 0] >= ord('A')) & (chars[:, 0] <= ord('Z'))
+    else:
+        is_start = (chars[:, 1] >= ord('0')) & (chars[:, 1] <= ord('9'))
+    starts = numpy.flatnonzero(is_start)
+    record_lengths = numpy.diff(numpy.append(starts, len(chars)))
+    first_lines = chars[starts]
+    if version >= 3:
+        sat_ids = first_lines[:, 0:3].copy()
+        year, month, day, hour, minute, second = \
+            (_parse_fixed_width_ints(first_lines[:, i0:i1]) for i0, i1 in ((4, 8), (9, 11), (12, 14), (15, 17), (18, 20), (21, 23)))
+        seconds = second.astype(float)
+        column = 4  # of the first value of a broadcast orbit line
+    else:
+        sat_ids = numpy.empty((len(starts), 3), dtype=uint8)
+        sat_ids[:, 0] = ord(system_letter)
+        sat_ids[:, 1:] = first_lines[:, 0:2]
+        year, month, day, hour, minute = \
+            (_parse_fixed_width_ints(first_lines[:, i0:i1]) for i0, i1 in ((3, 5), (6, 8), (9, 11), (12, 14), (15, 17)))
+        year += century
+        seconds = _parse_fixed_width_floats(first_lines[:, 17:22], err_val=0.)
+        column = 3
+    # some writers use a space instead of zero in sat ids, e.g. 'G 1'
+    sat_ids[sat_ids == ord(' ')] = ord('0')
+    sat_ids = sat_ids.view('S3').ravel()
+    epochs = _calendar_to_datetime64(year, month, day, hour, minute, seconds)
+    systems = first_lines[:, 0] if version >= 3 else numpy.full(len(starts), ord(system_letter), dtype=uint8)
     data = {}
-    matches = re.findall(pattern, '\n'.join(lines))
-    for m in matches:
-        prn, yy, month, day, hour, minute = (int(i) for i in m[:6])
-        second, a0, a1, a2, \
-            iode1, c_rs, delta_n, m_0, \
-            c_uc, e, c_us, sqrt_a, \
-            t_oe, c_ic, omega_0, c_is, \
-            i_0, c_rc, omega, omega_dot, \
-            i_dot, l2_codes, week, l2p_data, \
-            accuracy, health, tgd, iodc, \
-            transmit_time, fit_interval = (float(s.replace('D', 'E')) for s in m[6:36])
-        year = century + yy
-        epoch = datetime64(datetime(year, month, day, hour, minute, int(second), int(1e6 * (second % 1))))
-        eph = dict(
-            epoch=epoch, a0=a0, a1=a1, a2=a2,
-            iode1=iode1, c_rs=c_rs, delta_n=delta_n, m_0=m_0,
-            c_uc=c_uc, e=e, c_us=c_us, sqrt_a=sqrt_a,
-            t_oe=t_oe, c_ic=c_ic, omega_0=omega_0, c_is=c_is,
-            i_0=i_0, c_rc=c_rc, omega=omega, omega_dot=omega_dot,  # TODO check if orbit solutions correct omega
-            i_dot=i_dot, l2_codes=l2_codes, week=week, l2p_data=l2p_data,
-            accuracy=accuracy, health=health, tgd=tgd, iodc=iodc,
-            transmit_time=transmit_time, fit_interval=fit_interval
-        )
-        if prn not in data.keys():
-            data[prn] = []
-        data[prn].append(eph)
+    for letter, fields in NAV_RECORD_FIELDS.items():
+        rows = numpy.flatnonzero(systems == ord(letter))
+        if len(rows) == 0:
+            continue
+        num_orbit_lines = -(-(len(fields) - 3) // 4)
+        line_numbers = starts[rows, None] + numpy.arange(1, num_orbit_lines + 1)
+        orbit_lines = chars[numpy.minimum(line_numbers, len(chars) - 1)]
+        # lines past the end of a short record are blank
+        orbit_lines[numpy.arange(1, num_orbit_lines + 1) >= record_lengths[rows, None]] = ord(' ')
+        values = numpy.empty((len(rows), 3 + 4 * num_orbit_lines))
+        values[:, :3] = _parse_fixed_width_exponent_floats(
+            first_lines[rows, column + 19:column + 76].reshape(len(rows), 3, 19))
+        values[:, 3:] = _parse_fixed_width_exponent_floats(
+            orbit_lines[:, :, column:column + 76].reshape(len(rows), num_orbit_lines, 4, 19)).reshape(len(rows), -1)
+        ephemerides = numpy.empty(len(rows), dtype=nav_record_dtype(letter))
+        ephemerides['sat_id'] = sat_ids[rows].astype(str)
+        ephemerides['epoch'] = epochs[rows]
+        for j, name in enumerate(fields):
+            if name is not None:
+                ephemerides[name] = values[:, j]
+        data[letter] = ephemerides
     return data
 
+def _nav_data_columns(nav_data):
+    '''
+    Converts the output of `parse_nav_data` to per-system
+    columnar tables of format:
+        {'systems': {<system_letter>: {'sat_ids': ndarray, 'time': ndarray, 'fields': [<field>, ...], 'values': ndarray}}}
+    with one row per ephemeris, where `time` is the epoch (`t_oc`)
+    in seconds since 1980-01-06 of the system's time scale and the
+    columns of `values` are named by `fields`.
+    '''
+    systems = {}
+    for system_letter, ephemerides in nav_data.items():
+        fields = list(ephemerides.dtype.names[2:])
+        systems[system_letter] = {
+            'sat_ids': ephemerides['sat_id'],
+            'time': _datetime64_to_gps_seconds(ephemerides['epoch']),
+            'fields': fields,
+            'values': numpy.stack([ephemerides[field] for field in fields], axis=1),
+        }
+    return {'systems': systems}
 
 def parse_rinex_nav_file(filepath):
-    '''Given the filepath to a RINEX navigation message file, parses and returns header
+    '''Given the filepath to a RINEX 2, 3 or 4 navigation message file, parses and returns header
     and navigation ephemeris data.
     
     Input
     -----
-    `filepath` -- filepath to RINEX navigation file
+    `filepath` -- filepath to RINEX navigation file, which may be compressed
     
     Output
     ------
-    `header, nav_data` where `header` is a namespace containing the parsed header information
+    `header, nav_data` where `header` is a dictionary containing the parsed header information
         and `nav_data` is a dictionary containing the navigation data in the format:
-        {<prn>: [<namespace>, ... ]})}
+        {<system_letter>: ndarray}
     
-    where each namespace corresponds to a different ephemeris set.  See documentation in
-    `parse_nav_data` for information on the contents of each namespace.
+    where each structured array holds the ephemerides of one system.  See documentation in
+    `parse_nav_data` for information on their fields.
         
-    Note: `epoch` on the satellite namespace is a `datetime` object
+    Note: `epoch` of the ephemerides is a datetime64[us] value
     '''
-    with open(filepath, 'r') as f:
+    with open_compressed(filepath) as f:
         lines = list(f.readlines())
     for i, line in enumerate(lines):
         if line.find('END OF HEADER') >= 0:
@@ -93,6 +234,7 @@ def parse_rinex_nav_file(filepath):
     header_lines = lines[:i + 1]
     nav_lines = lines[i + 1:]
     header = parse_RINEX2_header(header_lines)
-    nav_data = parse_nav_data(nav_lines)
+    version = float(header['version']) if header.get('version') else None
+    system_letter = RINEX2_NAV_SYSTEMS.get(header.get('type', '')[:1], 'G')
+    nav_data = parse_nav_data(nav_lines, version=version, system_letter=system_letter)
     return header, nav_data
-
@@ -0,0 +1,179 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+import numpy
+
+DEFAULT_MAX_PRODUCT_CACHE_SIZE = 2 * 2**30  # bytes
+
+def estimate_size(obj, _seen=None):
+    '''
+    Returns the approximate number of bytes held by `obj`, following
+    dicts, lists, tuples, sets and namespaces.  NumPy arrays count
+    their data buffer, objects reachable twice are counted once.
+    '''
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, numpy.ndarray):
+        size = sys.getsizeof(obj)
+        if obj.base is None:
+            return size
+        return size + (estimate_size(obj.base, _seen) if isinstance(obj.base, numpy.ndarray) else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += estimate_size(value, _seen)
+    elif isinstance(obj, SimpleNamespace):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+def _file_identity(filepath):
+    stat = os.stat(filepath)
+    return (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+
+class ProductCache:
+    '''
+    ------------------------------------------------------------
+    Thread-safe in-process LRU cache of parsed product files
+    (SP3, clock, navigation, ANTEX, SINEX).
+
+    Entries are keyed by the parser, the identity (absolute path,
+    size and mtime) of the input files and the parse options, so a
+    file that changes on disk is parsed again.  Concurrent requests
+    for the same product wait for a single parse.  When the
+    estimated size of the entries exceeds `max_size` bytes the least
+    recently used ones are dropped; a product larger than
+    `max_size` is returned without being stored.
+
+    Note: cached results are shared between callers and must not be
+    modified in place
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_PRODUCT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._pending = {}  # key -> lock held while the product is parsed
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        '''Returns `(True, value)` and counts a hit if `key` is cached, else `(False, None)`.  Call with `_lock` held.'''
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[0]
+
+    def _evict(self, max_size):
+        '''Drops least recently used entries until the cache takes at most `max_size` bytes.  Call with `_lock` held.'''
+        while self._entries and self.size > max_size:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def get(self, parse_function, filepaths, *args, **kwargs):
+        '''
+        ------------------------------------------------------------
+        Returns `parse_function(*args, **kwargs)`, parsing only if no
+        result for the same parser, input files and arguments is
+        cached.
+
+        Input
+        -----
+        `parse_function` -- product parser, e.g. `parse_sp3_data`
+        `filepaths` -- filepath or list of filepaths that
+            `parse_function` reads; their identity is part of the key
+        `*args, **kwargs` -- passed to `parse_function`
+        '''
+        if isinstance(filepaths, (str, bytes, os.PathLike)):
+            filepaths = [filepaths]
+        key = (
+            parse_function.__module__, parse_function.__qualname__,
+            tuple(_file_identity(filepath) for filepath in filepaths),
+            repr(args), repr(sorted(kwargs.items())))
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            pending = self._pending.setdefault(key, threading.Lock())
+        with pending:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    return value
+                self.misses += 1
+            try:
+                value = parse_function(*args, **kwargs)
+                size = estimate_size(value)
+                with self._lock:
+                    if size <= self.max_size:
+                        self._evict(self.max_size - size)
+                        self._entries[key] = (value, size)
+                        self.size += size
+            finally:
+                with self._lock:
+                    if self._pending.get(key) is pending:
+                        del self._pending[key]
+        return value
+
+    def resize(self, max_size):
+        '''Sets the memory budget to `max_size` bytes, evicting entries as needed.'''
+        with self._lock:
+            self.max_size = max_size
+            self._evict(max_size)
+
+    def clear(self):
+        '''Drops all entries and resets the statistics.'''
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        '''Returns a dictionary of hit/miss/eviction counts, the number of entries and their estimated size in bytes.'''
+        with self._lock:
+            return dict(
+                hits=self.hits, misses=self.misses, evictions=self.evictions,
+                entries=len(self._entries), size=self.size, max_size=self.max_size)
+
+    def __len__(self):
+        return len(self._entries)
+
+# shared by the `*_cached` functions below
+PRODUCT_CACHE = ProductCache()
+
+def parse_sp3_data_cached(filepaths, sat_ids='all', cache=None):
+    '''Cached `parse_sp3_data`.  `cache` (default None) is a `ProductCache`; None uses `PRODUCT_CACHE`.'''
+    from .sp3.sp3 import parse_sp3_data
+    filepaths = list(filepaths)
+    return (PRODUCT_CACHE if cache is None else cache).get(parse_sp3_data, filepaths, filepaths, sat_ids=sat_ids)
+
+def parse_RINEX3_clk_file_cached(filepath, designators='all', cache=None):
+    '''Cached `parse_RINEX3_clk_file`, see `parse_sp3_data_cached`.'''
+    from .clk import parse_RINEX3_clk_file
+    return (PRODUCT_CACHE if cache is None else cache).get(parse_RINEX3_clk_file, filepath, filepath, designators=designators)
+
+def parse_rinex_nav_file_cached(filepath, cache=None):
+    '''Cached `parse_rinex_nav_file`, see `parse_sp3_data_cached`.'''
+    from .nav import parse_rinex_nav_file
+    return (PRODUCT_CACHE if cache is None else cache).get(parse_rinex_nav_file, filepath, filepath)
+
+def parse_igs_antex_cached(filepath, cache=None):
+    '''Cached `parse_igs_antex`, see `parse_sp3_data_cached`.'''
+    from .antex import parse_igs_antex
+    return (PRODUCT_CACHE if cache is None else cache).get(parse_igs_antex, filepath, filepath)
+
+def parse_sinex_cached(filepath, cache=None):
+    '''Cached `parse_sinex`, see `parse_sp3_data_cached`.'''
+    from .sinex_dcb import parse_sinex
+    return (PRODUCT_CACHE if cache is None else cache).get(parse_sinex, filepath, filepath)
@@ -0,0 +1,160 @@
+from itertools import islice
+from .compression import open_compressed
+from .rinex2 import parse_RINEX2_header, RINEX3_OBS_CODES, RINEX2_to_RINEX3_obs_types, _read_RINEX2_obs_file, \
+    _RINEX2_obs_columns
+from .rinex3 import parse_RINEX3_header, select_RINEX3_obs_types, RINEX3_OBS_OUTPUTS, _read_RINEX3_obs_file, \
+    _RINEX3_obs_output
+from .crinex import decode_CRINEX3_obs_data, _decode_CRINEX1_obs_arrays, _read_CRINEX_obs_file
+from .nav import parse_rinex_nav_file, _nav_data_columns
+from .clk import parse_RINEX3_clk_data_columnar
+
+def sniff_rinex(filepath):
+    '''
+    ------------------------------------------------------------
+    Reads the `RINEX VERSION / TYPE` record of a RINEX or Compact
+    RINEX file.
+
+    Input
+    -----
+    `filepath` -- filepath to RINEX file, which may be compressed
+        (see `compression.open_compressed`)
+
+    Output
+    ------
+    `version, file_type, crinex_version` where `version` is the
+    RINEX format version (float), `file_type` the file type
+    letter, e.g. 'O', 'N' or 'C', and `crinex_version` the
+    Compact RINEX version (e.g. '3.0'), or None for RINEX files
+    '''
+    with open_compressed(filepath) as f:
+        lines = list(islice(f, 3))
+    if len(lines) == 0:
+        raise Exception('Error when parsing RINEX file.  The file appears to be empty.')
+    crinex_version = None
+    if lines[0][60:].strip() == 'CRINEX VERS   / TYPE':
+        crinex_version = lines[0][:20].strip()
+        lines = lines[2:]
+    if len(lines) == 0 or lines[0][60:].strip() != 'RINEX VERSION / TYPE':
+        raise Exception('RINEX file must start with `RINEX VERSION / TYPE`')
+    return float(lines[0][:9]), lines[0][20:21], crinex_version
+
+def _RINEX2_obs_system(header):
+    '''Returns the system letter of a single-system RINEX 2 observation file (blank meaning GPS), or None.'''
+    system_letter = header.get('type', '')[20:21].strip() or 'G'
+    return system_letter if system_letter in RINEX3_OBS_CODES else None
+
+def open_rinex(filepath, output='columns', systems=None, obs_types=None, bands=None, observables=None, start=None,
+               end=None, interval=None):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a RINEX 2 or 3 observation, navigation
+    or clock file, or a Compact RINEX 1.0 or 3.0 observation
+    file, reads the `RINEX VERSION / TYPE` record and parses the
+    file with the decoder for its format, returning the data in
+    one layout regardless of the version.
+
+    Observations of RINEX 2 and CRINEX 1.0 files are renamed to
+    the RINEX 3 codes of `rinex2.RINEX3_OBS_CODES` and go through
+    the same output stage as RINEX 3 files, so 'tree' output is
+    the band / channel tree of `parse_RINEX3_obs_file` (with
+    'cnr' for signal strength) for all versions.
+
+    Input
+    -----
+    `filepath` -- filepath to RINEX file, which may be compressed
+        (see `compression.open_compressed`)
+    `output` (default 'columns') -- for observation files,
+        layout of `observations` as in `parse_RINEX3_obs_file`
+    `systems`, `obs_types`, `bands`, `observables` (default
+        None) -- for observation files, selection passed to
+        `select_RINEX3_obs_types`; `obs_types` are RINEX 3 codes
+        for all versions
+    `start`, `end`, `interval` (default None) -- for RINEX 2
+        and 3 observation files, window and decimation as in
+        `parse_RINEX3_obs_file`
+
+    Output
+    ------
+    `header, data` where `header` is the dictionary returned by
+    `parse_RINEX3_header` (RINEX 3 observation and clock files)
+    or `parse_RINEX2_header` (RINEX 2 observation and all
+    navigation files) with the additional entries:
+        'rinex_version' -- RINEX format version (float)
+        'file_type' -- file type letter, e.g. 'O', 'N' or 'C'
+        'crinex_version' -- for Compact RINEX files
+        'system_obs_types' -- for RINEX 2 observation files,
+            the observations in RINEX 3 codes, see
+            `rinex2.RINEX2_to_RINEX3_obs_types`
+    and `data` is, by file type:
+        observation -- the `observations` of
+            `parse_RINEX3_obs_file` in the `output` layout
+        navigation -- per-system ephemeris tables:
+            {'systems': {<system_letter>: {'sat_ids': ndarray, 'time': ndarray, 'fields': [...], 'values': ndarray}}}
+            with the fields of `nav.parse_nav_data`
+        clock -- the tables of `clk.parse_RINEX3_clk_data_columnar`
+
+    Note: times are in GPST seconds, except for ephemerides,
+    whose epochs are in the time scale of their system
+    '''
+    version, file_type, crinex_version = sniff_rinex(filepath)
+    selection = dict(systems=systems, obs_types=obs_types, bands=bands, observables=observables)
+    is_windowed = start is not None or end is not None or interval is not None
+    if file_type != 'O':
+        if is_windowed or any(value is not None for value in selection.values()):
+            raise Exception('Selections and `start`/`end`/`interval` only apply to observation files')
+        if file_type == 'C':
+            header, data = _read_clk_file(filepath)
+        elif file_type in ('N', 'G', 'H'):
+            header, data = _read_nav_file(filepath)
+        else:
+            raise Exception('Unsupported RINEX file type: {0}'.format(file_type))
+        header['rinex_version'], header['file_type'] = version, file_type
+        return header, data
+    if output not in RINEX3_OBS_OUTPUTS:
+        raise Exception('`output` must be one of {0}'.format(', '.join(map(repr, RINEX3_OBS_OUTPUTS))))
+    if crinex_version is not None and is_windowed:
+        raise Exception('`start`, `end` and `interval` are not supported for Compact RINEX files')
+    if crinex_version is not None:
+        crinex_version, header_lines, obs_lines = _read_CRINEX_obs_file(filepath)
+    if version >= 3:
+        if crinex_version is None:
+            header, columns, time, selected_obs_types = _read_RINEX3_obs_file(filepath, start=start, end=end,
+                                                                              interval=interval, **selection)
+        else:
+            header = parse_RINEX3_header(header_lines)
+            if len(header['system_obs_types']) == 0:
+                raise Exception('RINEX header must contain `SYS / # / OBS TYPES` and `header` dict from `parse_RINEX3_header` must contain corresponding dictionary `system_obs_types`')
+            selected_obs_types = select_RINEX3_obs_types(header['system_obs_types'], **selection)
+            columns, time = decode_CRINEX3_obs_data(obs_lines, header['system_obs_types'], selected_obs_types)
+    else:
+        if crinex_version is None:
+            header, sat_ids, index, values, time, obs_types = _read_RINEX2_obs_file(filepath, start, end, interval)
+        else:
+            header = parse_RINEX2_header(header_lines)
+            if 'obs_types' not in header.keys():
+                raise Exception('RINEX header must contain `# / TYPES OF OBS.` and `header` dict from `parse_parse_RINEX2_header` must contain corresponding list `obs_types`')
+            sat_ids, index, values, time = _decode_CRINEX1_obs_arrays(obs_lines, header['obs_types'])
+            obs_types = header['obs_types']
+        header['system_obs_types'] = RINEX2_to_RINEX3_obs_types(obs_types, _RINEX2_obs_system(header))
+        selected_obs_types = select_RINEX3_obs_types(header['system_obs_types'], **selection)
+        columns = _RINEX2_obs_columns(sat_ids, index, values, obs_types, selected_obs_types)
+    header['rinex_version'], header['file_type'] = version, file_type
+    if crinex_version is not None:
+        header['crinex_version'] = crinex_version
+    return header, _RINEX3_obs_output(columns, time, selected_obs_types, output, header.get('frequency_numbers'))
+
+def _read_clk_file(filepath):
+    '''Parses a RINEX clock file into its header and columnar clock tables.'''
+    with open_compressed(filepath) as f:
+        header_lines = []
+        for line in f:
+            header_lines.append(line)
+            if line.find('END OF HEADER') >= 0:
+                break
+        clk_lines = f.readlines()
+    return parse_RINEX3_header(header_lines), parse_RINEX3_clk_data_columnar(clk_lines)
+
+def _read_nav_file(filepath):
+    '''Parses a RINEX navigation file into its header and per-system ephemeris tables.'''
+    header, nav_data = parse_rinex_nav_file(filepath)
+    return header, _nav_data_columns(nav_data)
@@ -1,6 +1,12 @@
 import numpy
-from numpy import array, nan, datetime64
+from numpy import array, nan, datetime64, isnan, where, concatenate, uint8, int64
 from datetime import datetime
+from itertools import islice
+from collections import deque
+from .compression import open_compressed
+from .rinex3 import _is_on_interval_grid, _fixed_width_lines, _parse_fixed_width_ints, _parse_fixed_width_floats, \
+    _parse_RINEX3_obs_fields, _split_by_satellite, _calendar_to_datetime64, _datetime64_to_gps_seconds, _ObsColumns, \
+    _gps_seconds_to_time_tuple
 
 # RINEX 2.10 - 2.11
 CONSTELLATION_IDS = {
@@ -75,6 +81,32 @@ OBSERVATION_DATATYPES = {
     },
 }
 
+# RINEX 3 observation codes for the RINEX 2 observation types, assuming the
+# tracking modes RINEX 2 files usually hold (C/A and semi-codeless P(Y) for
+# GPS, C/A and P for GLONASS); used to give RINEX 2 data the RINEX 3 layout
+RINEX3_OBS_CODES = {
+    'G': {
+        'C1': 'C1C', 'P1': 'C1W', 'L1': 'L1C', 'D1': 'D1C', 'S1': 'S1C',
+        'C2': 'C2X', 'P2': 'C2W', 'L2': 'L2W', 'D2': 'D2W', 'S2': 'S2W',
+        'C5': 'C5X', 'L5': 'L5X', 'D5': 'D5X', 'S5': 'S5X',
+    },
+    'R': {
+        'C1': 'C1C', 'P1': 'C1P', 'L1': 'L1C', 'D1': 'D1C', 'S1': 'S1C',
+        'C2': 'C2C', 'P2': 'C2P', 'L2': 'L2P', 'D2': 'D2P', 'S2': 'S2P',
+    },
+    'E': {
+        'C1': 'C1X', 'L1': 'L1X', 'D1': 'D1X', 'S1': 'S1X',
+        'C5': 'C5X', 'L5': 'L5X', 'D5': 'D5X', 'S5': 'S5X',
+        'C7': 'C7X', 'L7': 'L7X', 'D7': 'D7X', 'S7': 'S7X',
+        'C8': 'C8X', 'L8': 'L8X', 'D8': 'D8X', 'S8': 'S8X',
+        'C6': 'C6X', 'L6': 'L6X', 'D6': 'D6X', 'S6': 'S6X',
+    },
+    'S': {
+        'C1': 'C1C', 'L1': 'L1C', 'D1': 'D1C', 'S1': 'S1C',
+        'C5': 'C5X', 'L5': 'L5X', 'D5': 'D5X', 'S5': 'S5X',
+    },
+}
+
 def parse_RINEX2_header(lines):
     '''
     ------------------------------------------------------------
@@ -130,6 +162,12 @@ def parse_RINEX2_header(lines):
                 header['approximate_position_xyz'] = line[:60].strip()
             elif header_label == 'TIME OF FIRST OBS':
                 header['time_of_first_obs'] = line[:60].strip()
+            elif header_label == 'TIME OF LAST OBS':
+                header['time_of_last_obs'] = line[:60].strip()
+            elif header_label == 'INTERVAL':
+                interval_str = line[:10].strip()
+                if interval_str:
+                    header['interval'] = float(interval_str)
             elif header_label == '# / TYPES OF OBSERV':
                 n_obs_str = line[:10].strip()
                 if n_obs_str:
@@ -143,7 +181,11 @@ def parse_RINEX2_header(lines):
     return header
 
 
-def parse_RINEX2_obs_data(lines, observations, century=2000):
+# observation records hold five fields per line, epoch records twelve satellite ids per line
+RINEX2_FIELDS_PER_LINE = 5
+RINEX2_SATS_PER_LINE = 12
+
+def parse_RINEX2_obs_data(lines, observations, century=2000, start=None, end=None, interval=None):
     '''
     ------------------------------------------------------------
     Given `lines` corresponding to the RINEX observation file
@@ -157,17 +199,33 @@ def parse_RINEX2_obs_data(lines, observations, century=2000):
     `lines` -- data lines from RINEX observation file
     `observations` -- list of the observations reported at
         each epoch
+    `start`, `end` (default None) -- GPST seconds bounding the
+        epochs to parse (`start <= time < end`); None leaves that
+        side open.  Epochs before `start` are skipped without
+        decoding and parsing stops at the first epoch past `end`
+    `interval` (default None) -- if given, only epochs on a
+        grid of `interval` GPST seconds are kept; the others are
+        skipped without decoding their satellite lines
     
     Output
     ------
     `data` -- dictionary of format:
         {<sat_id>: {'index': [<int...>], <obs_id>: [<values...>]}}
     `time` -- list of times (datetime64) corresponding to epochs
+    
+    Note: epochs are assumed to be in chronological order
     '''
     data = {}  # <sat_id>: {'index': [<int...>], <obs_id>: [<values...>]}
     lines = iter(lines)
     epoch_index = 0
     time = []
+    if start is not None:
+        start = _gps_seconds_to_time_tuple(start)
+    if end is not None:
+        end = _gps_seconds_to_time_tuple(end)
+    if interval is not None and not interval > 0:
+        raise Exception('`interval` must be positive')
+    num_lines_per_sat = -(-len(observations) // RINEX2_FIELDS_PER_LINE)
     try:
         while True:
             # at each epoch, the two-digit year, month, day, hour, minute, and seconds
@@ -181,6 +239,16 @@ def parse_RINEX2_obs_data(lines, observations, century=2000):
             hour = int(line[10:13])
             minute = int(line[13:16])
             seconds = float(line[16:25])
+            if start is not None or end is not None or interval is not None:
+                epoch = (year, month, day, hour, minute, seconds)
+                if end is not None and epoch >= end:
+                    break
+                if (start is not None and epoch < start) \
+                        or (interval is not None and not _is_on_interval_grid(*epoch, interval)):
+                    # jump past the satellite id continuation lines and the observation lines
+                    num_sats = int(line[29:32])
+                    deque(islice(lines, _num_RINEX2_epoch_lines(num_sats, num_lines_per_sat)), maxlen=0)
+                    continue
             microseconds = int(1e6 * (seconds % 1))
             seconds = int(seconds)
             dt = datetime64(datetime(year, month, day, hour, minute, seconds, microseconds))
@@ -208,7 +276,6 @@ def parse_RINEX2_obs_data(lines, observations, century=2000):
                 data[sat_id]['index'].append(epoch_index)
                 # each line of observation values contains up to 5 entries
                 # each entry is of width 16, starting at index 0
-                num_lines_per_sat = 1 + len(observations) // 5
                 line = ''
                 for i in range(num_lines_per_sat):
                     line += next(lines).replace('\n', '').ljust(80)
@@ -235,6 +302,389 @@ def parse_RINEX2_obs_data(lines, observations, century=2000):
         pass
     return data, time
 
+def _parse_RINEX2_epoch_records(chars, century=2000):
+    '''
+    Given uint8 array `chars` of RINEX 2 epoch record lines,
+    returns their times as datetime64[us].
+    '''
+    year, month, day, hour, minute = \
+        (_parse_fixed_width_ints(chars[:, i0:i1]) for i0, i1 in ((1, 3), (4, 6), (7, 9), (10, 12), (13, 15)))
+    seconds = _parse_fixed_width_floats(chars[:, 15:26], err_val=0.)
+    return _calendar_to_datetime64(century + year, month, day, hour, minute, seconds)
+
+def _num_RINEX2_epoch_lines(num_sats, num_lines_per_sat):
+    '''Returns the number of lines that follow an epoch record: satellite id continuation lines and observation records.'''
+    return max(num_sats - 1, 0) // RINEX2_SATS_PER_LINE + num_sats * num_lines_per_sat
+
+def _scan_RINEX2_obs_epochs(lines, observations, century=2000, start=None, end=None, interval=None):
+    '''
+    Walks the epoch records of the RINEX 2 observation data
+    `lines` (a list), jumping over the satellite lines of each
+    epoch by its satellite count.  Event records (flags 2-5), and
+    epochs outside `[start, end)` (time tuples) or off the grid of
+    `interval` seconds, are skipped; a last epoch cut short is
+    dropped.  A `# / TYPES OF OBSERV` record in an event record
+    starts a new segment whose epochs are walked with the new
+    observation types.  Returns `(epoch_lines, epoch_num_sats,
+    epoch_segments, segment_observations)`: the line numbers of
+    the kept epoch records, their numbers of satellites and their
+    segment numbers as int64 arrays, and the list of observation
+    types of each segment.
+    '''
+    segment_observations = [list(observations)]
+    num_lines_per_sat = -(-len(observations) // RINEX2_FIELDS_PER_LINE)
+    epoch_lines, epoch_num_sats, epoch_segments = [], [], []
+    is_windowed = start is not None or end is not None or interval is not None
+    i, num_lines = 0, len(lines)
+    while i < num_lines:
+        line = lines[i]
+        if len(line) < 32 or line[:32].isspace():
+            i += 1
+            continue
+        num_sats = int(line[29:32].strip() or 0)
+        if line[28:29] in ('2', '3', '4', '5'):
+            records = lines[i + 1:i + 1 + num_sats]
+            if any('# / TYPES OF OBSERV' in record for record in records):
+                obs_types = parse_RINEX2_header(records).get('obs_types')
+                if obs_types and obs_types != segment_observations[-1]:
+                    segment_observations.append(obs_types)
+                    num_lines_per_sat = -(-len(obs_types) // RINEX2_FIELDS_PER_LINE)
+            i += 1 + num_sats
+            continue
+        num_records = _num_RINEX2_epoch_lines(num_sats, num_lines_per_sat)
+        if i + 1 + num_records > num_lines:
+            break
+        if is_windowed:
+            epoch = (century + int(line[1:3]), int(line[4:6]), int(line[7:9]), int(line[10:12]), int(line[13:15]),
+                     float(line[15:26]))
+            if end is not None and epoch >= end:
+                break
+            if (start is not None and epoch < start) or (interval is not None and not _is_on_interval_grid(*epoch, interval)):
+                i += 1 + num_records
+                continue
+        epoch_lines.append(i)
+        epoch_num_sats.append(num_sats)
+        epoch_segments.append(len(segment_observations) - 1)
+        i += 1 + num_records
+    return array(epoch_lines, dtype=int64), array(epoch_num_sats, dtype=int64), array(epoch_segments, dtype=int64), \
+        segment_observations
+
+def _decode_RINEX2_obs_block(chars, epoch_lines, num_sats, num_obs, century=2000):
+    '''
+    Decodes the epochs of a block of RINEX 2 observation lines
+    packed as `chars` (see `_fixed_width_lines`), given the line
+    numbers of their epoch records and their satellite counts.
+    Returns `(time, sat_ids, sat_epoch, values)` with one entry of
+    `sat_ids` (`S3`), `sat_epoch` (epoch number within the block)
+    and row of `values` per satellite.
+    '''
+    num_lines_per_sat = -(-num_obs // RINEX2_FIELDS_PER_LINE)
+    time = _parse_RINEX2_epoch_records(chars[epoch_lines], century)
+    num_id_lines = 1 + numpy.maximum(num_sats - 1, 0) // RINEX2_SATS_PER_LINE
+    # satellite k of an epoch is at column 32 + 3 * (k % 12) of its (k // 12)-th id line
+    sat_epoch = numpy.repeat(numpy.arange(len(epoch_lines)), num_sats)
+    k = numpy.arange(len(sat_epoch)) - numpy.repeat(numpy.cumsum(num_sats) - num_sats, num_sats)
+    id_lines = epoch_lines[sat_epoch] + k // RINEX2_SATS_PER_LINE
+    id_columns = 32 + 3 * (k % RINEX2_SATS_PER_LINE)
+    sat_chars = chars[id_lines[:, None], id_columns[:, None] + numpy.arange(3)]
+    # a blank system letter means GPS, and some writers use a space instead of zero, e.g. 'G 1'
+    sat_chars[:, 0] = where(sat_chars[:, 0] <= 32, uint8(ord('G')), sat_chars[:, 0])
+    sat_chars[sat_chars <= 32] = ord('0')
+    sat_ids = sat_chars.view('S3').ravel()
+    record_lines = (epoch_lines + num_id_lines)[sat_epoch] + k * num_lines_per_sat
+    fields = chars[record_lines[:, None] + numpy.arange(num_lines_per_sat)]
+    fields = fields.reshape(len(record_lines), -1, 16)[:, :num_obs]
+    return time, sat_ids, sat_epoch, _parse_RINEX3_obs_fields(fields)
+
+def parse_RINEX2_obs_data_vectorized(lines, observations, century=2000, start=None, end=None, interval=None,
+                                     block_size=50000):
+    '''
+    ------------------------------------------------------------
+    Vectorized counterpart of `parse_RINEX2_obs_data` for RINEX
+    2.10/2.11.  Only the epoch records are walked in Python; the
+    satellite ids and observation records of blocks of about
+    `block_size` lines are cut out as fixed-width byte arrays (each
+    satellite takes `ceil(len(observations) / 5)` lines) and all
+    values are decoded with NumPy.
+
+    Input
+    -----
+    `lines` -- data lines from RINEX observation file
+    `observations` -- list of the observations reported at
+        each epoch
+    `start`, `end`, `interval` (default None) -- see
+        `parse_RINEX2_obs_data`
+    `block_size` (default 50000) -- number of lines decoded at
+        once
+
+    Output
+    ------
+    `data` -- dictionary of format:
+        {<sat_id>: {'index': ndarray, <obs_id>: ndarray}}
+        where blank fields are NaN and observations that are
+        blank for all epochs of a satellite are left out
+    `time` -- datetime64[us] array of the epoch times
+
+    Note: epochs are assumed to be in chronological order; event
+    records (epoch flags 2-5) are skipped, except that a change of
+    `# / TYPES OF OBSERV` in one applies to the epochs after it
+    '''
+    sat_ids, index, values, time, observations = _decode_RINEX2_obs_lines(lines, observations, century, start, end,
+                                                                          interval, block_size)
+    return _RINEX2_obs_tree(sat_ids, index, values, observations), time
+
+def _decode_RINEX2_obs_lines(lines, observations, century=2000, start=None, end=None, interval=None, block_size=50000):
+    '''
+    Decodes RINEX 2 observation data lines block by block, see
+    `parse_RINEX2_obs_data_vectorized`.  Returns `(sat_ids, index,
+    values, time, observations)` with one entry of `sat_ids`
+    (`S3`) and `index` and one row of `values` per satellite
+    record, in epoch order.  If event records change the
+    observation types, `observations` is extended by the new ones
+    and the columns of `values` follow it, NaN where an epoch has
+    no such observation.
+    '''
+    if not isinstance(lines, list):
+        lines = list(lines)
+    if start is not None:
+        start = _gps_seconds_to_time_tuple(start)
+    if end is not None:
+        end = _gps_seconds_to_time_tuple(end)
+    if interval is not None and not interval > 0:
+        raise Exception('`interval` must be positive')
+    epoch_lines, num_sats, epoch_segments, segment_observations = \
+        _scan_RINEX2_obs_epochs(lines, observations, century, start, end, interval)
+    observations = list(observations)
+    for obs_types in segment_observations[1:]:
+        observations.extend(obs_id for obs_id in obs_types if obs_id not in observations)
+    num_lines_per_sat = array([-(-len(obs_types) // RINEX2_FIELDS_PER_LINE) for obs_types in segment_observations],
+                              dtype=int64)[epoch_segments]
+    epoch_stops = epoch_lines + 1 + numpy.maximum(num_sats - 1, 0) // RINEX2_SATS_PER_LINE + num_sats * num_lines_per_sat
+    # blocks do not cross a change of the observation types
+    segment_stops = numpy.searchsorted(epoch_segments, epoch_segments, side='right')
+    time, sat_ids, index, values = [array([], dtype='datetime64[us]')], [numpy.empty(0, 'S3')], [numpy.empty(0, int64)], \
+        [numpy.empty((0, len(observations)))]
+    e0 = 0
+    while e0 < len(epoch_lines):
+        e1 = max(e0 + 1, int(numpy.searchsorted(epoch_stops, epoch_lines[e0] + block_size, side='right')))
+        e1 = min(e1, int(segment_stops[e0]))
+        l0, l1 = epoch_lines[e0], epoch_stops[e1 - 1]
+        obs_types = segment_observations[epoch_segments[e0]]
+        chars = _fixed_width_lines(lines[l0:l1], 80)
+        block_time, block_sat_ids, sat_epoch, block_values = _decode_RINEX2_obs_block(
+            chars, epoch_lines[e0:e1] - l0, num_sats[e0:e1], len(obs_types), century)
+        if obs_types != observations:
+            block_values, segment_values = numpy.full((len(block_values), len(observations)), nan), block_values
+            block_values[:, [observations.index(obs_id) for obs_id in obs_types]] = segment_values
+        time.append(block_time)
+        sat_ids.append(block_sat_ids)
+        index.append(sat_epoch + e0)
+        values.append(block_values)
+        e0 = e1
+    return concatenate(sat_ids), concatenate(index), concatenate(values), concatenate(time), observations
+
+def _RINEX2_obs_tree(sat_ids, index, values, observations):
+    '''
+    Splits decoded satellite records into the per-satellite
+    `{'index': ndarray, <obs_id>: ndarray}` dictionaries, leaving
+    out observations that are blank for all epochs of a satellite.
+    '''
+    system_letters = sat_ids.view(uint8).reshape(-1, 3)[:, 0]
+    data = {}
+    # `_split_by_satellite` groups by PRN, so it is given one system at a time
+    for system_letter in numpy.unique(system_letters):
+        rows = numpy.flatnonzero(system_letters == system_letter)
+        data.update(_split_by_satellite(sat_ids[rows], index[rows], values[rows], observations))
+    for sat_data in data.values():
+        for obs_id in observations:
+            if isnan(sat_data[obs_id]).all():
+                del sat_data[obs_id]
+    return data
+
+def RINEX2_to_RINEX3_obs_types(observations, systems=None):
+    '''
+    ------------------------------------------------------------
+    Translates the observation types of a RINEX 2 header to the
+    RINEX 3 codes of `RINEX3_OBS_CODES`.
+
+    Input
+    -----
+    `observations` -- list of the observations reported at
+        each epoch, e.g. `header['obs_types']`
+    `systems` (default None) -- system letters to translate
+        for; None for all systems of `RINEX3_OBS_CODES`
+
+    Output
+    ------
+    dictionary of format:
+        {<system_letter>: [<obs_id>, ...]}
+    in the order of `observations`; observation types without a
+    RINEX 3 code for a system are left out
+    '''
+    system_obs_types = {}
+    for system_letter, codes in RINEX3_OBS_CODES.items():
+        if systems is not None and system_letter not in systems:
+            continue
+        system_obs_types[system_letter] = [codes[obs_id] for obs_id in observations if obs_id in codes]
+    return system_obs_types
+
+def _RINEX2_obs_columns(sat_ids, index, values, observations, selected_obs_types):
+    '''
+    Groups decoded RINEX 2 satellite records by system into the
+    `_ObsColumns` buffers of the RINEX 3 decoders, keeping the
+    columns of `selected_obs_types` (RINEX 3 codes, see
+    `RINEX2_to_RINEX3_obs_types`) in that order.  Records of
+    other systems are dropped.
+    '''
+    system_letters = sat_ids.view(uint8).reshape(-1, 3)[:, 0] if len(sat_ids) > 0 else numpy.empty(0, uint8)
+    columns = {}
+    for system_letter, obs_types in selected_obs_types.items():
+        obs_ids = {code: obs_id for obs_id, code in RINEX3_OBS_CODES[system_letter].items()}
+        positions = [observations.index(obs_ids[code]) for code in obs_types]
+        rows = numpy.flatnonzero(system_letters == ord(system_letter))
+        columns[system_letter] = _ObsColumns(len(obs_types), max(len(rows), 1))
+        block = columns[system_letter].extend(len(rows))
+        block[0][:] = sat_ids[rows]
+        block[1][:] = index[rows]
+        block[2][:] = values[numpy.ix_(rows, positions)]
+    return columns
+
+def iter_RINEX2_obs_data(lines, observations, century=2000, epochs_per_chunk=1000):
+    '''
+    ------------------------------------------------------------
+    Single-pass generator over RINEX 2 observation data lines that
+    follows the event records in the body of the file.  Epochs are
+    collected and decoded (see `parse_RINEX2_obs_data_vectorized`)
+    `epochs_per_chunk` at a time, so memory use does not grow with
+    the length of the file.
+
+    Event epochs (flags 2-5) are read with their header records.
+    A `# / TYPES OF OBSERV` record among them (e.g. where files
+    were spliced) ends the current chunk, and the epochs after it
+    are decoded with the new observation types.
+
+    Input
+    -----
+    `lines` -- iterable of data lines from RINEX observation
+        file, e.g. an open file object positioned after the
+        header
+    `observations` -- list of the observations reported at
+        each epoch, as given in the file header
+    `epochs_per_chunk` (default 1000) -- maximum number of epochs
+        per chunk
+
+    Output
+    ------
+    yields dictionaries of format:
+        {
+            'time': ndarray,
+            'flag': ndarray,
+            'obs_types': [<obs_id>, ...],
+            'satellites': {
+                <sat_id>: {'index': ndarray, <obs_id>: ndarray}
+            },
+            'events': [
+                {'time': float, 'flag': int, 'epoch_index': int, 'header': dict}, ...
+            ]
+        }
+    where `index` refers to the epochs of the chunk, `obs_types`
+    are the observations in effect for the chunk, and `events`
+    are the event epochs read since the previous chunk, with
+    `epoch_index` the index of the chunk epoch they precede and
+    `header` their records parsed by `parse_RINEX2_header`.  A
+    last chunk without epochs carries any trailing events.
+
+    Note: `time` is in GPST seconds (NaN for events without a
+    time); a last epoch cut short is dropped
+    '''
+    lines = iter(lines)
+    observations = list(observations)
+    block, epoch_lines, num_sats, events = [], [], [], []
+
+    def chunk():
+        if len(epoch_lines) == 0:
+            time, flag, satellites = array([]), array([], dtype=int64), {}
+        else:
+            chars = _fixed_width_lines(block, 80)
+            time, sat_ids, sat_epoch, values = _decode_RINEX2_obs_block(
+                chars, array(epoch_lines), array(num_sats), len(observations), century)
+            time = _datetime64_to_gps_seconds(time)
+            flag = _parse_fixed_width_ints(chars[epoch_lines, 26:29])
+            satellites = _RINEX2_obs_tree(sat_ids, sat_epoch, values, observations)
+        return {'time': time, 'flag': flag, 'obs_types': list(observations), 'satellites': satellites,
+                'events': list(events)}
+
+    num_lines_per_sat = -(-len(observations) // RINEX2_FIELDS_PER_LINE)
+    for line in lines:
+        if line.isspace():
+            continue
+        num_records = int(line[29:32].strip() or 0)
+        if line[28:29] in ('2', '3', '4', '5'):
+            records = list(islice(lines, num_records))
+            header = parse_RINEX2_header(records)
+            time = nan
+            if not line[:26].isspace():
+                time = float(_datetime64_to_gps_seconds(_parse_RINEX2_epoch_records(_fixed_width_lines([line], 80), century))[0])
+            if 'obs_types' in header and header['obs_types'] != observations:
+                if len(epoch_lines) > 0 or len(events) > 0:
+                    yield chunk()
+                block, epoch_lines, num_sats, events = [], [], [], []
+                observations = header['obs_types']
+                num_lines_per_sat = -(-len(observations) // RINEX2_FIELDS_PER_LINE)
+            events.append({'time': time, 'flag': int(line[28:29]), 'epoch_index': len(epoch_lines), 'header': header})
+            continue
+        num_lines = _num_RINEX2_epoch_lines(num_records, num_lines_per_sat)
+        records = list(islice(lines, num_lines))
+        if len(records) < num_lines:
+            break
+        epoch_lines.append(len(block))
+        num_sats.append(num_records)
+        block.append(line)
+        block.extend(records)
+        if len(epoch_lines) == epochs_per_chunk:
+            yield chunk()
+            block, epoch_lines, num_sats, events = [], [], [], []
+    if len(epoch_lines) > 0 or len(events) > 0:
+        yield chunk()
+
+def stream_RINEX2_obs_file(filepath, epochs_per_chunk=1000):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a RINEX 2 observation file, parses the
+    header and returns a generator over chunks of epochs, reading
+    the file once and following event records and changes of the
+    observation types in its body.
+
+    Input
+    -----
+    `filepath` -- filepath to RINEX observation file, which may
+        be compressed (see `compression.open_compressed`)
+    `epochs_per_chunk` (default 1000) -- see
+        `iter_RINEX2_obs_data`
+
+    Output
+    ------
+    `header, chunks` where `header` is a dictionary containing
+    the parsed header information and `chunks` is the generator
+    returned by `iter_RINEX2_obs_data`
+
+    Note: the file stays open until `chunks` is exhausted
+    '''
+    f = open_compressed(filepath)
+    header_lines = []
+    for line in f:
+        header_lines.append(line)
+        if line.find('END OF HEADER') >= 0:
+            break
+    header = parse_RINEX2_header(header_lines)
+    if 'obs_types' not in header.keys():
+        f.close()
+        raise Exception('RINEX header must contain `# / TYPES OF OBS.` and `header` dict from `parse_parse_RINEX2_header` must contain corresponding list `obs_types`')
+    def chunks():
+        with f:
+            yield from iter_RINEX2_obs_data(f, header['obs_types'], epochs_per_chunk=epochs_per_chunk)
+    return header, chunks()
+
 def transform_values_from_RINEX2_obs(rinex_data):
     '''
     ------------------------------------------------------------
@@ -278,7 +728,7 @@ def transform_values_from_RINEX2_obs(rinex_data):
              data[sat_id]['index'] = array(rnx_sat['index'], dtype=int)
     return data
 
-def parse_RINEX2_obs_file(filepath):
+def parse_RINEX2_obs_file(filepath, start=None, end=None, interval=None):
     '''
     ------------------------------------------------------------
     Given the filepath to a RINEX observation file, parses and
@@ -286,7 +736,15 @@ def parse_RINEX2_obs_file(filepath):
     
     Input
     -----
-    `filepath` -- filepath to RINEX observation file
+    `filepath` -- filepath to RINEX observation file, which may
+        be compressed (see `compression.open_compressed`)
+    `start`, `end` (default None) -- GPST seconds bounding the
+        epochs to parse (`start <= time < end`); the rest of the
+        file is not read once an epoch past `end` is reached
+    `interval` (default None) -- decimation interval in
+        seconds, e.g. 30 to read 1 Hz files as 30 s data; only
+        epochs on this grid of GPST are decoded, the others are
+        skipped right after their epoch line
 
     Output
     ------
@@ -305,24 +763,33 @@ def parse_RINEX2_obs_file(filepath):
             }
         }
         
-    Note: `time` in `observations` is in GPST seconds
-    **Warning**: this function cannot currently handle splicing
-        / comments in the middle of a RINEX file.
+    Note: `time` in `observations` is in GPST seconds; event
+    records in the body of the file are skipped, except that a
+    change of `# / TYPES OF OBSERV` in one applies to the epochs
+    after it (see `stream_RINEX2_obs_file` for the events)
     '''
-    with open(filepath, 'r') as f:
-        lines = list(f.readlines())
-    for i, line in enumerate(lines):
-        if line.find('END OF HEADER') >= 0:
-            break
-    header_lines = lines[:i + 1]
-    obs_lines = lines[i + 1:]
-    header = parse_RINEX2_header(header_lines)
-    if 'obs_types' not in header.keys():
-        raise Exception('RINEX header must contain `# / TYPES OF OBS.` and `header` dict from `parse_parse_RINEX2_header` must contain corresponding list `obs_types`')
-    obs_data, time = parse_RINEX2_obs_data(obs_lines, header['obs_types'])
-    obs_data = transform_values_from_RINEX2_obs(obs_data)
-    gps_epoch = datetime64(datetime(1980, 1, 6))
-    time = (array(time) - gps_epoch).astype(float) / 1e6  # dt64 is in microseconds
-    observations = {'time': time, 'satellites': obs_data}
+    header, sat_ids, index, values, time, obs_types = _read_RINEX2_obs_file(filepath, start, end, interval)
+    obs_data = transform_values_from_RINEX2_obs(_RINEX2_obs_tree(sat_ids, index, values, obs_types))
+    observations = {'time': _datetime64_to_gps_seconds(time), 'satellites': obs_data}
     return header, observations
 
+def _read_RINEX2_obs_file(filepath, start=None, end=None, interval=None):
+    '''
+    Reads the header and decodes the data lines of a RINEX 2
+    observation file, see `parse_RINEX2_obs_file`.  Returns
+    `(header, sat_ids, index, values, time, obs_types)` as
+    `_decode_RINEX2_obs_lines` returns them, with `obs_types` the
+    observation types of the columns of `values`.
+    '''
+    with open_compressed(filepath) as f:
+        header_lines = []
+        for line in f:
+            header_lines.append(line)
+            if line.find('END OF HEADER') >= 0:
+                break
+        header = parse_RINEX2_header(header_lines)
+        if 'obs_types' not in header.keys():
+            raise Exception('RINEX header must contain `# / TYPES OF OBS.` and `header` dict from `parse_parse_RINEX2_header` must contain corresponding list `obs_types`')
+        sat_ids, index, values, time, obs_types = _decode_RINEX2_obs_lines(f, header['obs_types'], start=start,
+                                                                           end=end, interval=interval)
+    return header, sat_ids, index, values, time, obs_types
@@ -1,6 +1,15 @@
+import os
+import mmap
 import numpy
-from numpy import array, nan, datetime64, isnan, alltrue
-from datetime import datetime
+from numpy import array, nan, datetime64, isnan, zeros, where, concatenate, \
+    uint8, uint16, uint32, uint64, int64
+from datetime import datetime, timedelta, date
+from itertools import islice, repeat
+from functools import lru_cache
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from .compression import open_compressed, detect_compression
 
 # RINEX 3.03
 CONSTELLATION_LETTERS = {
@@ -214,6 +223,9 @@ BAND_AND_CHANNEL_MAPPINGS = {
     }
 }
 
+# layouts of `observations` returned by `parse_RINEX3_obs_file`
+RINEX3_OBS_OUTPUTS = ('tree', 'lazy', 'columns', 'cube')
+
 PREFERRED_BAND_TRIPLETS = {
     'GPS': ('L1', 'L2', 'L5'),
     'GLONASS': ('G1', 'G2', 'G3'),
@@ -323,6 +335,9 @@ def parse_RINEX3_header(lines):
             elif header_label == 'APPROX POSITION XYZ':
                 header['approx_position_xyz'] = \
                     (parse_value(line[0:14]), parse_value(line[14:28]), parse_value(line[28:42]))
+            elif header_label == 'ANTENNA: DELTA H/E/N':
+                header['antenna_delta_hen'] = \
+                    (parse_value(line[0:14]), parse_value(line[14:28]), parse_value(line[28:42]))
             elif header_label == 'SYS / # / OBS TYPES':
                 system_letter = line[0:3].strip()
                 number_of_obs = parse_value(line[3:6], int)
@@ -449,7 +464,855 @@ def parse_RINEX3_obs_data(lines, system_obs_types):
         pass
     return data, time
 
-def transform_values_from_RINEX3_obs(data, frequency_numbers=None, convert_all_zero_to_nan=True):
+def _fixed_width_lines(lines, width):
+    '''
+    Packs `lines` (str or bytes) into a `(len(lines), width)` uint8
+    array.  Longer lines are truncated and shorter lines are padded
+    with null bytes, which the field decoders treat as blanks.
+    '''
+    arr = numpy.array(lines, dtype='S{0}'.format(width))
+    return arr.view(uint8).reshape(len(arr), width)
+
+def _combine_digits(digits):
+    '''
+    Given uint8 array `digits` of shape `(n, width)` with values
+    0-9, returns the int64 numbers they spell (most significant
+    digit first).  Adjacent columns are merged pairwise so that
+    only `log2(width)` array operations are needed.
+    '''
+    values, base = digits, 10
+    while values.shape[1] > 1:
+        if values.shape[1] % 2:
+            values = numpy.hstack((zeros((len(values), 1), values.dtype), values))
+        for dtype in (uint8, uint16, uint32, int64):
+            if base * base <= numpy.iinfo(dtype).max + 1:
+                break
+        values = values.astype(dtype, copy=False)
+        values = values[:, 0::2] * dtype(base) + values[:, 1::2]
+        base *= base
+    return values[:, 0].astype(int64)
+
+def _parse_fixed_width_floats(chars, err_val=nan):
+    '''
+    ------------------------------------------------------------
+    Vectorized counterpart of `parse_value` for fixed-width
+    decimal fields.
+    
+    Input
+    -----
+    `chars` -- uint8 array whose last axis holds the characters
+        of each field (e.g. shape `(n_lines, n_obs, 14)`)
+    `err_val` (default nan) -- value for blank or malformed
+        fields
+    
+    Output
+    ------
+    float array with the shape of `chars` minus its last axis
+    
+    Note: digits are accumulated into an integer mantissa that is
+    divided once by a power of ten, so values are identical to
+    `float()` for fields of up to 15 digits.
+    '''
+    shape, width = chars.shape[:-1], chars.shape[-1]
+    chars = numpy.ascontiguousarray(chars).reshape(-1, width)
+    digits = chars - uint8(48)
+    is_digit = digits < 10
+    digits *= is_digit
+    non_blank = chars > 32
+    is_point = chars == 46
+    is_minus = chars == 45
+    is_sign = is_minus | (chars == 43)
+    is_other = non_blank & ~(is_digit | is_point | is_sign)
+    run_starts = non_blank.copy()
+    run_starts[:, 1:] &= ~non_blank[:, :-1]
+    def count(mask):
+        return mask.view(uint8).sum(axis=1, dtype=int64)
+    position = numpy.arange(width)
+    first = run_starts.view(uint8) @ position
+    last = first + count(non_blank) - 1
+    n_points, n_signs = count(is_point), count(is_sign)
+    valid = (count(run_starts) == 1) & (count(is_other) == 0) & (count(is_digit) > 0)
+    valid &= (n_points <= 1) & (n_signs <= 1)
+    valid &= (n_signs == 0) | (is_sign.view(uint8) @ position == first)
+    last = numpy.clip(where(valid, last, width - 1), 0, width - 1)
+    # a point counts as a zero digit and is removed from the mantissa
+    number = _combine_digits(digits) // 10 ** (width - 1 - last)
+    n_decimals = where(n_points == 1, last - is_point.view(uint8) @ position, 0)
+    scale = 10 ** n_decimals
+    mantissa = where(n_points == 1, number // (10 * scale) * scale + number % scale, number)
+    values = mantissa / 10.0 ** n_decimals
+    values = where(count(is_minus) > 0, -values, values)
+    values[~valid] = err_val
+    return values.reshape(shape)
+
+def _field_bits(mask):
+    '''Packs boolean `mask` of shape `(n, 16)` into one uint16 per row (bit i = column i).'''
+    return numpy.packbits(mask.ravel(), bitorder='little').view('<u2')
+
+F14_3_POINT_BIT = 1 << 10
+F14_3_BITS = (1 << 14) - 1
+
+def _parse_RINEX3_obs_fields(fields, chunk_size=16384, out=None):
+    '''
+    ------------------------------------------------------------
+    Decodes RINEX 3 observation fields, each an F14.3 value
+    followed by the LLI and SSI flags.
+    
+    Input
+    -----
+    `fields` -- uint8 array of shape `(..., 16)`
+    `chunk_size` (default 16384) -- number of fields decoded per
+        pass, so that the intermediate arrays stay in cache
+    `out` (default None) -- optional float array with the shape
+        of `fields` minus its last axis to decode into
+    
+    Output
+    ------
+    float array with the shape of `fields` minus its last axis;
+    blank fields are NaN
+    
+    Note: fields laid out as the standard right-aligned F14.3
+    are decoded by merging digit bytes within 64-bit words.  Any
+    other non-blank field is handed to `_parse_fixed_width_floats`.
+    '''
+    shape = fields.shape[:-1]
+    fields = numpy.ascontiguousarray(fields).reshape(-1, 16)
+    if out is None:
+        out = numpy.empty(shape)
+    values = out.reshape(-1)
+    for i0 in range(0, len(fields), chunk_size):
+        chunk = fields[i0:i0 + chunk_size]
+        is_digit = (chunk - uint8(48)) < 10
+        blank = _field_bits(chunk <= 32) & F14_3_BITS
+        minus = _field_bits(chunk == 45) & F14_3_BITS
+        point = _field_bits(chunk == 46) & F14_3_BITS
+        digit = _field_bits(is_digit) & F14_3_BITS
+        # `[blanks][-]digits.ddd`, i.e. the blanks form the low bits
+        conforming = (point == F14_3_POINT_BIT) & ((blank & (blank + 1)) == 0)
+        conforming &= (minus == 0) | (minus == blank + 1)
+        conforming &= digit == (F14_3_BITS & ~(blank | minus | point))
+        is_blank = blank == F14_3_BITS
+        # merge digit pairs in both 8-character words, then quads and
+        # octets in the first; the second holds `dd.ddd` and the flags
+        words = (chunk * is_digit).view('<u8') & uint64(0x0F0F0F0F0F0F0F0F)
+        words = words * uint64(10 * 2 ** 8 + 1) >> uint64(8)
+        integer = (words[:, 0] & uint64(0x00FF00FF00FF00FF)) * uint64(100 * 2 ** 16 + 1) >> uint64(16)
+        integer = (integer & uint64(0x0000FFFF0000FFFF)) * uint64(10000 * 2 ** 32 + 1) >> uint64(32)
+        tail = words[:, 1]
+        mantissa = (integer * uint64(100) + (tail & uint64(0xFF))) * uint64(1000) \
+            + (tail >> uint64(16) & uint64(0xFF)) * uint64(100) + (tail >> uint64(32) & uint64(0xFF))
+        chunk_values = mantissa / where(minus != 0, -1000.0, 1000.0)
+        chunk_values[is_blank] = nan
+        irregular = numpy.flatnonzero(~conforming & ~is_blank)
+        if len(irregular) > 0:
+            chunk_values[irregular] = _parse_fixed_width_floats(chunk[irregular, :14])
+        values[i0:i0 + chunk_size] = chunk_values
+    return out
+
+def _parse_fixed_width_ints(chars):
+    '''
+    Given uint8 array `chars` of shape `(n, width)` holding
+    right-aligned unsigned integer fields, returns their int64
+    values (blank fields are 0).
+    '''
+    digits = chars - uint8(48)
+    digits *= digits < 10
+    return _combine_digits(digits)
+
+def _parse_fixed_width_exponent_floats(chars, err_val=nan):
+    '''
+    Counterpart of `_parse_fixed_width_floats` for fields in
+    exponent notation (e.g. `E19.12`, or `D19.12` with a Fortran
+    `D` exponent), which are converted by NumPy's string to float
+    conversion and so are identical to `float()`.  Blank or
+    malformed fields are `err_val`.
+    '''
+    shape, width = chars.shape[:-1], chars.shape[-1]
+    fields = numpy.array(chars, dtype=uint8).reshape(-1, width)
+    fields[(fields | uint8(32)) == 100] = ord('E')  # 'D' or 'd'
+    is_blank = ~(fields > 32).any(axis=1)
+    fields[is_blank, :] = 32
+    fields[is_blank, :min(width, 3)] = numpy.frombuffer(b'nan', uint8)[:width]
+    fields = fields.view('S{0}'.format(width)).ravel()
+    try:
+        values = fields.astype(float)
+    except ValueError:
+        values = array([parse_value(field.decode(errors='replace'), err_val=err_val) for field in fields])
+    values[is_blank] = err_val
+    return values.reshape(shape)
+
+def _calendar_to_datetime64(year, month, day, hour, minute, seconds):
+    '''Converts arrays of calendar fields to datetime64[us] times.'''
+    # same truncation to microseconds as `parse_RINEX3_obs_data`
+    microseconds = (1e6 * (seconds % 1)).astype(int64)
+    time = (year - 1970).astype('datetime64[Y]') + (month - 1).astype('timedelta64[M]')
+    time = time.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    time = time + (hour * 3600 + minute * 60 + seconds.astype(int64)).astype('timedelta64[s]')
+    return time + microseconds.astype('timedelta64[us]')
+
+def _parse_RINEX3_epoch_records(chars):
+    '''
+    Given uint8 array `chars` of `>` epoch record lines, returns
+    `time` (datetime64[us]), `flag`, and `num_sats` arrays.
+    '''
+    year, month, day, hour, minute = \
+        (_parse_fixed_width_ints(chars[:, i0:i1]) for i0, i1 in ((2, 6), (7, 9), (10, 12), (13, 15), (16, 18)))
+    seconds = _parse_fixed_width_floats(chars[:, 18:29], err_val=0.)
+    flag, num_sats = _parse_fixed_width_ints(chars[:, 30:32]), _parse_fixed_width_ints(chars[:, 32:35])
+    return _calendar_to_datetime64(year, month, day, hour, minute, seconds), flag, num_sats
+
+def select_RINEX3_obs_types(system_obs_types, systems=None, obs_types=None, bands=None, observables=None):
+    '''
+    ------------------------------------------------------------
+    Restricts `system_obs_types` to a selection of systems and
+    observations.  Each criterion that is not None must match
+    (criteria are combined with AND, entries of one criterion
+    with OR).
+    
+    Input
+    -----
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `systems` (default None) -- system letters (e.g. 'G') or
+        constellation names (e.g. 'GPS')
+    `obs_types` (default None) -- RINEX observation codes or
+        code prefixes, e.g. 'C1C', 'L1' or 'C'
+    `bands` (default None) -- band names as listed in
+        `BAND_AND_CHANNEL_MAPPINGS`, e.g. 'L1' or 'E5a'
+    `observables` (default None) -- observation names as listed
+        in `OBSERVATION_LETTERS`, e.g. 'pseudorange'
+    
+    Output
+    ------
+    dictionary of format:
+        {<system_letter>: [<obs_id>, ...]}
+    holding only the selected observations, in header order;
+    systems without any selected observation are dropped
+    '''
+    if systems is not None:
+        letters = {letter for letter, name in CONSTELLATION_LETTERS.items() if letter in systems or name in systems}
+    if observables is not None:
+        unknown = set(observables) - set(OBSERVATION_LETTERS.values())
+        if len(unknown) > 0:
+            raise Exception('Unknown observables: {0}'.format(sorted(unknown)))
+        obs_letters = {letter for letter, name in OBSERVATION_LETTERS.items() if name in observables}
+    selected = {}
+    for system_letter, system_types in system_obs_types.items():
+        if systems is not None and system_letter not in letters:
+            continue
+        mapping = BAND_AND_CHANNEL_MAPPINGS.get(CONSTELLATION_LETTERS.get(system_letter), {})
+        system_selected = []
+        for obs_id in system_types:
+            if obs_types is not None and not any(obs_id.startswith(code) for code in obs_types):
+                continue
+            if observables is not None and obs_id[:1] not in obs_letters:
+                continue
+            if bands is not None and mapping.get(obs_id[1:2], {}).get('band') not in bands:
+                continue
+            system_selected.append(obs_id)
+        if len(system_selected) > 0:
+            selected[system_letter] = system_selected
+    return selected
+
+def _obs_type_positions(system_obs_types, selected_obs_types=None):
+    '''
+    Returns `{<system_letter>: (<obs_types>, <positions>)}` where
+    `positions` are the field numbers of the decoded `obs_types`
+    on the satellite lines of that system.
+    '''
+    if selected_obs_types is None:
+        return {system_letter: (obs_types, numpy.arange(len(obs_types)))
+                for system_letter, obs_types in system_obs_types.items()}
+    return {system_letter: (obs_types, array([system_obs_types[system_letter].index(obs_id) for obs_id in obs_types], dtype=int))
+            for system_letter, obs_types in selected_obs_types.items()}
+
+def _decode_RINEX3_obs_block(lines, system_obs_types, epoch_index_offset=0, columns=None, selected_obs_types=None):
+    '''
+    ------------------------------------------------------------
+    Decodes a block of RINEX 3 observation lines that contains
+    only whole epochs.
+    
+    Input
+    -----
+    `lines` -- data lines (str or bytes)
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `epoch_index_offset` (default 0) -- index of the block's
+        first epoch
+    `columns` (default None) -- optional dictionary of format:
+        {<system_letter>: _ObsColumns}
+        whose buffers the decoded lines are appended to
+    `selected_obs_types` (default None) -- subset of
+        `system_obs_types` to decode, see
+        `select_RINEX3_obs_types`; lines of other systems are
+        skipped and only the selected fields are converted
+
+    Output
+    ------
+    `systems` -- dictionary of format:
+        {<system_letter>: (<sat_ids>, <index>, <values>)}
+        where `sat_ids` is an `S3` array with one entry per
+        satellite line, `index` the epoch index of each line and
+        `values` the decoded `(n_lines, n_obs)` float array
+        (views into `columns` if given) with one column per
+        (selected) observation
+    `time` -- datetime64[us] array of the block's epochs
+    `flag` -- epoch flag of each epoch
+    '''
+    positions = _obs_type_positions(system_obs_types, selected_obs_types)
+    # fields past the last selected one are never packed
+    max_fields = max([p[-1] + 1 for _, p in positions.values() if len(p) > 0] + [0])
+    chars = _fixed_width_lines(lines, max(3 + 16 * max_fields, 35))
+    is_epoch = chars[:, 0] == ord('>')
+    epoch_lines = numpy.flatnonzero(is_epoch)
+    time, flag, num_sats = _parse_RINEX3_epoch_records(chars[epoch_lines])
+    # flags 2-5 introduce event records (header lines, not satellites)
+    is_obs_epoch = (flag < 2) | (flag > 5)
+    line_epoch = numpy.cumsum(is_epoch) - 1
+    is_sat = (line_epoch >= 0) & ~is_epoch
+    sat_lines = numpy.flatnonzero(is_sat)
+    sat_epoch = line_epoch[sat_lines]
+    in_epoch = (sat_lines - epoch_lines[sat_epoch] <= num_sats[sat_epoch]) & is_obs_epoch[sat_epoch]
+    sat_lines, sat_epoch = sat_lines[in_epoch], sat_epoch[in_epoch]
+    # renumber epochs so that event records do not occupy an index
+    epoch_index = numpy.cumsum(is_obs_epoch) - 1 + epoch_index_offset
+    sat_chars = chars[sat_lines, :3].copy()
+    # some writers use a space instead of zero in sat ids, e.g. 'G 1'
+    sat_chars[sat_chars <= 32] = ord('0')
+    sat_ids = sat_chars.view('S3').ravel()
+    systems = {}
+    for system_letter, (obs_types, obs_positions) in positions.items():
+        rows = numpy.flatnonzero(sat_chars[:, 0] == ord(system_letter))
+        num_fields = obs_positions[-1] + 1 if len(obs_positions) > 0 else 0
+        fields = chars[sat_lines[rows], 3:3 + 16 * num_fields].reshape(len(rows), num_fields, 16)
+        if len(obs_positions) < num_fields:
+            fields = fields[:, obs_positions]
+        if columns is None:
+            block = (sat_ids[rows], epoch_index[sat_epoch[rows]], numpy.empty((len(rows), len(obs_types))))
+        else:
+            block = columns[system_letter].extend(len(rows))
+            block[0][:] = sat_ids[rows]
+            block[1][:] = epoch_index[sat_epoch[rows]]
+        _parse_RINEX3_obs_fields(fields, out=block[2])
+        systems[system_letter] = block
+    return systems, time[is_obs_epoch], flag[is_obs_epoch]
+
+class _GrowableArray:
+    '''
+    Preallocated array that is appended to along its first axis
+    and grows geometrically, so that `n` rows cost O(n) copies.
+    '''
+    def __init__(self, row_shape=(), dtype=float, capacity=1024):
+        self.buffer = numpy.empty((capacity,) + tuple(row_shape), dtype=dtype)
+        self.size = 0
+
+    def extend(self, num_rows):
+        '''Reserves `num_rows` rows at the end and returns them as a view to fill.'''
+        size = self.size + num_rows
+        if size > len(self.buffer):
+            buffer = numpy.empty((max(size, 2 * len(self.buffer)),) + self.buffer.shape[1:], dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        view = self.buffer[self.size:size]
+        self.size = size
+        return view
+
+    def append(self, rows):
+        self.extend(len(rows))[:] = rows
+
+    @property
+    def array(self):
+        return self.buffer[:self.size]
+
+class _ObsColumns:
+    '''Growable `sat_ids`, `index` and `values` columns of the satellite lines of one system.'''
+    def __init__(self, num_obs, capacity=1024):
+        self.sat_ids = _GrowableArray((), 'S3', capacity)
+        self.index = _GrowableArray((), int64, capacity)
+        self.values = _GrowableArray((num_obs,), float, capacity)
+
+    def extend(self, num_rows):
+        return self.sat_ids.extend(num_rows), self.index.extend(num_rows), self.values.extend(num_rows)
+
+def _satellite_groups(sat_ids):
+    '''
+    Groups the lines of `sat_ids` (an `S3` array) by satellite.
+    Returns `(order, starts, stops)` such that
+    `order[starts[k]:stops[k]]` are the lines of the k-th
+    satellite, in their original order.
+    '''
+    # the two PRN characters of an `S3` id as one (radix-sortable) integer
+    prn_keys = numpy.ascontiguousarray(sat_ids).view(uint8).reshape(-1, 3)[:, 1:].copy().view('>u2').ravel()
+    order = numpy.argsort(prn_keys, kind='stable')
+    _, starts = numpy.unique(prn_keys[order], return_index=True)
+    stops = concatenate((starts[1:], [len(order)])).astype(int)
+    return order, starts, stops
+
+def _split_by_satellite(sat_ids, index, values, obs_types):
+    '''
+    Splits the decoded lines of one system into the per-satellite
+    `{'index': ndarray, <obs_id>: ndarray}` dictionaries.
+    '''
+    order, starts, stops = _satellite_groups(sat_ids)
+    data = {}
+    for i0, i1 in zip(starts, stops):
+        rows = order[i0:i1]
+        sat_values = values[rows]
+        sat_data = {'index': index[rows]}
+        for j, obs_type in enumerate(obs_types):
+            sat_data[obs_type] = sat_values[:, j]
+        data[sat_ids[rows[0]].decode()] = sat_data
+    return data
+
+def _epoch_aligned_blocks(lines, block_size):
+    '''
+    Yields `(start, stop)` line ranges of about `block_size` lines
+    that each begin at a `>` epoch record.
+    '''
+    i0 = 0
+    while i0 < len(lines):
+        i1 = min(i0 + block_size, len(lines))
+        while i1 < len(lines) and lines[i1][:1] not in ('>', b'>'):
+            i1 += 1
+        yield i0, i1
+        i0 = i1
+
+def _decode_RINEX3_obs_lines(lines, system_obs_types, block_size=50000, selected_obs_types=None):
+    '''
+    Decodes data lines block by block into one `_ObsColumns` per
+    (selected) system.  Returns `(columns, time)`.
+    '''
+    if not isinstance(lines, list):
+        lines = list(lines)
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    columns = {system_letter: _ObsColumns(len(obs_types)) for system_letter, obs_types in selected_obs_types.items()}
+    time = _GrowableArray((), 'datetime64[us]')
+    for i0, i1 in _epoch_aligned_blocks(lines, block_size):
+        _, block_time, _ = _decode_RINEX3_obs_block(lines[i0:i1], system_obs_types, time.size, columns, selected_obs_types)
+        time.append(block_time)
+    return columns, time.array
+
+def parse_RINEX3_obs_data_columnar(lines, system_obs_types, block_size=50000, selected_obs_types=None):
+    '''
+    ------------------------------------------------------------
+    Decodes RINEX 3 observation data lines into one columnar
+    table per system.  Blocks of lines are decoded with the
+    vectorized decoder straight into preallocated buffers that
+    grow geometrically, so no per-satellite lists are built.
+    
+    Input
+    -----
+    `lines` -- data lines (str or bytes) from RINEX observation
+        file
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `block_size` (default 50000) -- approximate number of lines
+        packed at once; bounds the size of intermediate arrays
+    `selected_obs_types` (default None) -- subset of
+        `system_obs_types` to decode, see
+        `select_RINEX3_obs_types`
+    
+    Output
+    ------
+    `columns` -- dictionary of format:
+        {
+            <system_letter>: {
+                'sat_ids': ndarray,
+                'index': ndarray,
+                'obs_types': [<obs_id>, ...],
+                'values': ndarray
+            }
+        }
+        with one row per satellite line; `values` has one column
+        per entry of `obs_types`
+    `time` -- ndarray (datetime64[us]) of epoch times
+    '''
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    columns, time = _decode_RINEX3_obs_lines(lines, system_obs_types, block_size, selected_obs_types)
+    return _obs_columns_to_tables(columns, selected_obs_types), time
+
+def _obs_columns_to_tables(columns, selected_obs_types):
+    '''Converts `_ObsColumns` buffers to the tables of `parse_RINEX3_obs_data_columnar`.'''
+    tables = {}
+    for system_letter, system_columns in columns.items():
+        if system_columns.index.size == 0:
+            continue
+        unique_ids, inverse = numpy.unique(system_columns.sat_ids.array, return_inverse=True)
+        tables[system_letter] = {
+            'sat_ids': unique_ids.astype(str)[inverse],
+            'index': system_columns.index.array,
+            'obs_types': list(selected_obs_types[system_letter]),
+            'values': system_columns.values.array,
+        }
+    return tables
+
+def _obs_columns_to_tree(columns, selected_obs_types):
+    '''Converts `_ObsColumns` buffers to the per-satellite dictionaries of `parse_RINEX3_obs_data_vectorized`.'''
+    data = {}
+    for system_letter, system_columns in columns.items():
+        data.update(_split_by_satellite(system_columns.sat_ids.array, system_columns.index.array,
+                                        system_columns.values.array, selected_obs_types[system_letter]))
+    return data
+
+def RINEX3_obs_columns_to_cube(columns, num_epochs):
+    '''
+    ------------------------------------------------------------
+    Scatters the columnar tables from
+    `parse_RINEX3_obs_data_columnar` into one dense array per
+    system, so that time-aligned satellites can be handled with
+    plain array operations.
+    
+    Input
+    -----
+    `columns` -- output of `parse_RINEX3_obs_data_columnar`
+    `num_epochs` -- number of epochs (length of `time`)
+    
+    Output
+    ------
+    dictionary of format:
+        {
+            <system_letter>: {
+                'sat_ids': [<sat_id>, ...],
+                'obs_types': [<obs_id>, ...],
+                'values': ndarray,
+                'mask': ndarray
+            }
+        }
+    where `values` has shape `(num_epochs, n_sats, n_obs)` and is
+    NaN wherever the boolean `(num_epochs, n_sats)` `mask` is
+    False, i.e. the satellite was not observed at that epoch
+    '''
+    cube = {}
+    for system_letter, table in columns.items():
+        sat_ids, sat_columns = numpy.unique(table['sat_ids'], return_inverse=True)
+        values = numpy.full((num_epochs, len(sat_ids), len(table['obs_types'])), nan)
+        mask = zeros((num_epochs, len(sat_ids)), dtype=bool)
+        values[table['index'], sat_columns] = table['values']
+        mask[table['index'], sat_columns] = True
+        cube[system_letter] = {
+            'sat_ids': list(sat_ids), 'obs_types': list(table['obs_types']), 'values': values, 'mask': mask
+        }
+    return cube
+
+def parse_RINEX3_obs_data_vectorized(lines, system_obs_types, block_size=50000, selected_obs_types=None):
+    '''
+    ------------------------------------------------------------
+    Vectorized equivalent of `parse_RINEX3_obs_data`.  Instead of
+    walking each satellite line in Python, the lines of many
+    epochs are packed into a fixed-width byte array and all
+    fields of a `system_obs_types` layout are decoded at once
+    with NumPy.
+    
+    Input
+    -----
+    `lines` -- data lines (str or bytes) from RINEX observation
+        file
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `block_size` (default 50000) -- approximate number of lines
+        packed at once; bounds the size of intermediate arrays
+    `selected_obs_types` (default None) -- subset of
+        `system_obs_types` to decode, see
+        `select_RINEX3_obs_types`
+    
+    Output
+    ------
+    `data` -- dictionary of format:
+        {<sat_id>: {'index': ndarray, <obs_id>: ndarray}}
+    `time` -- ndarray (datetime64[us]) of epoch times
+    
+    Note: only the F14.3 value of each 16-character field is
+    decoded; the LLI and SSI flags are ignored.  Event records
+    (epoch flags 2-5) are skipped and do not occupy an index.
+    '''
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    columns, time = _decode_RINEX3_obs_lines(lines, system_obs_types, block_size, selected_obs_types)
+    return _obs_columns_to_tree(columns, selected_obs_types), time
+
+def _iter_epoch_line_blocks(lines, epochs_per_block):
+    '''
+    Reads an iterable of RINEX 3 observation data lines and yields
+    lists of lines holding `epochs_per_block` whole epochs.  Event
+    records (flags 2-5) stay with the block they appear in and are
+    not counted.
+    '''
+    block, num_epochs = [], 0
+    for line in lines:
+        if line[:1] == '>' and line[31:32] not in ('2', '3', '4', '5'):
+            if num_epochs == epochs_per_block:
+                yield block
+                block, num_epochs = [], 0
+            num_epochs += 1
+        block.append(line)
+    if len(block) > 0:
+        yield block
+
+def iter_RINEX3_obs_data(lines, system_obs_types, epochs_per_chunk=None, epochs_per_block=1000, selected_obs_types=None):
+    '''
+    ------------------------------------------------------------
+    Generator counterpart of `parse_RINEX3_obs_data`.  Lines are
+    consumed incrementally and decoded `epochs_per_block` epochs
+    at a time with the vectorized decoder, so memory use does not
+    grow with the length of the file.
+    
+    Input
+    -----
+    `lines` -- iterable of data lines from RINEX observation
+        file, e.g. an open file object positioned after the
+        header
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `epochs_per_chunk` (default None) -- if None, yields one
+        epoch at a time; otherwise yields chunks of this many
+        epochs
+    `epochs_per_block` (default 1000) -- number of epochs decoded
+        at once when yielding single epochs
+    `selected_obs_types` (default None) -- subset of
+        `system_obs_types` to decode, see
+        `select_RINEX3_obs_types`
+    
+    Output
+    ------
+    if `epochs_per_chunk` is None, yields `(time, flag, sats)`
+    for each epoch, where `sats` is a dictionary of format:
+        {<sat_id>: ndarray}
+    holding the observation values in the order given by
+    `selected_obs_types[<sat_id>[0]]` (or `system_obs_types`).  Otherwise yields
+    dictionaries of format:
+        {
+            'time': ndarray,
+            'flag': ndarray,
+            'satellites': {
+                <sat_id>: {'index': ndarray, <obs_id>: ndarray}
+            }
+        }
+    where `index` refers to the epochs of the chunk.
+    
+    Note: `time` is in GPST seconds
+    '''
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    block_epochs = epochs_per_block if epochs_per_chunk is None else epochs_per_chunk
+    for block in _iter_epoch_line_blocks(lines, block_epochs):
+        systems, time, flag = _decode_RINEX3_obs_block(block, system_obs_types, selected_obs_types=selected_obs_types)
+        time = _datetime64_to_gps_seconds(time)
+        if epochs_per_chunk is not None:
+            satellites = {}
+            for system_letter, (sat_ids, index, values) in systems.items():
+                satellites.update(_split_by_satellite(sat_ids, index, values, selected_obs_types[system_letter]))
+            yield {'time': time, 'flag': flag, 'satellites': satellites}
+            continue
+        # lines of each system are in epoch order, so each epoch is a contiguous range
+        bounds = {system_letter: numpy.searchsorted(index, numpy.arange(len(time) + 1))
+                  for system_letter, (_, index, _) in systems.items()}
+        for k in range(len(time)):
+            sats = {}
+            for system_letter, (sat_ids, _, values) in systems.items():
+                for i in range(bounds[system_letter][k], bounds[system_letter][k + 1]):
+                    sats[sat_ids[i].decode()] = values[i]
+            yield time[k], flag[k], sats
+
+def _decode_RINEX3_obs_byte_range(filepath, byte_range, system_obs_types, selected_obs_types=None):
+    '''
+    Worker of `_decode_RINEX3_obs_file_parallel`: decodes the data
+    lines in `byte_range` of the file.  Returns `(systems, time)`
+    where `systems` maps each system letter to its `(sat_ids,
+    index, values)` arrays.
+    '''
+    with open(filepath, 'rb') as f:
+        f.seek(byte_range[0])
+        lines = f.read(byte_range[1] - byte_range[0]).splitlines()
+    columns, time = _decode_RINEX3_obs_lines(lines, system_obs_types, selected_obs_types=selected_obs_types)
+    systems = {system_letter: (system_columns.sat_ids.array, system_columns.index.array, system_columns.values.array)
+               for system_letter, system_columns in columns.items()}
+    return systems, time
+
+def _decode_RINEX3_obs_file_parallel(filepath, system_obs_types, selected_obs_types=None, processes=None):
+    '''
+    Splits the data section of a RINEX 3 observation file at `>`
+    epoch records into `processes` byte ranges, decodes them in a
+    process pool and stitches the results, shifting the epoch
+    index of each range by the number of epochs before it.
+    Returns `(columns, time)` as `_decode_RINEX3_obs_lines` does.
+    '''
+    if processes is None:
+        processes = os.cpu_count()
+    if selected_obs_types is None:
+        selected_obs_types = system_obs_types
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header_end = _find_RINEX_header_end(buf)
+            bounds = [header_end, len(buf)]
+            for k in range(1, processes):
+                i = buf.find(b'\n>', header_end + (len(buf) - header_end) * k // processes - 1)
+                bounds.append(len(buf) if i < 0 else i + 1)
+    bounds = sorted(set(bounds))
+    byte_ranges = list(zip(bounds[:-1], bounds[1:]))
+    with ProcessPoolExecutor(processes) as executor:
+        results = list(executor.map(_decode_RINEX3_obs_byte_range, repeat(filepath), byte_ranges,
+                                    repeat(system_obs_types), repeat(selected_obs_types)))
+    num_rows = {system_letter: sum(len(systems[system_letter][1]) for systems, _ in results)
+                for system_letter in selected_obs_types.keys()}
+    columns = {system_letter: _ObsColumns(len(obs_types), max(num_rows[system_letter], 1))
+               for system_letter, obs_types in selected_obs_types.items()}
+    epoch_index_offset = 0
+    for systems, time in results:
+        for system_letter, (sat_ids, index, values) in systems.items():
+            block = columns[system_letter].extend(len(index))
+            block[0][:] = sat_ids
+            block[1][:] = index + epoch_index_offset
+            block[2][:] = values
+        epoch_index_offset += len(time)
+    time = concatenate([time for _, time in results]) if len(results) > 0 else array([], dtype='datetime64[us]')
+    return columns, time
+
+def _datetime64_to_gps_seconds(time):
+    '''Converts datetime64[us] epoch times to GPST seconds.'''
+    gps_epoch = datetime64(datetime(1980, 1, 6))
+    return (array(time) - gps_epoch).astype(float) / 1e6  # dt64 is in microseconds
+
+def _gps_seconds_to_time_tuple(gps_seconds):
+    '''
+    Converts GPST seconds to a `(year, month, day, hour, minute,
+    seconds)` tuple that compares in the same order as time.
+    '''
+    t = datetime(1980, 1, 6) + timedelta(seconds=gps_seconds)
+    return (t.year, t.month, t.day, t.hour, t.minute, t.second + t.microsecond / 1e6)
+
+# epochs within this many seconds of the decimation grid are kept
+DECIMATION_TOLERANCE = 5e-3
+GPS_EPOCH_ORDINAL = date(1980, 1, 6).toordinal()
+
+def _is_on_interval_grid(year, month, day, hour, minute, seconds, interval):
+    '''Whether the epoch (calendar fields in GPST) is a multiple of `interval` GPST seconds, to within `DECIMATION_TOLERANCE`.'''
+    t = (date(year, month, day).toordinal() - GPS_EPOCH_ORDINAL) * 86400 + hour * 3600 + minute * 60 + seconds
+    remainder = t % interval
+    return min(remainder, interval - remainder) <= DECIMATION_TOLERANCE
+
+def _RINEX3_obs_lines_in_window(lines, start=None, end=None, interval=None):
+    '''
+    Returns the data lines of the epochs with `start <= time <
+    end` (GPST seconds, None leaves that side open) that are on
+    the grid of `interval` seconds, if given.  Other epochs are
+    skipped by their satellite count without decoding any field,
+    and `lines` is not consumed past the first epoch at or after
+    `end`.  Event records are kept if the preceding epoch is.
+    '''
+    if start is not None:
+        start = _gps_seconds_to_time_tuple(start)
+    if end is not None:
+        end = _gps_seconds_to_time_tuple(end)
+    if interval is not None and not interval > 0:
+        raise Exception('`interval` must be positive')
+    selected = []
+    keep = start is None
+    lines = iter(lines)
+    for line in lines:
+        if line[:1] != '>':
+            continue
+        num_records = int(line[32:35])
+        if line[31:32] not in ('2', '3', '4', '5'):
+            epoch = (int(line[2:6]), int(line[7:9]), int(line[10:12]), int(line[13:15]), int(line[16:18]), float(line[18:29]))
+            if end is not None and epoch >= end:
+                break
+            keep = (start is None or epoch >= start) and (interval is None or _is_on_interval_grid(*epoch, interval))
+        if keep:
+            selected.append(line)
+            selected.extend(islice(lines, num_records))
+        else:
+            deque(islice(lines, num_records), maxlen=0)
+    return selected
+
+def compile_RINEX3_obs_plan(system_obs_types, frequency_numbers=None):
+    '''
+    ------------------------------------------------------------
+    Compiles the observation layout of a RINEX 3 header into a
+    decoding plan, so that the band, channel, observable and
+    frequency of each observation code are looked up once per
+    header instead of once per satellite.  Plans are cached, so
+    files with identical headers share one plan.
+    
+    Input
+    -----
+    `system_obs_types` -- dictionary of the observations
+        reported at each epoch for each system letter
+    `frequency_numbers` (default None) -- GLONASS frequency
+        numbers obtained from RINEX header
+    
+    Output
+    ------
+    dictionary of format:
+        {
+            'columns': {
+                <system_letter>: {
+                    <obs_id>: (<band>, <channel_id>, <channel_desc>, <obs_name>, <frequency>)
+                }
+            },
+            'sat_frequencies': {<sat_id>: {<band>: <frequency>}}
+        }
+    where `frequency` is in Hz, or None for GLONASS FDMA bands
+    whose frequency is given per satellite in `sat_frequencies`
+    (NaN for satellites without a frequency number).  Codes that
+    are not listed in `BAND_AND_CHANNEL_MAPPINGS` map to None.
+    
+    Note: the plan is shared and must not be modified
+    '''
+    system_obs_types = tuple((system_letter, tuple(obs_types)) for system_letter, obs_types in system_obs_types.items())
+    frequency_numbers = tuple(sorted(frequency_numbers.items())) if frequency_numbers is not None else ()
+    return _compile_RINEX3_obs_plan(system_obs_types, frequency_numbers)
+
+@lru_cache(maxsize=256)
+def _compile_RINEX3_obs_plan(system_obs_types, frequency_numbers):
+    '''Cached worker of `compile_RINEX3_obs_plan`, taking the header fields as nested tuples.'''
+    columns = {}
+    fdma_bands = {}
+    for system_letter, obs_types in system_obs_types:
+        mapping = BAND_AND_CHANNEL_MAPPINGS.get(CONSTELLATION_LETTERS.get(system_letter), {})
+        system_columns = columns.setdefault(system_letter, {})
+        for obs_id in obs_types:
+            obs_letter, obs_band, obs_channel = (obs_id + '   ')[:3]
+            band_mapping = mapping.get(obs_band)
+            if band_mapping is None or obs_channel not in band_mapping['channel_ids'] or obs_letter not in OBSERVATION_LETTERS:
+                system_columns[obs_id] = None
+                continue
+            band, frequency = band_mapping['band'], band_mapping['frequency']  # originally in MHz
+            if callable(frequency):
+                fdma_bands.setdefault(system_letter, {})[band] = frequency
+                frequency = None
+            else:
+                frequency = frequency * 1e6
+            system_columns[obs_id] = (band, obs_channel, band_mapping['channel_ids'][obs_channel],
+                                      OBSERVATION_LETTERS[obs_letter], frequency)
+    sat_frequencies = {}
+    for sat_id, frequency_number in frequency_numbers:
+        bands = fdma_bands.get(sat_id[:1], {})
+        sat_frequencies[sat_id] = {band: frequency(frequency_number) * 1e6 for band, frequency in bands.items()}
+    return {'columns': columns, 'sat_frequencies': sat_frequencies}
+
+def _apply_RINEX3_obs_plan(sat_id, obs_arrays, plan):
+    '''
+    Nests the `(obs_id, ndarray)` pairs of one satellite by band,
+    channel and observable according to `plan`.
+    '''
+    columns = plan['columns'].get(sat_id[:1], {})
+    sat_frequencies = plan['sat_frequencies'].get(sat_id, {})
+    sat_data = {}
+    for obs_id, val_arr in obs_arrays:
+        column = columns.get(obs_id)
+        if column is None:
+            raise Exception('Unknown RINEX 3 observation code {0} for satellite {1}'.format(obs_id, sat_id))
+        band, obs_channel, channel_desc, obs_name, frequency = column
+        if band not in sat_data:
+            sat_data[band] = {'frequency': sat_frequencies.get(band, nan) if frequency is None else frequency}
+        if obs_channel not in sat_data[band]:
+            sat_data[band][obs_channel] = {'channel_desc': channel_desc}
+        sat_data[band][obs_channel][obs_name] = val_arr
+    return sat_data
+
+def transform_values_from_RINEX3_obs(data, frequency_numbers=None, convert_all_zero_to_nan=True, plan=None):
     '''
     ------------------------------------------------------------
     Transforms output from `parse_RINEX3_obs_data` to more
@@ -468,6 +1331,9 @@ def transform_values_from_RINEX3_obs(data, frequency_numbers=None, convert_all_z
         from RINEX header
     `convert_all_zero_to_nan` (default True) -- if an array of
         observations is all zero, sets values to nan
+    `plan` (default None) -- decoding plan from
+        `compile_RINEX3_obs_plan`; if None, it is compiled from
+        the observation codes in `data` and `frequency_numbers`
         
     Output:
     -------
@@ -485,40 +1351,131 @@ def transform_values_from_RINEX3_obs(data, frequency_numbers=None, convert_all_z
     Note: the third character of RINEX observation ID is
     used as `channel_id`
     '''
+    if plan is None:
+        system_obs_types = {}
+        for sat_id, sat_data in data.items():
+            obs_types = system_obs_types.setdefault(sat_id[0], [])
+            obs_types.extend(obs_id for obs_id in sat_data.keys() if obs_id != 'index' and obs_id not in obs_types)
+        plan = compile_RINEX3_obs_plan(system_obs_types, frequency_numbers)
     new_data = {}
-    for sat_id in data.keys():
-        new_data[sat_id] = {}
-        system_letter = sat_id[0]
-        constellation = CONSTELLATION_LETTERS[system_letter]
-        mapping = BAND_AND_CHANNEL_MAPPINGS[constellation]
-        for obs_id in data[sat_id].keys():
+    for sat_id, sat_data in data.items():
+        obs_arrays = []
+        for obs_id, values in sat_data.items():
             if obs_id == 'index':
-                new_data[sat_id]['index'] = array(data[sat_id]['index'], dtype=int)
                 continue
-            val_arr = array(data[sat_id][obs_id])
-            if convert_all_zero_to_nan and alltrue(val_arr == 0):
-                val_arr[:] = nan
-            if alltrue(isnan(val_arr)):
+            val_arr = numpy.asarray(values, dtype=float)
+            if convert_all_zero_to_nan and numpy.all(val_arr == 0):
                 continue
-            obs_letter, obs_band, obs_channel = obs_id
-            band = mapping[obs_band]['band']
-            frequency = mapping[obs_band]['frequency']  # originally in MHz
-            if constellation == 'GLONASS' and callable(frequency):
-                if frequency_numbers is not None and sat_id in frequency_numbers.keys():
-                    frequency = frequency(frequency_numbers[sat_id])
-                else:
-                    frequency = nan
-            channel_desc = mapping[obs_band]['channel_ids'][obs_channel]
-            obs_name = OBSERVATION_LETTERS[obs_letter]
-            if band not in new_data[sat_id].keys():
-                new_data[sat_id][band] = {'frequency': frequency * 1e6}
-            if obs_channel not in new_data[sat_id][band].keys():
-                new_data[sat_id][band][obs_channel] = {'channel_desc': channel_desc}
-            new_data[sat_id][band][obs_channel][obs_name] = array(data[sat_id][obs_id])
+            if numpy.all(isnan(val_arr)):
+                continue
+            obs_arrays.append((obs_id, val_arr))
+        new_data[sat_id] = {}
+        if 'index' in sat_data:
+            new_data[sat_id]['index'] = numpy.asarray(sat_data['index'], dtype=int)
+        new_data[sat_id].update(_apply_RINEX3_obs_plan(sat_id, obs_arrays, plan))
     return new_data
 
+def _obs_columns_to_transformed_tree(columns, plan, selected_obs_types, convert_all_zero_to_nan=True):
+    '''
+    Equivalent of `transform_values_from_RINEX3_obs` applied to
+    the output of `_obs_columns_to_tree`.  Whether a satellite's
+    observation is all NaN (or all zero) is found for all
+    satellites of a system at once.
+    '''
+    data = {}
+    for system_letter, system_columns in columns.items():
+        sat_ids = system_columns.sat_ids.array
+        if len(sat_ids) == 0:
+            continue
+        order, starts, stops = _satellite_groups(sat_ids)
+        index = system_columns.index.array[order]
+        values = system_columns.values.array[order]
+        is_empty = numpy.logical_and.reduceat(isnan(values), starts, axis=0)
+        if convert_all_zero_to_nan:
+            is_empty |= numpy.logical_and.reduceat(values == 0, starts, axis=0)
+        obs_types = selected_obs_types[system_letter]
+        for k, (i0, i1) in enumerate(zip(starts, stops)):
+            sat_id = sat_ids[order[i0]].decode()
+            obs_arrays = [(obs_type, values[i0:i1, j]) for j, obs_type in enumerate(obs_types) if not is_empty[k, j]]
+            data[sat_id] = {'index': index[i0:i1]}
+            data[sat_id].update(_apply_RINEX3_obs_plan(sat_id, obs_arrays, plan))
+    return data
+
+class LazySatelliteTree(Mapping):
+    '''
+    ------------------------------------------------------------
+    Read-only mapping from satellite ID to the per-satellite tree
+    of `transform_values_from_RINEX3_obs`, backed by the columnar
+    buffers of the decoder.  Satellites are only grouped when the
+    keys are first needed, and the tree of a satellite is built on
+    its first access and kept.  The lines of that satellite are
+    gathered once; its observation arrays are views into them.
+    
+    Input
+    -----
+    `columns` -- dictionary of `_ObsColumns` per system letter,
+        as returned by `_decode_RINEX3_obs_lines`
+    `plan` -- decoding plan from `compile_RINEX3_obs_plan`
+    `selected_obs_types` -- the (selected) observations decoded
+        for each system letter
+    `convert_all_zero_to_nan` (default True) -- if an array of
+        observations is all zero, leaves it out as if it were NaN
+    
+    Note: `dict(tree)` materializes the full tree
+    '''
+    def __init__(self, columns, plan, selected_obs_types, convert_all_zero_to_nan=True):
+        self._systems = {system_letter: (system_columns.sat_ids.array, system_columns.index.array,
+                                         system_columns.values.array)
+                         for system_letter, system_columns in columns.items() if system_columns.index.size > 0}
+        self._plan = plan
+        self._selected_obs_types = selected_obs_types
+        self._convert_all_zero_to_nan = convert_all_zero_to_nan
+        self._rows = None  # <sat_id>: (<system_letter>, <line numbers>)
+        self._satellites = {}
+
+    def _satellite_rows(self):
+        if self._rows is None:
+            rows = {}
+            for system_letter, (sat_ids, _, _) in self._systems.items():
+                order, starts, stops = _satellite_groups(sat_ids)
+                for i0, i1 in zip(starts, stops):
+                    rows[sat_ids[order[i0]].decode()] = (system_letter, order[i0:i1])
+            self._rows = rows
+        return self._rows
+
+    def __getitem__(self, sat_id):
+        sat_data = self._satellites.get(sat_id)
+        if sat_data is not None:
+            return sat_data
+        system_letter, rows = self._satellite_rows()[sat_id]
+        _, index, values = self._systems[system_letter]
+        sat_values = values[rows]
+        is_empty = isnan(sat_values).all(axis=0)
+        if self._convert_all_zero_to_nan:
+            is_empty |= (sat_values == 0).all(axis=0)
+        obs_arrays = [(obs_type, sat_values[:, j])
+                      for j, obs_type in enumerate(self._selected_obs_types[system_letter]) if not is_empty[j]]
+        sat_data = {'index': index[rows]}
+        sat_data.update(_apply_RINEX3_obs_plan(sat_id, obs_arrays, self._plan))
+        self._satellites[sat_id] = sat_data
+        return sat_data
+
+    def __iter__(self):
+        return iter(self._satellite_rows())
+
+    def __len__(self):
+        return len(self._satellite_rows())
+
+    def __contains__(self, sat_id):
+        return sat_id in self._satellite_rows()
+
+    def __repr__(self):
+        return '{0}({1} satellites, {2} built)'.format(type(self).__name__, len(self), len(self._satellites))
+
 
-def parse_RINEX3_obs_file(filepath, all_zero_to_nan=True, trim_obs_tree=True):
+def parse_RINEX3_obs_file(filepath, all_zero_to_nan=True, trim_obs_tree=True, output='tree',
+                          systems=None, obs_types=None, bands=None, observables=None, start=None, end=None,
+                          interval=None, processes=None):
     '''
     ------------------------------------------------------------
     Given the filepath to a RINEX observation file, parses and
@@ -526,11 +1483,39 @@ def parse_RINEX3_obs_file(filepath, all_zero_to_nan=True, trim_obs_tree=True):
     
     Input
     -----
-    `filepath` -- filepath to RINEX observation file
+    `filepath` -- filepath to RINEX observation file, which may
+        be compressed (see `compression.open_compressed`)
     `all_zero_to_nan` (default True) -- if an array of
         observationsis is all zeros, converts the values to NaN
     `trim_obs_tree` (default True) -- whether to remove channels
         and signals where all observations are NaN
+    `output` (default 'tree') -- layout of `observations`:
+        'tree' for the per-satellite tree below, 'lazy' for a
+        `LazySatelliteTree` that builds the same tree one
+        satellite at a time on access, 'columns' for the columnar
+        tables of `parse_RINEX3_obs_data_columnar`, or 'cube' for
+        the dense arrays of `RINEX3_obs_columns_to_cube`; the
+        latter two are stored under 'systems' instead of
+        'satellites'
+    `systems`, `obs_types`, `bands`, `observables` (default
+        None) -- optional selection passed to
+        `select_RINEX3_obs_types`; satellite lines of other
+        systems are skipped and unselected fields are never
+        converted
+    `start`, `end` (default None) -- GPST seconds bounding the
+        epochs to parse (`start <= time < end`); None leaves that
+        side open.  Epochs outside are skipped without decoding,
+        and the rest of the file is not read once an epoch past
+        `end` is reached
+    `interval` (default None) -- decimation interval in
+        seconds, e.g. 30 to read 1 Hz files as 30 s data; only
+        epochs on this grid of GPST are decoded, the others are
+        skipped right after their epoch record
+    `processes` (default None) -- if greater than 1, the data
+        section is split at epoch records into this many byte
+        ranges that are decoded in a process pool; the result is
+        identical to the serial one.  Not used together with
+        `start`/`end`/`interval` or for compressed files.
 
     Output
     ------
@@ -551,25 +1536,357 @@ def parse_RINEX3_obs_file(filepath, all_zero_to_nan=True, trim_obs_tree=True):
         
     Note: `time` in `observations` is in GPST seconds
     '''
-    with open(filepath, 'r') as f:
-        lines = list(f.readlines())
-    if len(lines) == 0:
-        raise Exception('Error when parsing RINEX 3 file.  The file appears to be empty.')
-    for i, line in enumerate(lines):
-        if line.find('END OF HEADER') >= 0:
-            break
-    header_lines = lines[:i + 1]
-    obs_lines = lines[i + 1:]
+    if output not in RINEX3_OBS_OUTPUTS:
+        raise Exception('`output` must be one of {0}'.format(', '.join(map(repr, RINEX3_OBS_OUTPUTS))))
+    header, columns, time, selected_obs_types = _read_RINEX3_obs_file(
+        filepath, systems, obs_types, bands, observables, start, end, interval, processes)
+    return header, _RINEX3_obs_output(columns, time, selected_obs_types, output, header.get('frequency_numbers'),
+                                      all_zero_to_nan)
+
+def _read_RINEX3_obs_file(filepath, systems=None, obs_types=None, bands=None, observables=None, start=None, end=None,
+                          interval=None, processes=None):
+    '''
+    Reads the header and decodes the data lines of a RINEX 3
+    observation file, see `parse_RINEX3_obs_file`.  Returns
+    `(header, columns, time, selected_obs_types)` with `columns`
+    and `time` as `_decode_RINEX3_obs_lines` returns them.
+    '''
+    with open_compressed(filepath) as f:
+        header_lines = []
+        for line in f:
+            header_lines.append(line)
+            if line.find('END OF HEADER') >= 0:
+                break
+        if len(header_lines) == 0:
+            raise Exception('Error when parsing RINEX 3 file.  The file appears to be empty.')
+        # byte ranges can only be split on uncompressed files
+        is_windowed = start is not None or end is not None or interval is not None
+        parallel = processes is not None and processes > 1 and not is_windowed and detect_compression(filepath) is None
+        if parallel:
+            obs_lines = None
+        elif not is_windowed:
+            obs_lines = f.readlines()
+        else:
+            obs_lines = _RINEX3_obs_lines_in_window(f, start, end, interval)
     header = parse_RINEX3_header(header_lines)
     if 'system_obs_types' not in header.keys():
         raise Exception('RINEX header must contain `SYS / # / OBS TYPES` and `header` dict from `parse_RINEX3_header` must contain corresponding dictionary `system_obs_types`')
-    obs_data, time = parse_RINEX3_obs_data(obs_lines, header['system_obs_types'])
-    if 'frequency_numbers' in header.keys():
-        obs_data = transform_values_from_RINEX3_obs(obs_data, header['frequency_numbers'])
+    selected_obs_types = select_RINEX3_obs_types(header['system_obs_types'], systems, obs_types, bands, observables)
+    if parallel:
+        columns, time = _decode_RINEX3_obs_file_parallel(filepath, header['system_obs_types'], selected_obs_types, processes)
     else:
-        obs_data = transform_values_from_RINEX3_obs(obs_data)
-    gps_epoch = datetime64(datetime(1980, 1, 6))
-    time = (array(time) - gps_epoch).astype(float) / 1e6  # dt64 is in microseconds
-    observations = {'time': time, 'satellites': obs_data}
-    return header, observations
+        columns, time = _decode_RINEX3_obs_lines(obs_lines, header['system_obs_types'], selected_obs_types=selected_obs_types)
+    return header, columns, time, selected_obs_types
+
+def _RINEX3_obs_output(columns, time, selected_obs_types, output='tree', frequency_numbers=None, all_zero_to_nan=True):
+    '''Builds the `observations` of `parse_RINEX3_obs_file` in the given `output` layout.'''
+    if output == 'lazy':
+        plan = compile_RINEX3_obs_plan(selected_obs_types, frequency_numbers)
+        obs_data = LazySatelliteTree(columns, plan, selected_obs_types, all_zero_to_nan)
+        return {'time': _datetime64_to_gps_seconds(time), 'satellites': obs_data}
+    if output != 'tree':
+        columns = _obs_columns_to_tables(columns, selected_obs_types)
+        if output == 'cube':
+            columns = RINEX3_obs_columns_to_cube(columns, len(time))
+        return {'time': _datetime64_to_gps_seconds(time), 'systems': columns}
+    plan = compile_RINEX3_obs_plan(selected_obs_types, frequency_numbers)
+    obs_data = _obs_columns_to_transformed_tree(columns, plan, selected_obs_types, all_zero_to_nan)
+    return {'time': _datetime64_to_gps_seconds(time), 'satellites': obs_data}
 
+def _decode_RINEX3_obs_file_arrays(filepath, selection):
+    '''
+    Worker of `parse_RINEX3_obs_files`: decodes one file and
+    returns `(header, systems, time, selected_obs_types)` where
+    `systems` maps each system letter to its `(sat_ids, index,
+    values)` arrays.
+    '''
+    header, columns, time, selected_obs_types = _read_RINEX3_obs_file(filepath, **selection)
+    systems = {system_letter: (system_columns.sat_ids.array, system_columns.index.array, system_columns.values.array)
+               for system_letter, system_columns in columns.items()}
+    return header, systems, time, selected_obs_types
+
+def _merge_RINEX3_obs_arrays(results):
+    '''
+    Merges the decoded files of `parse_RINEX3_obs_files` onto one
+    sorted time axis.  Of epochs present in several files, the
+    one from the earliest file in `results` is kept.  Systems
+    whose observation types differ between files get the union of
+    them, with NaN where a file has no such column.  Returns
+    `(columns, time, merged_obs_types)`.
+    '''
+    merged_obs_types = {}
+    for _, _, _, selected_obs_types in results:
+        for system_letter, obs_types in selected_obs_types.items():
+            system_obs_types = merged_obs_types.setdefault(system_letter, [])
+            system_obs_types.extend(obs_type for obs_type in obs_types if obs_type not in system_obs_types)
+    times = [time for _, _, time, _ in results]
+    all_time = concatenate(times) if len(times) > 0 else array([], dtype='datetime64[us]')
+    time, first = numpy.unique(all_time, return_index=True)
+    is_kept = zeros(len(all_time), dtype=bool)
+    is_kept[first] = True
+    merged_index = numpy.searchsorted(time, all_time)
+    offsets = concatenate(([0], numpy.cumsum([len(t) for t in times]))).astype(int64)
+    columns = {}
+    for system_letter, obs_types in merged_obs_types.items():
+        parts = []
+        for (_, systems, _, selected_obs_types), offset in zip(results, offsets):
+            if system_letter not in systems:
+                continue
+            sat_ids, index, values = systems[system_letter]
+            rows = numpy.flatnonzero(is_kept[offset + index])
+            positions = [obs_types.index(obs_type) for obs_type in selected_obs_types[system_letter]]
+            parts.append((sat_ids[rows], merged_index[offset + index[rows]], values[rows], positions))
+        num_rows = sum(len(part[1]) for part in parts)
+        system_columns = _ObsColumns(len(obs_types), max(num_rows, 1))
+        for sat_ids, index, values, positions in parts:
+            block = system_columns.extend(len(index))
+            block[0][:] = sat_ids
+            block[1][:] = index
+            if positions == list(range(len(obs_types))):
+                block[2][:] = values
+            else:
+                block[2][:] = nan
+                block[2][:, positions] = values
+        # files may arrive out of order; keep the rows of each system in epoch order
+        order = numpy.argsort(system_columns.index.array, kind='stable')
+        for growable in (system_columns.sat_ids, system_columns.index, system_columns.values):
+            growable.buffer[:num_rows] = growable.array[order]
+        columns[system_letter] = system_columns
+    return columns, time, merged_obs_types
+
+def parse_RINEX3_obs_files(filepaths, output='tree', systems=None, obs_types=None, bands=None, observables=None,
+                           start=None, end=None, interval=None, processes=None, all_zero_to_nan=True):
+    '''
+    ------------------------------------------------------------
+    Given the filepaths to several RINEX 3 observation files
+    (e.g. consecutive hourly files of one station), parses them
+    in a process pool and merges them into one set of
+    observations on a sorted time axis.  Epochs that appear in
+    more than one file are kept once, taken from the first file
+    in `filepaths` that has them.  The files are merged as
+    arrays, so no per-epoch Python objects are built.
+    
+    Input
+    -----
+    `filepaths` -- filepaths to RINEX observation files, which
+        may be compressed
+    `output`, `systems`, `obs_types`, `bands`, `observables`,
+        `start`, `end`, `interval` -- applied to each file, see
+        `parse_RINEX3_obs_file`
+    `processes` (default None) -- number of worker processes;
+        None uses `os.cpu_count()`, 1 parses the files serially
+    `all_zero_to_nan` (default True) -- if an array of merged
+        observations is all zeros, converts the values to NaN
+    
+    Output
+    ------
+    `headers, observations` where `headers` is the list of
+    parsed headers in the order of `filepaths` and
+    `observations` is in the format returned by
+    `parse_RINEX3_obs_file`
+    
+    Note: GLONASS frequency numbers are taken from all headers;
+    `time` in `observations` is in GPST seconds
+    '''
+    if output not in RINEX3_OBS_OUTPUTS:
+        raise Exception('`output` must be one of {0}'.format(', '.join(map(repr, RINEX3_OBS_OUTPUTS))))
+    filepaths = list(filepaths)
+    if processes is None:
+        processes = os.cpu_count()
+    selection = dict(systems=systems, obs_types=obs_types, bands=bands, observables=observables, start=start, end=end,
+                     interval=interval)
+    if processes > 1 and len(filepaths) > 1:
+        with ProcessPoolExecutor(min(processes, len(filepaths))) as executor:
+            results = list(executor.map(_decode_RINEX3_obs_file_arrays, filepaths, repeat(selection)))
+    else:
+        results = [_decode_RINEX3_obs_file_arrays(filepath, selection) for filepath in filepaths]
+    columns, time, merged_obs_types = _merge_RINEX3_obs_arrays(results)
+    headers = [header for header, _, _, _ in results]
+    frequency_numbers = {}
+    for header in headers:
+        frequency_numbers.update(header.get('frequency_numbers', {}))
+    observations = _RINEX3_obs_output(columns, time, merged_obs_types, output, frequency_numbers or None,
+                                      all_zero_to_nan)
+    return headers, observations
+
+
+def stream_RINEX3_obs_file(filepath, epochs_per_chunk=None):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a RINEX observation file, parses the
+    header and returns a generator over the observation epochs.
+    The file is read incrementally, so memory use is bounded by
+    the chunk size rather than the file size.
+    
+    Input
+    -----
+    `filepath` -- filepath to RINEX observation file
+    `epochs_per_chunk` (default None) -- if None, the generator
+        yields one epoch at a time; otherwise it yields chunks of
+        this many epochs.  See `iter_RINEX3_obs_data`.
+
+    Output
+    ------
+    `header, epochs` where `header` is a dictionary containing
+    the parsed header information and `epochs` is the generator
+    returned by `iter_RINEX3_obs_data`
+    
+    Note: the file stays open until `epochs` is exhausted
+    '''
+    f = open_compressed(filepath)
+    header_lines = []
+    for line in f:
+        header_lines.append(line)
+        if line.find('END OF HEADER') >= 0:
+            break
+    if len(header_lines) == 0:
+        f.close()
+        raise Exception('Error when parsing RINEX 3 file.  The file appears to be empty.')
+    header = parse_RINEX3_header(header_lines)
+    if len(header['system_obs_types']) == 0:
+        f.close()
+        raise Exception('RINEX header must contain `SYS / # / OBS TYPES` and `header` dict from `parse_RINEX3_header` must contain corresponding dictionary `system_obs_types`')
+    def epochs():
+        with f:
+            yield from iter_RINEX3_obs_data(f, header['system_obs_types'], epochs_per_chunk)
+    return header, epochs()
+
+
+
+def _find_RINEX_header_end(buf):
+    '''Returns the byte offset just past the `END OF HEADER` line in `buf`.'''
+    i = buf.find(b'END OF HEADER')
+    if i < 0:
+        raise Exception('RINEX header must end with `END OF HEADER`')
+    i = buf.find(b'\n', i)
+    return len(buf) if i < 0 else i + 1
+
+def _scan_RINEX3_epoch_offsets(buf, start, scan_size=1 << 26):
+    '''
+    Returns the byte offsets of all lines of `buf` after `start`
+    that begin with `>`.  The buffer is scanned `scan_size` bytes
+    at a time.
+    '''
+    offsets = [array([start])] if buf[start:start + 1] == b'>' else []
+    for i0 in range(start, len(buf), scan_size):
+        # one byte of overlap so that each newline sees its successor
+        chunk = numpy.frombuffer(buf, uint8, count=min(scan_size + 1, len(buf) - i0), offset=i0)
+        newlines = numpy.flatnonzero(chunk[:-1] == 10)
+        offsets.append(i0 + 1 + newlines[chunk[newlines + 1] == 62])
+        del chunk
+    return concatenate(offsets).astype(int64) if offsets else zeros(0, dtype=int64)
+
+def _epoch_index_filepath(filepath):
+    return os.fspath(filepath) + '.idx.npz'
+
+def index_RINEX3_obs_file(filepath, use_saved=True, save=False):
+    '''
+    ------------------------------------------------------------
+    Builds an index of the epoch records of a RINEX 3 observation
+    file by memory-mapping it and scanning the bytes for lines
+    that begin with `>`.  Only the epoch records themselves are
+    decoded.
+    
+    Input
+    -----
+    `filepath` -- filepath to RINEX observation file
+    `use_saved` (default True) -- load the index saved next to
+        the file if it is up to date with the file
+    `save` (default False) -- save a newly built index next to
+        the file (`<filepath>.idx.npz`); if that fails, e.g. in a
+        read-only archive, the index is only returned
+    
+    Output
+    ------
+    dictionary of format:
+        {
+            'time': ndarray,
+            'offset': ndarray,
+            'flag': ndarray,
+            'num_sats': ndarray,
+            'header_end': int,
+            'file_size': int,
+            'file_mtime': float
+        }
+    where `offset` is the byte offset of each epoch record and
+    `header_end` the byte offset of the first data line
+    
+    Note: `time` is in GPST seconds
+    '''
+    stat = os.stat(filepath)
+    index_filepath = _epoch_index_filepath(filepath)
+    if use_saved and os.path.exists(index_filepath):
+        with numpy.load(index_filepath) as saved:
+            index = {key: saved[key] for key in saved.files}
+        for key in ('header_end', 'file_size', 'file_mtime'):
+            index[key] = index[key].item()
+        if index['file_size'] == stat.st_size and index['file_mtime'] == stat.st_mtime:
+            return index
+    if detect_compression(filepath) is not None:
+        raise Exception('Epoch index requires an uncompressed RINEX 3 file')
+    with open(filepath, 'rb') as f:
+        if stat.st_size == 0:
+            raise Exception('Error when parsing RINEX 3 file.  The file appears to be empty.')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header_end = _find_RINEX_header_end(buf)
+            offsets = _scan_RINEX3_epoch_offsets(buf, header_end)
+            data = numpy.frombuffer(buf, uint8)
+            positions = numpy.minimum(offsets[:, None] + numpy.arange(35), len(data) - 1)
+            chars = data[positions]
+            del data
+    # blank out whatever follows a short epoch record
+    chars[numpy.logical_or.accumulate(chars == 10, axis=1)] = 0
+    time, flag, num_sats = _parse_RINEX3_epoch_records(chars)
+    index = {
+        'time': _datetime64_to_gps_seconds(time), 'offset': offsets, 'flag': flag, 'num_sats': num_sats,
+        'header_end': header_end, 'file_size': stat.st_size, 'file_mtime': stat.st_mtime,
+    }
+    if save:
+        try:
+            numpy.savez(index_filepath, **index)
+        except OSError:
+            pass
+    return index
+
+def read_RINEX3_obs_time_range(filepath, start=None, end=None, index=None):
+    '''
+    ------------------------------------------------------------
+    Given the filepath to a RINEX observation file, decodes only
+    the epochs with `start <= time < end` using the epoch index
+    from `index_RINEX3_obs_file`.  The file is memory-mapped and
+    only the byte range of the selected epochs is read.
+    
+    Input
+    -----
+    `filepath` -- filepath to RINEX observation file
+    `start`, `end` (default None) -- GPST seconds bounding the
+        requested epochs; None leaves that side open
+    `index` (default None) -- epoch index of the file; if None,
+        calls `index_RINEX3_obs_file(filepath)`
+    
+    Output
+    ------
+    `header, observations` in the format returned by
+    `parse_RINEX3_obs_file`
+    
+    Note: epochs are assumed to be in chronological order
+    '''
+    if index is None:
+        index = index_RINEX3_obs_file(filepath)
+    is_obs_epoch = (index['flag'] < 2) | (index['flag'] > 5)
+    selected = is_obs_epoch.copy()
+    if start is not None:
+        selected &= index['time'] >= start
+    if end is not None:
+        selected &= index['time'] < end
+    selected = numpy.flatnonzero(selected)
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header = parse_RINEX3_header(buf[:index['header_end']].decode().splitlines())
+            lines = []
+            if len(selected) > 0:
+                i0, i1 = selected[0], selected[-1] + 1
+                o1 = index['offset'][i1] if i1 < len(index['offset']) else len(buf)
+                lines = buf[index['offset'][i0]:o1].splitlines()
+    columns, time = _decode_RINEX3_obs_lines(lines, header['system_obs_types'])
+    return header, _RINEX3_obs_output(columns, time, header['system_obs_types'], 'tree', header.get('frequency_numbers'))
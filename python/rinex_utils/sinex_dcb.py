@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta, timezone
 from .dcb import create_mgex_dcb_dict
+from .compression import open_compressed
 
 
 def parse_sinex_date_str(dt_str):
@@ -60,7 +61,7 @@ def parse_sinex_section(lines):
 def parse_sinex(filepath):
     sections = []
     section = None
-    with open(filepath, 'r') as f:
+    with open_compressed(filepath) as f:
         for line in f.readlines():
             if line.startswith('+'):
                 section = {}
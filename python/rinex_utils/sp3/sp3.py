@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 from time_utils.gpst import GPS_EPOCH
 import numpy
 from numpy import nan, zeros, argsort, alltrue, concatenate, diff
+from ..compression import open_compressed
 
 def parse_sp3_header(header_lines):
 
@@ -85,7 +86,7 @@ def parse_sp3_records(record_lines, parse_position=True, parse_velocity=False):
 
 def parse_sp3_file(filepath):
     lines = []
-    with open(filepath, 'r') as f:
+    with open_compressed(filepath) as f:
         lines = f.readlines()
     if not lines:
         raise Exception('File was empty')
@@ -0,0 +1,284 @@
+import bz2
+import gzip
+import numpy
+from numpy import nan, isnan, zeros, concatenate, uint8, int64
+from datetime import datetime, timezone
+from .rinex3 import CONSTELLATION_LETTERS, compile_RINEX3_obs_plan
+
+# system order of the satellites within an epoch
+WRITER_SYSTEM_ORDER = tuple(CONSTELLATION_LETTERS.keys())
+# limits (exclusive) of the value in thousandths, rounded, that fits an F14.3 field
+F14_3_MAX_MILLI = 10 ** 13
+F14_3_MAX_NEGATIVE_MILLI = 10 ** 12
+
+# ASCII digits of each number 0-9999, as one 4-byte word
+_DIGIT_QUADS = (numpy.arange(10000)[:, None] // 10 ** numpy.arange(3, -1, -1) % 10 + 48).astype(uint8).view('<u4').ravel()
+_POWERS_OF_TEN = 10 ** numpy.arange(1, 10, dtype=int64)
+
+def _field_masks(positions):
+    '''Returns the 16-byte masks (as two uint64 words) that select `positions(n)` of a field, for n = 0-10.'''
+    masks = zeros((11, 16), dtype=uint8)
+    for n in range(11):
+        masks[n, positions(n)] = 0xFF
+    return masks.view('<u8')
+
+# by number of integer digits: leading blanks plus the LLI/SSI flags, and the sign position
+_BLANK_MASKS = _field_masks(lambda n: list(range(10 - n)) + [14, 15])
+_SIGN_MASKS = _field_masks(lambda n: [9 - n] if n < 10 else [])
+_SPACES = numpy.frombuffer(b' ' * 8, dtype='<u8')[0]
+_MINUSES = numpy.frombuffer(b'-' * 8, dtype='<u8')[0]
+
+def _format_RINEX3_obs_fields(values):
+    '''
+    ------------------------------------------------------------
+    Inverse of `_parse_RINEX3_obs_fields`: formats the float array
+    `values` as 16-character observation fields, each a
+    right-aligned F14.3 value followed by blank LLI and SSI flags.
+    NaN and values that do not fit F14.3 give blank fields.
+
+    Output
+    ------
+    uint8 array with the shape of `values` plus a trailing axis
+    of 16 characters
+
+    Note: the value in thousandths is split into groups of four
+    digits whose characters are looked up as 4-byte words, and
+    blanks and signs are merged into each field as two 64-bit
+    words, so there is no per-character work.
+    '''
+    shape = values.shape
+    values = values.ravel()
+    # the range is checked after rounding, as rounding can carry into a new digit
+    milli = numpy.rint(numpy.abs(values) * 1000)
+    is_blank = ~(milli < numpy.where(values < 0, F14_3_MAX_NEGATIVE_MILLI, F14_3_MAX_MILLI))
+    milli = numpy.where(is_blank, 0., milli).astype(int64)
+    # the 16 digits of `milli`, most significant first; only the last 13 can be non-zero
+    high, low = numpy.divmod(milli, 10 ** 8)
+    quads = numpy.empty((len(values), 4), dtype='<u4')
+    for k, group in enumerate(numpy.divmod(high, 10000) + numpy.divmod(low, 10000)):
+        quads[:, k] = _DIGIT_QUADS[group]
+    digits = quads.view(uint8)
+    fields = numpy.empty((len(values), 16), dtype=uint8)
+    fields[:, :10] = digits[:, 3:13]
+    fields[:, 10] = ord('.')
+    fields[:, 11:14] = digits[:, 13:]
+    words = fields.view('<u8')
+    num_int_digits = 1 + numpy.searchsorted(_POWERS_OF_TEN, milli // 1000, side='right')
+    words ^= (words ^ _SPACES) & _BLANK_MASKS[num_int_digits]
+    is_negative = ((values < 0) & (milli > 0)).astype('<u8')
+    words ^= (words ^ _MINUSES) & _SIGN_MASKS[num_int_digits] & (numpy.uint64(0) - is_negative)[:, None]
+    words[is_blank] = _SPACES
+    return fields.reshape(shape + (16,))
+
+def _gps_seconds_to_datetime64(time):
+    return numpy.datetime64(datetime(1980, 1, 6), 'us') + numpy.rint(numpy.asarray(time) * 1e6).astype('timedelta64[us]')
+
+def _format_epoch_records(time, num_sats):
+    '''Returns the `>` epoch record lines (epoch flag 0) as an `S35` array.'''
+    time = _gps_seconds_to_datetime64(time)
+    days = time.astype('datetime64[D]')
+    microseconds = (time - days).astype(int64)
+    records = []
+    for day, us, n in zip(days.tolist(), microseconds.tolist(), num_sats.tolist()):
+        seconds, us = divmod(us, 1000000)
+        records.append('> {0:4d} {1:02d} {2:02d} {3:02d} {4:02d}{5:3d}.{6:06d}0  0{7:3d}'.format(
+            day.year, day.month, day.day, seconds // 3600, seconds // 60 % 60, seconds % 60, us, n))
+    return numpy.array(records, dtype='S35')
+
+def _header_line(content, label):
+    return '{0:<60}{1:<20}\n'.format(content[:60], label)
+
+def _format_header_time(gps_seconds):
+    t = _gps_seconds_to_datetime64(gps_seconds).item()
+    return '{0:6d}{1:6d}{2:6d}{3:6d}{4:6d}{5:13.7f}     GPS'.format(
+        t.year, t.month, t.day, t.hour, t.minute, t.second + t.microsecond / 1e6)
+
+def _format_RINEX3_obs_header(header, system_obs_types, time):
+    '''
+    Builds the header lines of `write_RINEX3_obs_file` from the
+    fields of `parse_RINEX3_header` that are present, with the
+    observation types and time of first/last obs of the data.
+    '''
+    lines = [_header_line('{0:>9}{1:11}{2:<20}{3:<20}'.format(
+        header.get('format_version', '3.03'), '', 'OBSERVATION DATA',
+        header.get('sat_systems') or ('M' if len(system_obs_types) != 1 else next(iter(system_obs_types)))),
+        'RINEX VERSION / TYPE')]
+    lines.append(_header_line('{0:<20}{1:<20}{2:<20}'.format(
+        header.get('file_creation_program', 'rinex_utils')[:20], header.get('file_creation_agency', '')[:20],
+        datetime.now(timezone.utc).strftime('%Y%m%d %H%M%S UTC')), 'PGM / RUN BY / DATE'))
+    for comment in header.get('comments', []):
+        lines.append(_header_line(comment, 'COMMENT'))
+    lines.append(_header_line(header.get('marker_name', ''), 'MARKER NAME'))
+    if 'marker_number' in header:
+        lines.append(_header_line(header['marker_number'], 'MARKER NUMBER'))
+    lines.append(_header_line('{0:<20}{1:<40}'.format(header.get('observer', '')[:20], header.get('agency', '')[:40]),
+                              'OBSERVER / AGENCY'))
+    lines.append(_header_line('{0:<20}{1:<20}{2:<20}'.format(
+        header.get('receiver_number', '')[:20], header.get('receiver_type', '')[:20],
+        header.get('receiver_version', '')[:20]), 'REC # / TYPE / VERS'))
+    lines.append(_header_line('{0:<20}{1:<20}'.format(
+        header.get('antenna_number', '')[:20], header.get('antenna_type', '')[:20]), 'ANT # / TYPE'))
+    xyz = header.get('approx_position_xyz', (0., 0., 0.))
+    lines.append(_header_line(''.join('{0:14.4f}'.format(0. if isnan(v) else v) for v in xyz), 'APPROX POSITION XYZ'))
+    delta_hen = header.get('antenna_delta_hen', (0., 0., 0.))
+    lines.append(_header_line(''.join('{0:14.4f}'.format(0. if isnan(v) else v) for v in delta_hen),
+                              'ANTENNA: DELTA H/E/N'))
+    for system_letter, obs_types in system_obs_types.items():
+        for i in range(0, max(len(obs_types), 1), 13):
+            prefix = '{0:<3}{1:3d}'.format(system_letter, len(obs_types)) if i == 0 else ' ' * 6
+            lines.append(_header_line(prefix + ''.join(' {0:3}'.format(o) for o in obs_types[i:i + 13]),
+                                      'SYS / # / OBS TYPES'))
+    if 'signal_strength_unit' in header:
+        lines.append(_header_line(header['signal_strength_unit'], 'SIGNAL STRENGTH UNIT'))
+    if 'interval' in header and not isnan(header['interval']):
+        lines.append(_header_line('{0:10.3f}'.format(header['interval']), 'INTERVAL'))
+    if len(time) > 0:
+        lines.append(_header_line(_format_header_time(time[0]), 'TIME OF FIRST OBS'))
+        lines.append(_header_line(_format_header_time(time[-1]), 'TIME OF LAST OBS'))
+    frequency_numbers = sorted((sat_id, k) for sat_id, k in header.get('frequency_numbers', {}).items()
+                               if len(sat_id) == 3 and k == k)
+    for i in range(0, max(len(frequency_numbers), 1), 8):
+        if len(frequency_numbers) == 0:
+            break
+        prefix = '{0:3d} '.format(len(frequency_numbers)) if i == 0 else ' ' * 4
+        lines.append(_header_line(prefix + ''.join('{0:3} {1:2d} '.format(sat_id, k) for sat_id, k in frequency_numbers[i:i + 8]),
+                                  'GLONASS SLOT / FRQ #'))
+    lines.append(_header_line('', 'END OF HEADER'))
+    return lines
+
+def _tree_to_RINEX3_obs_tables(satellites, system_obs_types, frequency_numbers=None):
+    '''
+    Converts the per-satellite tree of `parse_RINEX3_obs_file`
+    back into tables of format:
+        {<system_letter>: {'sat_ids': ndarray, 'index': ndarray, 'obs_types': [...], 'values': ndarray}}
+    Each obs code of `system_obs_types` is looked up through the
+    decoding plan; codes without data for any satellite are
+    dropped.
+    '''
+    plan = compile_RINEX3_obs_plan(system_obs_types, frequency_numbers)
+    parts = {}
+    for sat_id in satellites.keys():
+        sat_data = satellites[sat_id]
+        system_letter = sat_id[0]
+        columns = []
+        for obs_id, column in plan['columns'].get(system_letter, {}).items():
+            values = None
+            if column is not None:
+                band, obs_channel, _, obs_name, _ = column
+                values = sat_data.get(band, {}).get(obs_channel, {}).get(obs_name)
+            columns.append(values)
+        parts.setdefault(system_letter, []).append((sat_id, sat_data['index'], columns))
+    tables = {}
+    for system_letter, sat_parts in parts.items():
+        obs_types = list(plan['columns'].get(system_letter, {}).keys())
+        has_data = [any(columns[j] is not None for _, _, columns in sat_parts) for j in range(len(obs_types))]
+        index = concatenate([numpy.asarray(sat_index, dtype=int64) for _, sat_index, _ in sat_parts])
+        values = numpy.full((len(index), sum(has_data)), nan)
+        sat_ids = numpy.empty(len(index), dtype='S3')
+        i0 = 0
+        for sat_id, sat_index, columns in sat_parts:
+            i1 = i0 + len(sat_index)
+            sat_ids[i0:i1] = sat_id
+            k = 0
+            for j, column in enumerate(columns):
+                if not has_data[j]:
+                    continue
+                if column is not None:
+                    values[i0:i1, k] = column
+                k += 1
+            i0 = i1
+        tables[system_letter] = {
+            'sat_ids': sat_ids, 'index': index,
+            'obs_types': [obs_id for obs_id, keep in zip(obs_types, has_data) if keep], 'values': values,
+        }
+    return tables
+
+def _cube_to_RINEX3_obs_tables(cube):
+    '''Converts the dense arrays of `RINEX3_obs_columns_to_cube` back into tables.'''
+    tables = {}
+    for system_letter, system_cube in cube.items():
+        index, sat_columns = numpy.nonzero(system_cube['mask'])
+        tables[system_letter] = {
+            'sat_ids': numpy.array(system_cube['sat_ids'], dtype='S3')[sat_columns], 'index': index,
+            'obs_types': list(system_cube['obs_types']), 'values': system_cube['values'][index, sat_columns],
+        }
+    return tables
+
+def _open_for_writing(filepath):
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, 'wb')
+    if filepath.endswith('.bz2'):
+        return bz2.open(filepath, 'wb')
+    return open(filepath, 'wb')
+
+def write_RINEX3_obs_file(filepath, header, observations, epochs_per_chunk=10000):
+    '''
+    ------------------------------------------------------------
+    Writes observations in any layout returned by
+    `parse_RINEX3_obs_file` ('tree', 'lazy', 'columns' or 'cube')
+    to a RINEX 3 observation file.  The satellite lines of
+    `epochs_per_chunk` epochs at a time are laid out in one byte
+    array, with all values formatted column-wise by NumPy, and
+    written with a single call.
+
+    Input
+    -----
+    `filepath` -- output filepath; a `.gz` or `.bz2` extension
+        compresses the output
+    `header` -- header dictionary as returned by
+        `parse_RINEX3_header`
+    `observations` -- observations as returned by
+        `parse_RINEX3_obs_file`
+    `epochs_per_chunk` (default 10000) -- number of epochs
+        formatted and written at once
+
+    Note: the header is rebuilt from the parsed header fields,
+    with `SYS / # / OBS TYPES` and `TIME OF FIRST/LAST OBS` taken
+    from the data.  LLI and signal strength flags are not kept by
+    the parser and are written blank, as are values that do not
+    fit F14.3.  All epochs are written with flag 0.
+    '''
+    time = numpy.asarray(observations['time'], dtype=float)
+    if 'systems' in observations:
+        systems = observations['systems']
+        is_cube = any('mask' in table for table in systems.values())
+        tables = _cube_to_RINEX3_obs_tables(systems) if is_cube else systems
+    else:
+        tables = _tree_to_RINEX3_obs_tables(observations['satellites'], header['system_obs_types'],
+                                            header.get('frequency_numbers'))
+    tables = {system_letter: tables[system_letter] for system_letter in WRITER_SYSTEM_ORDER
+              if system_letter in tables and len(tables[system_letter]['index']) > 0}
+    system_obs_types = {system_letter: list(table['obs_types']) for system_letter, table in tables.items()}
+    # one row per satellite line, in epoch / system / satellite order
+    sat_ids = concatenate([numpy.asarray(table['sat_ids'], dtype='S3') for table in tables.values()] + [zeros(0, 'S3')])
+    index = concatenate([numpy.asarray(table['index'], dtype=int64) for table in tables.values()] + [zeros(0, int64)])
+    system_rank = concatenate([numpy.full(len(table['index']), k) for k, table in enumerate(tables.values())] + [zeros(0, int)])
+    row_in_table = concatenate([numpy.arange(len(table['index'])) for table in tables.values()] + [zeros(0, int)])
+    order = numpy.lexsort((sat_ids, system_rank, index))
+    sat_ids, index, system_rank, row_in_table = sat_ids[order], index[order], system_rank[order], row_in_table[order]
+    num_sats = numpy.bincount(index, minlength=len(time))
+    width = max([35] + [3 + 16 * len(obs_types) for obs_types in system_obs_types.values()]) + 1
+    with _open_for_writing(filepath) as f:
+        f.write(''.join(_format_RINEX3_obs_header(header, system_obs_types, time)).encode())
+        for e0 in range(0, len(time), epochs_per_chunk):
+            e1 = min(e0 + epochs_per_chunk, len(time))
+            r0, r1 = numpy.searchsorted(index, [e0, e1])
+            chunk_index = index[r0:r1] - e0
+            num_lines = (e1 - e0) + (r1 - r0)
+            chars = numpy.full((num_lines, width), ord(' '), dtype=uint8)
+            # each epoch record is followed by the lines of its satellites
+            epoch_lines = numpy.searchsorted(chunk_index, numpy.arange(e1 - e0)) + numpy.arange(e1 - e0)
+            sat_lines = numpy.arange(r1 - r0) + chunk_index + 1
+            chars[epoch_lines, :35] = _format_epoch_records(time[e0:e1], num_sats[e0:e1]).view(uint8).reshape(-1, 35)
+            chars[sat_lines, :3] = sat_ids[r0:r1, None].view(uint8)
+            for k, (system_letter, table) in enumerate(tables.items()):
+                rows = numpy.flatnonzero(system_rank[r0:r1] == k)
+                if len(rows) == 0:
+                    continue
+                values = numpy.asarray(table['values'], dtype=float)[row_in_table[r0 + rows]]
+                chars[sat_lines[rows], 3:3 + 16 * values.shape[1]] = _format_RINEX3_obs_fields(values).reshape(len(rows), -1)
+            # drop trailing blanks and end each line with a newline
+            non_blank = chars != ord(' ')
+            line_length = width - numpy.argmax(non_blank[:, ::-1], axis=1)
+            chars[numpy.arange(num_lines), line_length] = ord('\n')
+            f.write(chars[numpy.arange(width) <= line_length[:, None]].tobytes())